@@ -0,0 +1,335 @@
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.utils import timezone
+from accounts.models import Attendant, AttendantProfile, User
+from appointments.availability import SLOT_CAPACITY, SLOT_TIMES, ACTIVE_STATUSES, invalidate_index
+from appointments.models import Appointment, AppointmentSlot, Feedback, Notification, SMSHistory
+from appointments.notifications import invalidate_unread_counts
+from packages.models import Package, PackageBooking
+from products.models import Product
+from services.models import Service, ServiceCategory
+import random
+import time as clock
+
+FIRST_NAMES = [
+    'Maria', 'Ana', 'Sofia', 'Isabel', 'Camille', 'Andrea', 'Patricia', 'Kristine', 'Angela', 'Bea',
+    'Juan', 'Jose', 'Mark', 'Paolo', 'Miguel', 'Carlo', 'Rafael', 'Gabriel', 'Luis', 'Enzo',
+]
+LAST_NAMES = [
+    'Santos', 'Reyes', 'Cruz', 'Bautista', 'Garcia', 'Mendoza', 'Torres', 'Flores', 'Ramos', 'Villanueva',
+    'Castillo', 'Aquino', 'Navarro', 'Dela Cruz', 'Gonzales', 'Lopez', 'Rivera', 'Morales', 'Salazar', 'Perez',
+]
+WEEK_DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Share of past appointments in each status, and of future ones
+PAST_STATUSES = (['completed'] * 75) + (['cancelled'] * 15) + (['confirmed'] * 10)
+FUTURE_STATUSES = (['confirmed'] * 70) + (['pending'] * 20) + (['cancelled'] * 10)
+
+PASSWORD = 'LoadTest123!'
+
+
+@contextmanager
+def historical_timestamps(*model_classes):
+    """Let bulk_create keep the generated created_at/updated_at values"""
+    fields = [
+        field for model in model_classes for field in model._meta.fields
+        if isinstance(field, models.DateTimeField) and (field.auto_now or field.auto_now_add)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Generate a large, reproducible clinic dataset for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=10000, help='Patients to create')
+        parser.add_argument('--attendants', type=int, default=20, help='Attendants (with user accounts and profiles) to create')
+        parser.add_argument('--years', type=float, default=3, help='Years of appointment history')
+        parser.add_argument('--visits', type=float, default=8, help='Average appointments per patient')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed gives the same data')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Patients generated and written per transaction')
+        parser.add_argument('--prefix', type=str, default='load', help='Username prefix marking generated rows')
+        parser.add_argument('--clear', action='store_true', help='Delete rows generated earlier with this prefix first')
+
+    def handle(self, *args, **options):
+        if options['patients'] < 0 or options['attendants'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--patients must be positive, and --attendants and --chunk-size at least 1')
+        self.random = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.chunk_size = options['chunk_size']
+        self.today = timezone.localdate()
+        self.start_day = self.today - timedelta(days=int(options['years'] * 365))
+        self.visits = options['visits']
+        self.counts = Counter()
+        self.slots = Counter()
+        started = clock.monotonic()
+
+        if options['clear']:
+            self.clear()
+        if User.objects.filter(username__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f"Data with prefix '{self.prefix}' already exists; use --clear or another --prefix")
+
+        self.password = make_password(PASSWORD)
+        self.load_catalogue()
+        self.create_attendants(options['attendants'])
+
+        for start in range(0, options['patients'], self.chunk_size):
+            with transaction.atomic(), historical_timestamps(
+                User, Appointment, Feedback, Notification, SMSHistory, PackageBooking
+            ):
+                self.create_patient_chunk(start, min(start + self.chunk_size, options['patients']))
+            self.stdout.write(
+                f"  {min(start + self.chunk_size, options['patients'])}/{options['patients']} patients, "
+                f"{sum(self.counts.values())} rows, {clock.monotonic() - started:.0f}s"
+            )
+
+        self.write_slots()
+        self.refresh_derived_data()
+
+        for table, rows in sorted(self.counts.items()):
+            self.stdout.write(f'  {table:<18}{rows:>10}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {sum(self.counts.values())} rows in {clock.monotonic() - started:.1f}s '
+            f"(password for generated users: {PASSWORD})"
+        ))
+
+    def clear(self):
+        """
+        Delete earlier generated rows
+
+        The large tables are deleted in bulk: Appointment.delete() runs per-row
+        signals that would take hours on a full dataset. The derived tables are
+        rebuilt once generation finishes.
+        """
+        from appointments.models import AttendantUnavailabilityRequest, ReminderDelivery, Request, SMSOutbox
+
+        self.stdout.write(f"Deleting data generated with prefix '{self.prefix}'...")
+        with transaction.atomic():
+            users = User.objects.filter(username__startswith=f'{self.prefix}-')
+            attendants = Attendant.objects.filter(first_name=self.prefix.title(), last_name__startswith='Attendant ')
+            appointments = Appointment.objects.filter(models.Q(patient__in=users) | models.Q(attendant__in=attendants))
+            messages = SMSHistory.objects.filter(sender__in=users)
+            for related in (ReminderDelivery, Request, AttendantUnavailabilityRequest):
+                related.objects.filter(appointment__in=appointments).delete()
+            ReminderDelivery.objects.filter(sms_history__in=messages).update(sms_history=None)
+            SMSOutbox.objects.filter(history__in=messages).update(history=None)
+            for queryset in (
+                Feedback.objects.filter(appointment__in=appointments),
+                Notification.objects.filter(patient__in=users),
+                messages,
+                PackageBooking.objects.filter(patient__in=users, appointments__isnull=True),
+                AppointmentSlot.objects.filter(attendant__in=attendants),
+                appointments,
+            ):
+                queryset._raw_delete(queryset.db)
+            attendants.delete()
+            users.delete()
+        invalidate_index()
+        invalidate_unread_counts()
+
+    def load_catalogue(self):
+        """
+        Use the clinic's catalogue, or create a synthetic one when it is empty
+
+        The synthetic prices do not draw from the seeded generator, so a rerun
+        with the same seed gives the same data whether or not the catalogue
+        already exists.
+        """
+        if not Service.objects.filter(archived=False).exists():
+            category = ServiceCategory.objects.create(name=f'{self.prefix.title()} Treatments')
+            Service.objects.bulk_create([
+                Service(
+                    service_name=f'{self.prefix.title()} Service {number:02d}', category=category,
+                    price=Decimal([499, 799, 999, 1499, 2499][number % 5]), duration=60,
+                )
+                for number in range(1, 41)
+            ])
+        if not Product.objects.filter(archived=False).exists():
+            Product.objects.bulk_create([
+                Product(
+                    product_name=f'{self.prefix.title()} Product {number:02d}',
+                    price=Decimal([299, 499, 899][number % 3]), stock=100000,
+                )
+                for number in range(1, 21)
+            ])
+        if not Package.objects.filter(archived=False).exists():
+            Package.objects.bulk_create([
+                Package(
+                    package_name=f'{self.prefix.title()} Package {number:02d}', price=Decimal(4999 + number * 1000),
+                    sessions=3 + number, duration_days=90, grace_period_days=14,
+                )
+                for number in range(1, 9)
+            ])
+        self.services = list(Service.objects.filter(archived=False).order_by('pk').values_list('pk', 'price'))
+        self.products = list(Product.objects.filter(archived=False).order_by('pk').values_list('pk', flat=True))
+        self.packages = list(
+            Package.objects.filter(archived=False).order_by('pk')
+            .values_list('pk', 'sessions', 'duration_days', 'grace_period_days')
+        )
+
+    def create_attendants(self, count):
+        """Attendants are matched to their user account by name, as on the booking pages"""
+        first_name = self.prefix.title()
+        attendants = Attendant.objects.bulk_create([
+            Attendant(first_name=first_name, last_name=f'Attendant {number:03d}', shift_date=self.today, shift_time=time(9, 0))
+            for number in range(1, count + 1)
+        ])
+        users = User.objects.bulk_create([
+            User(
+                username=f'{self.prefix}-attendant-{number:03d}', password=self.password, user_type='attendant',
+                first_name=first_name, last_name=f'Attendant {number:03d}', email=f'{self.prefix}.attendant{number:03d}@example.com',
+            )
+            for number in range(1, count + 1)
+        ])
+        AttendantProfile.objects.bulk_create([
+            AttendantProfile(
+                user=user, work_days=sorted(self.random.sample(WEEK_DAYS, 5), key=WEEK_DAYS.index),
+                start_time=time(9, 0), end_time=time(18, 0),
+            )
+            for user in users
+        ])
+        self.attendants = [attendant.pk for attendant in attendants]
+        self.counts['attendants'] += len(attendants)
+        self.counts['users'] += len(users)
+        self.counts['attendant_profiles'] += len(users)
+
+    def moment(self, day, hour=None):
+        """An aware local datetime on the given day"""
+        hour = self.random.randint(8, 20) if hour is None else hour
+        return timezone.make_aware(datetime.combine(day, time(hour, self.random.randint(0, 59))))
+
+    def random_day(self, start, end):
+        return start + timedelta(days=self.random.randint(0, max((end - start).days, 0)))
+
+    def create_patient_chunk(self, first, last):
+        rand = self.random
+        patients = []
+        for number in range(first, last):
+            joined = self.random_day(self.start_day, self.today)
+            first_name, last_name = rand.choice(FIRST_NAMES), rand.choice(LAST_NAMES)
+            created = self.moment(joined)
+            patients.append(User(
+                username=f'{self.prefix}-patient-{number:07d}', password=self.password, user_type='patient',
+                first_name=first_name, last_name=last_name, email=f'{self.prefix}.patient{number:07d}@example.com',
+                phone=f'09{rand.randint(0, 999999999):09d}', gender=rand.choice(['female', 'female', 'male', 'other']),
+                birthday=self.today - timedelta(days=rand.randint(18 * 365, 65 * 365)),
+                date_joined=created, created_at=created, updated_at=created,
+            ))
+        patients = User.objects.bulk_create(patients)
+        self.counts['users'] += len(patients)
+
+        appointments, bookings = [], []
+        for patient in patients:
+            joined = timezone.localtime(patient.created_at).date()
+            visits = max(0, round(rand.expovariate(1 / self.visits))) if self.visits else 0
+            for _ in range(visits):
+                appointments.append(self.make_appointment(patient, joined))
+            if self.packages and rand.random() < 0.1:
+                package_id, sessions, duration_days, grace_days = rand.choice(self.packages)
+                booked = self.moment(self.random_day(joined, self.today))
+                valid_until = timezone.localtime(booked).date() + timedelta(days=duration_days)
+                bookings.append(PackageBooking(
+                    patient=patient, package_id=package_id, sessions_remaining=rand.randint(0, sessions),
+                    valid_until=valid_until, grace_period_until=valid_until + timedelta(days=grace_days),
+                    created_at=booked, updated_at=booked,
+                ))
+        appointments = Appointment.objects.bulk_create(appointments, batch_size=1000)
+        PackageBooking.objects.bulk_create(bookings, batch_size=1000)
+        self.counts['appointments'] += len(appointments)
+        self.counts['package_bookings'] += len(bookings)
+
+        feedback, notifications, messages = [], [], []
+        for appointment in appointments:
+            booked_at = appointment.created_at
+            notifications.append(Notification(
+                type='confirmation' if appointment.status != 'cancelled' else 'cancellation',
+                appointment_id=appointment.pk, title='Appointment Update',
+                message=f'Your appointment on {appointment.appointment_date:%B %d, %Y} is {appointment.status}.',
+                is_read=appointment.appointment_date < self.today and rand.random() < 0.9,
+                patient_id=appointment.patient_id, created_at=booked_at, updated_at=booked_at,
+            ))
+            messages.append(SMSHistory(
+                sender_id=appointment.patient_id, phone_number=f'09{rand.randint(0, 999999999):09d}',
+                message=f'Skinovation: appointment on {appointment.appointment_date:%b %d} at {appointment.appointment_time:%I:%M %p}.',
+                status='sent' if rand.random() < 0.95 else 'failed', sent_at=booked_at,
+            ))
+            if appointment.status == 'completed' and rand.random() < 0.4:
+                feedback.append(Feedback(
+                    appointment=appointment, patient_id=appointment.patient_id,
+                    rating=rand.choices([1, 2, 3, 4, 5], weights=[3, 5, 12, 35, 45])[0],
+                    attendant_rating=rand.choices([3, 4, 5], weights=[15, 35, 50])[0],
+                    created_at=self.moment(min(appointment.appointment_date + timedelta(days=1), self.today)),
+                ))
+        Notification.objects.bulk_create(notifications, batch_size=1000)
+        SMSHistory.objects.bulk_create(messages, batch_size=1000)
+        Feedback.objects.bulk_create(feedback, batch_size=1000)
+        self.counts['notifications'] += len(notifications)
+        self.counts['sms_history'] += len(messages)
+        self.counts['feedback'] += len(feedback)
+
+    def make_appointment(self, patient, joined):
+        rand = self.random
+        day = self.random_day(joined, self.today + timedelta(days=30))
+        status = rand.choice(FUTURE_STATUSES if day >= self.today else PAST_STATUSES)
+        attendant_id = rand.choice(self.attendants)
+        slot = rand.choice(SLOT_TIMES)
+        if status in ACTIVE_STATUSES:
+            # Future bookings respect slot capacity, like bookings made on the site
+            for _ in range(5):
+                if self.slots[(attendant_id, day, slot)] < SLOT_CAPACITY:
+                    break
+                attendant_id, slot = rand.choice(self.attendants), rand.choice(SLOT_TIMES)
+            else:
+                status = 'cancelled'
+            if status in ACTIVE_STATUSES:
+                self.slots[(attendant_id, day, slot)] += 1
+
+        kind = rand.random()
+        service_id = product_id = None
+        if kind < 0.85 or not self.products:
+            service_id = rand.choice(self.services)[0]
+        else:
+            product_id = rand.choice(self.products)
+        booked_on = max(joined, day - timedelta(days=rand.randint(0, 21)))
+        created = self.moment(min(booked_on, self.today))
+        return Appointment(
+            patient=patient, attendant_id=attendant_id, service_id=service_id, product_id=product_id,
+            appointment_date=day, appointment_time=time.fromisoformat(slot), status=status,
+            created_at=created, updated_at=created,
+        )
+
+    def write_slots(self):
+        """Seat counters for the generated future bookings"""
+        rows = [
+            AppointmentSlot(attendant_id=attendant_id, appointment_date=day, appointment_time=time.fromisoformat(slot), booked=booked)
+            for (attendant_id, day, slot), booked in self.slots.items()
+        ]
+        AppointmentSlot.objects.bulk_create(
+            rows, batch_size=1000, update_conflicts=True,
+            unique_fields=['attendant', 'appointment_date', 'appointment_time'], update_fields=['booked'],
+        )
+        self.counts['appointment_slots'] += len(rows)
+
+    def refresh_derived_data(self):
+        """bulk_create skips signals, so rebuild what they would have kept current"""
+        from analytics.cache import invalidate_sections
+        from analytics.rollups import backfill_business_analytics
+
+        self.stdout.write('Rebuilding the business analytics rollup...')
+        self.counts['business_analytics'] += backfill_business_analytics()
+        invalidate_index()
+        invalidate_unread_counts()
+        invalidate_sections()
+        self.stdout.write('Run populate_analytics or run_analytics to rebuild patient and service analytics.')
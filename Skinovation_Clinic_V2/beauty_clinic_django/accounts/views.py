@@ -225,16 +225,12 @@ def register_view(request):
                 
                 # Notify owner of new patient registration
                 if user.user_type == 'patient':
-                    from appointments.models import Notification
-                    from accounts.models import User as UserModel
-                    owner_users = UserModel.objects.filter(user_type='owner', is_active=True)
-                    for owner in owner_users:
-                        Notification.objects.create(
-                            type='system',
-                            title='New Patient Registered',
-                            message=f'New patient {user.get_full_name()} ({user.email}) has registered.',
-                            patient=None  # Owner notification
-                        )
+                    from appointments.notifications import notify_owners
+                    notify_owners(
+                        type='system',
+                        title='New Patient Registered',
+                        message=f'New patient {user.get_full_name()} ({user.email}) has registered.',
+                    )
                 
                 messages.success(request, f'Account created successfully! Welcome, {user.first_name}!')
                 response = redirect('accounts:profile')
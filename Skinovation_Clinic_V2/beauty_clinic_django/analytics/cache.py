@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from .services import AnalyticsService
+
+# Seconds each dashboard section may be served from the cache
+SECTION_TIMEOUTS = {
+    'overview': 60 * 5,
+    'revenue': 60 * 10,
+    'patients': 60 * 15,
+    'services': 60 * 15,
+    'correlations': 60 * 60,
+    'insights': 60 * 5,
+    'diagnostics': 60 * 5,
+}
+
+# Sections that read each kind of source data
+APPOINTMENT_SECTIONS = ('overview', 'revenue', 'patients', 'services', 'insights', 'diagnostics')
+FEEDBACK_SECTIONS = ('services', 'insights')
+PACKAGE_SECTIONS = ('overview', 'patients', 'insights', 'diagnostics')
+PATIENT_SECTIONS = ('overview', 'patients', 'insights', 'diagnostics')
+SEGMENT_SECTIONS = ('patients', 'insights')
+
+
+def get_analytics_cache():
+    """Cache used for analytics sections (settings.ANALYTICS_CACHE_ALIAS, default 'default')"""
+    return caches[getattr(settings, 'ANALYTICS_CACHE_ALIAS', 'default')]
+
+
+def _version_key(section):
+    return f'analytics:{section}:version'
+
+
+def _section_key(section, day):
+    cache = get_analytics_cache()
+    version = cache.get(_version_key(section))
+    if version is None:
+        version = 1
+        cache.add(_version_key(section), version, None)
+    return f'analytics:{section}:{version}:{day.isoformat()}'
+
+
+def invalidate_sections(*sections):
+    """
+    Drop cached analytics sections so the next dashboard load recomputes them
+
+    Args:
+        *sections (str): Section names; all sections when none are given
+    """
+    cache = get_analytics_cache()
+    for section in sections or SECTION_TIMEOUTS:
+        try:
+            cache.incr(_version_key(section))
+        except ValueError:
+            cache.set(_version_key(section), 2, None)
+
+
+def invalidate_sections_on_commit(*sections):
+    """Invalidate once the current transaction commits, so readers never re-cache old data"""
+    transaction.on_commit(lambda: invalidate_sections(*sections), robust=True)
+
+
+class CachedAnalyticsService(AnalyticsService):
+    """
+    AnalyticsService whose sections are served from Django's cache framework
+
+    Every section is cached separately with its own timeout. The signal handlers
+    in signals.py invalidate the sections that read a table when appointments,
+    feedback, package bookings, patients or segments change, and every section
+    when a service, product or package is edited. populate_analytics and
+    run_analytics invalidate everything after their bulk writes. Edits to
+    patient profiles (names, birthdays, gender) only show once the section's
+    timeout passes. Within one instance each section is still loaded at most
+    once, so insights and diagnostics reuse the sections they depend on.
+    """
+
+    def _load_section(self, name, compute):
+        cache = get_analytics_cache()
+        key = _section_key(name, self.today)
+        value = cache.get(key)
+        if value is None:
+            value = compute()
+            cache.set(key, value, SECTION_TIMEOUTS[name])
+        return value
@@ -0,0 +1,333 @@
+from collections import defaultdict
+from itertools import combinations
+import logging
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the pure Python path gives the same results
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Pairs weaker than this are not stored
+MIN_CORRELATION_STRENGTH = 0.1
+
+# Shared patients needed before a pair is fully trusted
+CONFIDENCE_SAMPLE_SIZE = 10
+
+CORRELATION_FIELDS = ['correlation_strength', 'frequency', 'confidence_score']
+
+# Patients per block of the NumPy incidence matrix; a block takes services x this x 4 bytes
+CO_OCCURRENCE_BLOCK = 50000
+
+
+def service_patient_sets():
+    """
+    Load the service x patient incidence matrix in one query
+
+    Returns:
+        tuple: (service ids in display order, {service_id: set of patient ids})
+            for completed appointments only
+    """
+    from appointments.models import Appointment
+    from services.models import Service
+
+    service_ids = list(Service.objects.order_by('service_name', 'pk').values_list('pk', flat=True))
+    patients = {service_id: set() for service_id in service_ids}
+    pairs = Appointment.objects.filter(
+        status='completed', service__isnull=False
+    ).values_list('service_id', 'patient_id').distinct().order_by()
+    for service_id, patient_id in pairs.iterator():
+        patients[service_id].add(patient_id)
+    return service_ids, patients
+
+
+def pair_metrics(frequency, primary_size, secondary_size, patient_total=None):
+    """
+    Association metrics for one service pair
+
+    Args:
+        frequency (int): Patients who completed both services
+        primary_size (int): Patients who completed the primary service
+        secondary_size (int): Patients who completed the secondary service
+        patient_total (int): Patients who completed any service; only needed for lift
+
+    Returns:
+        dict: 'correlation_strength' (Jaccard), 'confidence' (P(secondary | primary)),
+            'lift' (None without patient_total), 'frequency' and 'confidence_score'
+            (sample size confidence)
+    """
+    union = primary_size + secondary_size - frequency
+    if patient_total is None:
+        lift = None
+    else:
+        lift = frequency * patient_total / (primary_size * secondary_size) if primary_size and secondary_size else 0.0
+    return {
+        'correlation_strength': frequency / union if union else 0.0,
+        'confidence': frequency / primary_size if primary_size else 0.0,
+        'lift': lift,
+        'frequency': frequency,
+        'confidence_score': min(1.0, frequency / CONFIDENCE_SAMPLE_SIZE),
+    }
+
+
+def _co_occurrence_numpy(service_ids, patients, block_size=CO_OCCURRENCE_BLOCK):
+    """
+    Pairwise shared patient counts as a sum of dense matrix products over patient blocks
+
+    Only one services x block_size incidence block exists at a time, so memory
+    stays bounded however many patients there are.
+    """
+    patient_index = {}
+    rows, cols = [], []
+    for row, service_id in enumerate(service_ids):
+        for patient_id in patients[service_id]:
+            rows.append(row)
+            cols.append(patient_index.setdefault(patient_id, len(patient_index)))
+    rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+    order = np.argsort(cols, kind='stable')
+    rows, cols = rows[order], cols[order]
+
+    co_occurrence = np.zeros((len(service_ids), len(service_ids)), dtype=np.int64)
+    for start in range(0, len(patient_index), block_size):
+        first, last = np.searchsorted(cols, [start, start + block_size])
+        block = np.zeros((len(service_ids), min(block_size, len(patient_index) - start)), dtype=np.float32)
+        block[rows[first:last], cols[first:last] - start] = 1
+        # Per-block counts stay below 2 ** 24, so the float32 product is exact
+        co_occurrence += (block @ block.T).astype(np.int64)
+
+    primary, secondary = np.nonzero(np.triu(co_occurrence, k=1))
+    counts = co_occurrence[primary, secondary]
+    return {
+        (int(i), int(j)): int(count)
+        for i, j, count in zip(primary.tolist(), secondary.tolist(), counts.tolist())
+    }
+
+
+def _co_occurrence_python(service_ids, patients):
+    """Pairwise shared patient counts, walking each patient's own services only"""
+    position = {service_id: index for index, service_id in enumerate(service_ids)}
+    by_patient = defaultdict(list)
+    for service_id in service_ids:
+        for patient_id in patients[service_id]:
+            by_patient[patient_id].append(position[service_id])
+    counts = defaultdict(int)
+    for indexes in by_patient.values():
+        # Services were appended in display order, so each pair comes out as (primary, secondary)
+        for pair in combinations(indexes, 2):
+            counts[pair] += 1
+    return counts
+
+
+def compute_correlations(service_ids, patients, min_strength=MIN_CORRELATION_STRENGTH, use_numpy=None):
+    """
+    Score every pair of services that share at least one patient
+
+    Args:
+        service_ids (list): Services in display order; the earlier one of a pair is the primary
+        patients (dict): {service_id: set of patient ids}
+        min_strength (float): Drop pairs with a lower Jaccard similarity
+        use_numpy (bool): Force or disable the NumPy path; defaults to NumPy when installed
+
+    Returns:
+        list: pair_metrics() dicts with 'primary_service_id' and 'secondary_service_id',
+            strongest first
+    """
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy and np is None:
+        raise ImportError('NumPy is not installed')
+
+    co_occurrence = _co_occurrence_numpy if use_numpy else _co_occurrence_python
+    counts = co_occurrence(service_ids, patients) if service_ids else {}
+    patient_total = len(set().union(*patients.values())) if patients else 0
+
+    results = []
+    for (i, j), frequency in counts.items():
+        primary, secondary = service_ids[i], service_ids[j]
+        metrics = pair_metrics(frequency, len(patients[primary]), len(patients[secondary]), patient_total)
+        if metrics['correlation_strength'] >= min_strength:
+            results.append({'primary_service_id': primary, 'secondary_service_id': secondary, **metrics})
+    results.sort(key=lambda row: (-row['correlation_strength'], row['primary_service_id'], row['secondary_service_id']))
+    return results
+
+
+def write_treatment_correlations(results, batch_size=1000):
+    """
+    Replace the stored correlations with compute_correlations() results
+
+    Pairs are upserted in bulk and rows for pairs missing from results are
+    removed, so the table always matches the computation.
+
+    Args:
+        results (list): Rows from compute_correlations()
+        batch_size (int): Rows per INSERT statement
+
+    Returns:
+        int: Number of correlations stored
+    """
+    from django.db import transaction
+    from .models import TreatmentCorrelation
+
+    rows = [
+        TreatmentCorrelation(
+            primary_service_id=result['primary_service_id'],
+            secondary_service_id=result['secondary_service_id'],
+            **{field: result[field] for field in CORRELATION_FIELDS},
+        )
+        for result in results
+    ]
+    keep = {(row.primary_service_id, row.secondary_service_id) for row in rows}
+
+    with transaction.atomic():
+        stale = [
+            pk for pk, primary, secondary in TreatmentCorrelation.objects.values_list(
+                'pk', 'primary_service_id', 'secondary_service_id'
+            ).iterator()
+            if (primary, secondary) not in keep
+        ]
+        for start in range(0, len(stale), batch_size):
+            TreatmentCorrelation.objects.filter(pk__in=stale[start:start + batch_size]).delete()
+        TreatmentCorrelation.objects.bulk_create(
+            rows,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['primary_service', 'secondary_service'],
+            update_fields=CORRELATION_FIELDS,
+        )
+    return len(rows)
+
+
+def rebuild_treatment_correlations(min_strength=MIN_CORRELATION_STRENGTH, batch_size=1000):
+    """
+    Recompute every TreatmentCorrelation row from completed appointments
+
+    Args:
+        min_strength (float): Minimum Jaccard similarity to store
+        batch_size (int): Rows per INSERT statement
+
+    Returns:
+        int: Number of correlations stored
+    """
+    service_ids, patients = service_patient_sets()
+    written = write_treatment_correlations(
+        compute_correlations(service_ids, patients, min_strength=min_strength), batch_size
+    )
+    logger.info('Rebuilt %s treatment correlations for %s services', written, len(service_ids))
+    return written
+
+
+def refresh_service_correlations(service_ids, min_strength=MIN_CORRELATION_STRENGTH):
+    """
+    Recompute only the pairs that involve the given services
+
+    When a patient completes (or stops having completed) a service, that
+    service's patient set is the only one that changes, so only its pairs can
+    move. They are rebuilt from two grouped queries per service.
+
+    Args:
+        service_ids (iterable): Services whose completed-patient sets changed
+        min_strength (float): Minimum Jaccard similarity to store
+
+    Returns:
+        int: Number of correlations stored for those services
+    """
+    from django.db import transaction
+    from django.db.models import Count, Q
+    from appointments.models import Appointment
+    from services.models import Service
+    from .models import TreatmentCorrelation
+
+    service_ids = set(service_ids) - {None}
+    if not service_ids:
+        return 0
+    order = {
+        service_id: index for index, service_id in enumerate(
+            Service.objects.order_by('service_name', 'pk').values_list('pk', flat=True)
+        )
+    }
+    completed = Appointment.objects.filter(status='completed', service__isnull=False)
+
+    written = 0
+    for service_id in service_ids & set(order):
+        patients = completed.filter(service_id=service_id).values('patient_id')
+        shared = dict(
+            completed.filter(patient_id__in=patients).exclude(service_id=service_id)
+            .values('service_id').annotate(patients=Count('patient', distinct=True))
+            .values_list('service_id', 'patients').order_by()
+        )
+        sizes = dict(
+            completed.filter(service_id__in=[service_id, *shared])
+            .values('service_id').annotate(patients=Count('patient', distinct=True))
+            .values_list('service_id', 'patients').order_by()
+        )
+
+        rows = []
+        for other_id, frequency in shared.items():
+            # Keep the same (primary, secondary) orientation as a full rebuild. Lift is
+            # not stored, so the full-table patient count it needs is skipped
+            primary, secondary = sorted((service_id, other_id), key=order.__getitem__)
+            metrics = pair_metrics(frequency, sizes[primary], sizes[secondary])
+            if metrics['correlation_strength'] >= min_strength:
+                rows.append(TreatmentCorrelation(
+                    primary_service_id=primary,
+                    secondary_service_id=secondary,
+                    **{field: metrics[field] for field in CORRELATION_FIELDS},
+                ))
+        keep = [(row.primary_service_id, row.secondary_service_id) for row in rows]
+
+        with transaction.atomic():
+            stale = TreatmentCorrelation.objects.filter(
+                Q(primary_service_id=service_id) | Q(secondary_service_id=service_id)
+            )
+            for primary, secondary in keep:
+                stale = stale.exclude(primary_service_id=primary, secondary_service_id=secondary)
+            stale.delete()
+            TreatmentCorrelation.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['primary_service', 'secondary_service'],
+                update_fields=CORRELATION_FIELDS,
+            )
+        written += len(rows)
+    return written
+
+
+def verify_treatment_correlations(min_strength=MIN_CORRELATION_STRENGTH, tolerance=1e-9):
+    """
+    Compare the stored correlations with a fresh computation, without writing
+
+    Args:
+        min_strength (float): Minimum Jaccard similarity a stored pair must reach
+        tolerance (float): Allowed difference between float metrics
+
+    Returns:
+        dict: 'missing', 'unexpected' and 'changed' lists of (primary_id, secondary_id)
+            pairs, plus 'checked', the number of expected pairs
+    """
+    from .models import TreatmentCorrelation
+
+    service_ids, patients = service_patient_sets()
+    expected = {
+        (row['primary_service_id'], row['secondary_service_id']): row
+        for row in compute_correlations(service_ids, patients, min_strength=min_strength)
+    }
+    stored = {
+        (row['primary_service_id'], row['secondary_service_id']): row
+        for row in TreatmentCorrelation.objects.values(
+            'primary_service_id', 'secondary_service_id', *CORRELATION_FIELDS
+        ).iterator()
+    }
+
+    changed = [
+        pair for pair in expected.keys() & stored.keys()
+        if expected[pair]['frequency'] != stored[pair]['frequency']
+        or abs(expected[pair]['correlation_strength'] - stored[pair]['correlation_strength']) > tolerance
+        or abs(expected[pair]['confidence_score'] - stored[pair]['confidence_score']) > tolerance
+    ]
+    return {
+        'checked': len(expected),
+        'missing': sorted(expected.keys() - stored.keys()),
+        'unexpected': sorted(stored.keys() - expected.keys()),
+        'changed': sorted(changed),
+    }
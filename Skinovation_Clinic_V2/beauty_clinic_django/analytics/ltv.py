@@ -0,0 +1,90 @@
+from decimal import Decimal
+from django.db.models import Count, Max, Min, Q, Sum
+import heapq
+
+ZERO = Decimal('0')
+
+
+def lifetime_value_rows(patient_ids=None):
+    """
+    Lifetime value figures for every patient in three grouped queries
+
+    A completed appointment is worth its service price, or its product price for
+    product-only pre-orders. Package bookings are added on top, as in the
+    per-patient calculation this replaces.
+
+    Args:
+        patient_ids (iterable): Limit the calculation to these patients
+
+    Returns:
+        dict: {patient_id: {'total_spent', 'appointment_count', 'first_visit',
+            'last_visit', 'avg_visit_value'}} in patient id order
+    """
+    from accounts.models import User
+    from appointments.models import Appointment
+    from packages.models import PackageBooking
+
+    patients = User.objects.filter(user_type='patient')
+    appointments = Appointment.objects.filter(status='completed', patient__user_type='patient')
+    bookings = PackageBooking.objects.filter(patient__user_type='patient')
+    if patient_ids is not None:
+        patients = patients.filter(pk__in=patient_ids)
+        appointments = appointments.filter(patient_id__in=patient_ids)
+        bookings = bookings.filter(patient_id__in=patient_ids)
+
+    rows = {
+        patient_id: {
+            'total_spent': ZERO,
+            'appointment_count': 0,
+            'first_visit': None,
+            'last_visit': None,
+            'avg_visit_value': 0,
+        }
+        for patient_id in patients.order_by('pk').values_list('pk', flat=True)
+    }
+
+    visits = appointments.values('patient_id').annotate(
+        count=Count('id'),
+        service_spend=Sum('service__price'),
+        product_spend=Sum('product__price', filter=Q(service__isnull=True)),
+        first_visit=Min('appointment_date'),
+        last_visit=Max('appointment_date'),
+    ).order_by()
+    for visit in visits:
+        row = rows.get(visit['patient_id'])
+        if row is None:
+            continue
+        row['total_spent'] += (visit['service_spend'] or ZERO) + (visit['product_spend'] or ZERO)
+        row['appointment_count'] = visit['count']
+        row['first_visit'] = visit['first_visit']
+        row['last_visit'] = visit['last_visit']
+
+    package_spend = bookings.values('patient_id').annotate(total=Sum('package__price')).order_by()
+    for spend in package_spend:
+        row = rows.get(spend['patient_id'])
+        if row is not None:
+            row['total_spent'] += spend['total'] or ZERO
+
+    for row in rows.values():
+        if row['appointment_count']:
+            row['avg_visit_value'] = row['total_spent'] / row['appointment_count']
+    return rows
+
+
+def top_patients_by_value(limit=20):
+    """
+    Patients with the highest lifetime spend
+
+    Args:
+        limit (int): Number of patients to return
+
+    Returns:
+        list: Lifetime value dicts with a 'patient' User, highest spend first
+    """
+    from accounts.models import User
+
+    rows = lifetime_value_rows()
+    # nlargest keeps patient id order for equal spend, like a stable sort would
+    top = heapq.nlargest(limit, rows.items(), key=lambda item: item[1]['total_spent'])
+    users = User.objects.in_bulk([patient_id for patient_id, _ in top])
+    return [{'patient': users[patient_id], **row} for patient_id, row in top]
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from analytics.cache import CachedAnalyticsService, invalidate_sections
+import statistics
+import time
+
+DASHBOARD_SECTIONS = [
+    ('overview', 'get_business_overview'),
+    ('revenue', 'get_revenue_analytics'),
+    ('patients', 'get_patient_analytics'),
+    ('services', 'get_service_analytics'),
+    ('correlations', 'get_treatment_correlations'),
+    ('insights', 'get_business_insights'),
+    ('diagnostics', 'get_diagnostic_metrics'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare owner dashboard analytics load times with a cold and a warm cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=5,
+            help='Number of warm dashboard loads to average'
+        )
+
+    def load_dashboard(self):
+        """Load every section the way owner_dashboard does; returns per-section (seconds, queries)"""
+        service = CachedAnalyticsService()
+        timings = {}
+        for section, method in DASHBOARD_SECTIONS:
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                getattr(service, method)()
+                timings[section] = (time.perf_counter() - started, len(queries))
+        return timings
+
+    def handle(self, *args, **options):
+        invalidate_sections()
+        cold = self.load_dashboard()
+        warm_runs = [self.load_dashboard() for _ in range(max(options['runs'], 1))]
+
+        self.stdout.write(f"{'Section':<14}{'Cold ms':>10}{'Queries':>9}{'Warm ms':>10}{'Queries':>9}")
+        for section, _ in DASHBOARD_SECTIONS:
+            warm_seconds = statistics.median(run[section][0] for run in warm_runs)
+            self.stdout.write(
+                f"{section:<14}{cold[section][0] * 1000:>10.1f}{cold[section][1]:>9}"
+                f"{warm_seconds * 1000:>10.1f}{warm_runs[-1][section][1]:>9}"
+            )
+
+        cold_total = sum(seconds for seconds, _ in cold.values())
+        warm_total = statistics.median(sum(seconds for seconds, _ in run.values()) for run in warm_runs)
+        speedup = cold_total / warm_total if warm_total else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Dashboard: cold {cold_total * 1000:.1f} ms ({sum(q for _, q in cold.values())} queries), '
+                f'warm {warm_total * 1000:.1f} ms ({sum(q for _, q in warm_runs[-1].values())} queries), '
+                f'{speedup:.0f}x faster'
+            )
+        )
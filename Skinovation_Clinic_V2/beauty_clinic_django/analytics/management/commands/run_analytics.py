@@ -1,19 +1,55 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from analytics.services import AnalyticsService
+from analytics.snapshot import SECTIONS
+import json
 
 
 class Command(BaseCommand):
     help = 'Run analytics calculations for all data'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--section',
+            action='append',
+            choices=sorted(SECTIONS),
+            help='Only rebuild this section; repeat for several (default: all)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Sections computed in parallel'
+        )
+        parser.add_argument(
+            '--time-budget',
+            type=float,
+            help='Seconds after which no further section is started'
+        )
+        parser.add_argument(
+            '--report',
+            type=str,
+            help='Also write the JSON timing report to this file'
+        )
+
     def handle(self, *args, **options):
-        self.stdout.write('Starting analytics calculations...')
+        self.stderr.write('Starting analytics calculations...')
+        
+        report = AnalyticsService.run_all_analytics(
+            sections=options['section'],
+            max_workers=options['workers'],
+            time_budget=options['time_budget'],
+        )
+        output = json.dumps(report, indent=2)
+        self.stdout.write(output)
+        if options['report']:
+            with open(options['report'], 'w') as report_file:
+                report_file.write(output)
         
-        try:
-            AnalyticsService.run_all_analytics()
-            self.stdout.write(
-                self.style.SUCCESS('Analytics calculations completed successfully!')
-            )
-        except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(f'Error running analytics: {str(e)}')
-            )
+        failed = [name for name, result in report['sections'].items() if result['status'].startswith('failed')]
+        if failed:
+            raise CommandError(f"Analytics sections failed: {', '.join(failed)}")
+        skipped = [name for name, result in report['sections'].items() if result['status'] == 'skipped']
+        if skipped:
+            self.stderr.write(self.style.WARNING(f"Time budget reached; skipped: {', '.join(skipped)}"))
+        else:
+            self.stderr.write(self.style.SUCCESS('Analytics calculations completed successfully!'))
@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+from beauty_clinic_django.benchmarks import (
+    BenchmarkData, build_benchmarks, compare_results, measure, results_document, select_benchmarks,
+)
+import json
+import logging
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the critical pages, APIs and services against the current dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=20, help='Timed iterations per benchmark')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed iterations before timing')
+        parser.add_argument(
+            '--only', action='append', default=[],
+            help='Run benchmarks matching a name pattern (e.g. "view:*") or a group; repeatable',
+        )
+        parser.add_argument('--list', action='store_true', help='List the benchmarks and exit')
+        parser.add_argument('--output', type=str, help='Write the results as JSON to this file')
+        parser.add_argument('--compare', type=str, help='Results file from an earlier run to compare against')
+        parser.add_argument(
+            '--threshold', type=float, default=10.0,
+            help='Median latency growth, in percent, reported as a regression when comparing',
+        )
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help='Exit with an error when --compare finds a regression',
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as handle:
+                    baseline = json.load(handle)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {options['compare']}: {e}")
+
+        # The suite measures queries itself; the middleware's over-budget warnings are noise here
+        budget_logger = logging.getLogger('beauty_clinic_django.query_budget')
+        budget_logger.disabled = True
+        try:
+            results = self.run_suite(options)
+        finally:
+            budget_logger.disabled = False
+        if results is None:
+            return
+
+        document = results_document(results, options['runs'], options['warmup'])
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(document, handle, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if baseline:
+            self.report_comparison(baseline, document, options)
+
+    def run_suite(self, options):
+        """Run the selected benchmarks; returns {name: result}, or None after --list"""
+        # Everything the benchmarks write, including their users, is rolled back
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), transaction.atomic():
+            data = BenchmarkData()
+            missing = data.missing()
+            if missing:
+                raise CommandError(
+                    f"The dataset has no {', '.join(missing)}; load one first, e.g. "
+                    f"python manage.py generate_load_data --patients 10000"
+                )
+            benchmarks = select_benchmarks(build_benchmarks(data), options['only'])
+            if options['list']:
+                for benchmark in benchmarks:
+                    self.stdout.write(f'{benchmark.group:<15}{benchmark.name}')
+                transaction.set_rollback(True)
+                return None
+            if not benchmarks:
+                raise CommandError('No benchmarks match --only')
+
+            results = {}
+            self.stdout.write(
+                f"{'Benchmark':<44}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'Queries':>9}{'Peak KB':>10}"
+            )
+            for benchmark in benchmarks:
+                result = measure(benchmark, runs=options['runs'], warmup=options['warmup'])
+                results[benchmark.name] = result
+                latency = result['latency_ms']
+                line = (
+                    f"{benchmark.name:<44}{latency['p50']:>10.1f}{latency['p95']:>10.1f}{latency['p99']:>10.1f}"
+                    f"{result['queries']:>9}{result['peak_memory_kb']:>10.0f}"
+                )
+                if result['errors']:
+                    line += self.style.WARNING(f"  HTTP {result['status_codes']}")
+                self.stdout.write(line)
+            transaction.set_rollback(True)
+        return results
+
+    def report_comparison(self, baseline, document, options):
+        commit = (baseline.get('environment', {}).get('commit') or 'baseline')[:10]
+        if baseline.get('environment', {}).get('dataset') != document['environment']['dataset']:
+            self.stdout.write(self.style.WARNING('The baseline was recorded on a different dataset'))
+
+        rows = compare_results(baseline, document, options['threshold'])
+        self.stdout.write(f"\nAgainst {commit}:")
+        self.stdout.write(f"{'Benchmark':<44}{'p50 before':>12}{'p50 after':>11}{'Change':>9}{'Queries':>12}")
+        for row in rows:
+            line = (
+                f"{row['name']:<44}{row['p50_before']:>12.1f}{row['p50_after']:>11.1f}{row['change']:>8.0f}%"
+                f"{row['queries_before']:>6} → {row['queries_after']:<4}"
+            )
+            self.stdout.write(self.style.ERROR(line) if row['regressed'] else line)
+
+        regressed = [row['name'] for row in rows if row['regressed']]
+        if regressed and options['fail_on_regression']:
+            raise CommandError(f"Regressed: {', '.join(regressed)}")
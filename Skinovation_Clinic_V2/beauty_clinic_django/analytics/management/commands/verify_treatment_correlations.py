@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from analytics.cache import invalidate_sections
+from analytics.correlations import refresh_service_correlations, verify_treatment_correlations
+import time
+
+
+class Command(BaseCommand):
+    help = 'Check the incrementally maintained treatment correlations against a fresh computation'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repair',
+            action='store_true',
+            help='Recompute the pairs of services whose correlations drifted'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        report = verify_treatment_correlations()
+        drifted = report['missing'] + report['unexpected'] + report['changed']
+        self.stdout.write(
+            f"Checked {report['checked']} correlations in {time.monotonic() - started:.1f}s: "
+            f"{len(report['missing'])} missing, {len(report['unexpected'])} unexpected, "
+            f"{len(report['changed'])} changed"
+        )
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('Treatment correlations are up to date'))
+            return
+
+        for label in ('missing', 'unexpected', 'changed'):
+            for primary, secondary in report[label][:20]:
+                self.stdout.write(f'  {label}: services {primary} ↔ {secondary}')
+
+        if not options['repair']:
+            raise CommandError(f'{len(drifted)} treatment correlations drifted; rerun with --repair to fix them')
+
+        services = {service_id for pair in drifted for service_id in pair}
+        refresh_service_correlations(services)
+        invalidate_sections('correlations')
+        self.stdout.write(self.style.SUCCESS(f'Recomputed correlations for {len(services)} services'))
@@ -0,0 +1,122 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:32
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Avg, Count, Q, Sum
+from django.db.models.functions import TruncDate
+
+CHUNK_DAYS = 90
+
+
+def backfill_rollup(apps, schema_editor):
+    """Fill the daily rollup from the historical models (a frozen copy of analytics.rollups)"""
+    Appointment = apps.get_model('appointments', 'Appointment')
+    Feedback = apps.get_model('appointments', 'Feedback')
+    PackageBooking = apps.get_model('packages', 'PackageBooking')
+    User = apps.get_model('accounts', 'User')
+    BusinessAnalytics = apps.get_model('analytics', 'BusinessAnalytics')
+
+    days = set(Appointment.objects.values_list('appointment_date', flat=True).distinct().order_by())
+    days.update(
+        PackageBooking.objects.annotate(day=TruncDate('created_at')).values_list('day', flat=True).distinct().order_by()
+    )
+    days.update(
+        User.objects.filter(user_type='patient').annotate(day=TruncDate('created_at'))
+        .values_list('day', flat=True).distinct().order_by()
+    )
+    days = sorted(day for day in days if day is not None)
+    BusinessAnalytics.objects.exclude(date__in=days).delete()
+
+    completed = Q(status='completed')
+    for start in range(0, len(days), CHUNK_DAYS):
+        chunk = days[start:start + CHUNK_DAYS]
+        appointments = {
+            row['appointment_date']: row
+            for row in Appointment.objects.filter(appointment_date__in=chunk).values('appointment_date').annotate(
+                total=Count('id'),
+                completed=Count('id', filter=completed),
+                cancelled=Count('id', filter=Q(status='cancelled')),
+                patients=Count('patient', distinct=True),
+                service_revenue=Sum('service__price', filter=completed & Q(service__isnull=False)),
+                product_revenue=Sum('product__price', filter=completed & Q(product__isnull=False)),
+            ).order_by()
+        }
+        package_revenue = dict(
+            PackageBooking.objects.annotate(day=TruncDate('created_at')).filter(day__in=chunk)
+            .values('day').annotate(total=Sum('package__price')).order_by().values_list('day', 'total')
+        )
+        new_patients = dict(
+            User.objects.filter(user_type='patient').annotate(day=TruncDate('created_at')).filter(day__in=chunk)
+            .values('day').annotate(total=Count('id')).order_by().values_list('day', 'total')
+        )
+        satisfaction = dict(
+            Feedback.objects.filter(appointment__appointment_date__in=chunk)
+            .values('appointment__appointment_date').annotate(score=Avg('rating')).order_by()
+            .values_list('appointment__appointment_date', 'score')
+        )
+
+        rows = []
+        for day in chunk:
+            counts = appointments.get(day, {})
+            service_revenue = counts.get('service_revenue') or Decimal('0')
+            product_revenue = counts.get('product_revenue') or Decimal('0')
+            packages = package_revenue.get(day) or Decimal('0')
+            total_revenue = service_revenue + product_revenue + packages
+            completed_count = counts.get('completed', 0)
+            rows.append(BusinessAnalytics(
+                date=day,
+                total_appointments=counts.get('total', 0),
+                completed_appointments=completed_count,
+                cancelled_appointments=counts.get('cancelled', 0),
+                new_patients=new_patients.get(day, 0),
+                returning_patients=counts.get('patients', 0),
+                service_revenue=service_revenue,
+                product_revenue=product_revenue,
+                package_revenue=packages,
+                total_revenue=total_revenue,
+                average_appointment_value=(total_revenue / completed_count) if completed_count else 0,
+                patient_satisfaction_score=satisfaction.get(day) or 0,
+            ))
+        BusinessAnalytics.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['date'],
+            update_fields=[
+                'total_appointments', 'completed_appointments', 'cancelled_appointments',
+                'new_patients', 'returning_patients', 'service_revenue', 'product_revenue',
+                'package_revenue', 'total_revenue', 'average_appointment_value',
+                'patient_satisfaction_score', 'updated_at',
+            ],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+        ('accounts', '0009_attendantleaverequest'),
+        ('appointments', '0014_reminderdelivery'),
+        ('packages', '0002_package_archived'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='businessanalytics',
+            name='package_revenue',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='businessanalytics',
+            name='product_revenue',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='businessanalytics',
+            name='service_revenue',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='businessanalytics',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:01
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_duplicate_rows(apps, schema_editor):
+    """Keep the oldest row per patient, the one upsert_rows() has been updating"""
+    for name in ('PatientAnalytics', 'PatientSegment'):
+        model = apps.get_model('analytics', name)
+        duplicated = (
+            model.objects.order_by().values('patient_id')
+            .annotate(rows=Count('pk'), first=Min('pk')).filter(rows__gt=1)
+        )
+        for row in list(duplicated):
+            model.objects.filter(patient_id=row['patient_id']).exclude(pk=row['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_business_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='patientanalytics',
+            constraint=models.UniqueConstraint(fields=('patient',), name='patient_analytics_patient_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='patientsegment',
+            constraint=models.UniqueConstraint(fields=('patient',), name='patient_segment_patient_uniq'),
+        ),
+    ]
@@ -27,6 +27,9 @@ class PatientAnalytics(models.Model):
     class Meta:
         db_table = 'patient_analytics'
         verbose_name_plural = 'Patient Analytics'
+        constraints = [
+            models.UniqueConstraint(fields=['patient'], name='patient_analytics_patient_uniq'),
+        ]
 
 
 class ServiceAnalytics(models.Model):
@@ -51,17 +54,26 @@ class ServiceAnalytics(models.Model):
 
 
 class BusinessAnalytics(models.Model):
-    """Model for storing business-wide analytics"""
+    """
+    Daily business metrics rollup, one row per day
+
+    Rows are kept current by the signal handlers in analytics/signals.py and can
+    be rebuilt with the backfill_business_analytics command.
+    """
     date = models.DateField(unique=True)
     total_appointments = models.IntegerField(default=0)
     completed_appointments = models.IntegerField(default=0)
     cancelled_appointments = models.IntegerField(default=0)
     new_patients = models.IntegerField(default=0)
     returning_patients = models.IntegerField(default=0)
+    service_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    product_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    package_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     total_revenue = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     average_appointment_value = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     patient_satisfaction_score = models.FloatField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Business Analytics - {self.date}"
@@ -111,3 +123,6 @@ class PatientSegment(models.Model):
     class Meta:
         db_table = 'patient_segments'
         verbose_name_plural = 'Patient Segments'
+        constraints = [
+            models.UniqueConstraint(fields=['patient'], name='patient_segment_patient_uniq'),
+        ]
@@ -0,0 +1,135 @@
+from decimal import Decimal
+from django.core.paginator import Paginator
+from django.db.models import Count, DecimalField, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+# Columns patient lists can be sorted by, as ?sort=<key> or ?sort=-<key>
+PATIENT_STATS_SORTS = {
+    'name': ['last_name', 'first_name'],
+    'joined': ['created_at'],
+    'appointments': ['total_appointments'],
+    'completed': ['completed_appointments'],
+    'cancelled': ['cancelled_appointments'],
+    'spent': ['total_spent'],
+    'last_visit': ['last_visit'],
+    'segment': ['current_segment'],
+}
+
+# Sort fields that are patient_stats() annotations rather than patient columns
+STAT_FIELDS = {
+    'total_appointments', 'completed_appointments', 'cancelled_appointments',
+    'total_spent', 'last_visit', 'current_segment',
+}
+
+# A patient column, so the default page never computes figures for every patient
+DEFAULT_SORT = 'name'
+
+PATIENTS_PER_PAGE = 25
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+def patient_stats(patients=None):
+    """
+    Annotate patients with their appointment figures, spend and segment
+
+    Spend follows the lifetime value rule in ltv.py: a completed appointment is
+    worth its service price, or its product price for product pre-orders, and
+    package bookings are added on top. Spend and segment come from correlated
+    subqueries so they do not multiply the appointment counts.
+
+    Args:
+        patients (QuerySet): Patients to annotate; all patients by default
+
+    Returns:
+        QuerySet: Patients with total_appointments, completed_appointments,
+            cancelled_appointments, last_visit (date), total_spent (Decimal)
+            and current_segment ('unclassified' when not segmented yet)
+    """
+    from accounts.models import User
+    from appointments.models import Appointment
+    from packages.models import PackageBooking
+    from .models import PatientSegment
+
+    if patients is None:
+        patients = User.objects.filter(user_type='patient')
+
+    visit_spend = Appointment.objects.filter(patient=OuterRef('pk'), status='completed').values('patient').annotate(
+        total=Sum(Coalesce('service__price', 'product__price'))
+    ).values('total')
+    package_spend = PackageBooking.objects.filter(patient=OuterRef('pk')).values('patient').annotate(
+        total=Sum('package__price')
+    ).values('total')
+    segment = PatientSegment.objects.filter(patient=OuterRef('pk')).order_by('-last_updated', '-pk').values('segment')[:1]
+    zero = Value(Decimal('0'), output_field=MONEY)
+
+    return patients.annotate(
+        total_appointments=Count('appointments'),
+        completed_appointments=Count('appointments', filter=Q(appointments__status='completed')),
+        cancelled_appointments=Count('appointments', filter=Q(appointments__status='cancelled')),
+        last_visit=Max('appointments__appointment_date', filter=Q(appointments__status='completed')),
+        total_spent=Coalesce(Subquery(visit_spend, output_field=MONEY), zero)
+        + Coalesce(Subquery(package_spend, output_field=MONEY), zero),
+        current_segment=Coalesce(Subquery(segment), Value('unclassified')),
+    )
+
+
+def patient_stats_page(request, patients=None, per_page=PATIENTS_PER_PAGE):
+    """
+    One sorted page of patient_stats() for a list view
+
+    Reads ?sort= (a PATIENT_STATS_SORTS key, '-' for descending) and ?page=.
+    When sorting by a patient column, the page is picked from the plain patient
+    table and only its patients are annotated, so the page costs the same
+    whatever the number of patients. Sorting by a figure needs it for every
+    patient, which is still a single grouped query.
+
+    Args:
+        request (HttpRequest): The list view's request
+        patients (QuerySet): Filtered patients; all patients by default
+
+    Returns:
+        dict: Template context with page_obj (patients also carry
+            segment_label), sort, query_string (the
+            request's query without the page, for pagination links) and
+            sort_query_string (without the page and sort, for column headers)
+    """
+    from accounts.models import User
+    from .models import PatientSegment
+
+    if patients is None:
+        patients = User.objects.filter(user_type='patient')
+
+    sort = request.GET.get('sort', DEFAULT_SORT)
+    if sort.lstrip('-') not in PATIENT_STATS_SORTS:
+        sort = DEFAULT_SORT
+    fields = PATIENT_STATS_SORTS[sort.lstrip('-')]
+    descending = sort.startswith('-')
+    ordering = [
+        F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+        for field in fields
+    ] + ['pk']
+
+    by_figure = any(field in STAT_FIELDS for field in fields)
+    paginator = Paginator((patient_stats(patients) if by_figure else patients).order_by(*ordering), per_page)
+    paginator.count = patients.count()  # Counting patients does not need the appointments join
+    page_obj = paginator.get_page(request.GET.get('page'))
+    if by_figure:
+        page_obj.object_list = list(page_obj.object_list)
+    else:
+        stats = patient_stats(User.objects.filter(pk__in=[patient.pk for patient in page_obj])).in_bulk()
+        page_obj.object_list = [stats[patient.pk] for patient in page_obj]
+    labels = dict(PatientSegment.SEGMENT_CHOICES)
+    for patient in page_obj:
+        patient.segment_label = labels.get(patient.current_segment, 'Unclassified')
+
+    query = request.GET.copy()
+    query.pop('page', None)
+    sort_query = query.copy()
+    sort_query.pop('sort', None)
+    return {
+        'page_obj': page_obj,
+        'sort': sort,
+        'query_string': query.urlencode(),
+        'sort_query_string': sort_query.urlencode(),
+    }
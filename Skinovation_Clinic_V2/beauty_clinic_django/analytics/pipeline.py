@@ -0,0 +1,296 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import connections, transaction
+from django.db.models import Avg, Count, Q
+from django.db.models.functions import ExtractMonth
+from django.utils import timezone
+from .risk import update_risk_scores
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Patients handled per round of grouped queries
+PATIENT_CHUNK_SIZE = 2000
+
+# Rows per INSERT/UPDATE statement
+WRITE_BATCH_SIZE = 500
+
+PATIENT_ANALYTICS_FIELDS = [
+    'total_appointments', 'completed_appointments', 'cancelled_appointments', 'total_spent',
+    'last_visit', 'average_visit_frequency', 'preferred_services', 'updated_at',
+]
+SERVICE_ANALYTICS_FIELDS = [
+    'total_bookings', 'completed_bookings', 'cancelled_bookings', 'total_revenue',
+    'average_rating', 'popularity_score', 'seasonal_trends', 'updated_at',
+]
+SEGMENT_FIELDS = ['segment', 'segment_score', 'last_updated']
+
+
+def upsert_rows(model, key_field, rows, fields, batch_size=WRITE_BATCH_SIZE):
+    """
+    Update the existing row for each key and create the missing ones, in batches
+
+    ServiceAnalytics has no unique constraint on its key, so rows are matched
+    up front instead of relying on update_conflicts.
+
+    Args:
+        model: Model class to write
+        key_field (str): Attribute holding the key, e.g. 'patient_id'
+        rows (list): Unsaved model instances
+        fields (list): Fields to overwrite on existing rows
+
+    Returns:
+        int: Number of rows written
+    """
+    keys = [getattr(row, key_field) for row in rows]
+    existing = {}
+    for start in range(0, len(keys), batch_size):
+        # Newest first, so the oldest row wins when a key has duplicates
+        existing.update(
+            model.objects.filter(**{f'{key_field}__in': keys[start:start + batch_size]})
+            .order_by('-pk').values_list(key_field, 'pk')
+        )
+
+    to_update, to_create = [], []
+    for row in rows:
+        row.pk = existing.get(getattr(row, key_field))
+        (to_update if row.pk else to_create).append(row)
+
+    with transaction.atomic():
+        if to_update:
+            model.objects.bulk_update(to_update, fields, batch_size=batch_size)
+        if to_create:
+            model.objects.bulk_create(to_create, batch_size=batch_size)
+    return len(rows)
+
+
+def chunked(values, size=PATIENT_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def patient_ids_to_refresh(since=None):
+    """
+    Patients whose analytics may have changed
+
+    Args:
+        since (date): Only patients with appointments, package bookings or
+            feedback changed on or after this date, plus patients without a row yet
+
+    Returns:
+        list: Sorted patient ids
+    """
+    from accounts.models import User
+    from appointments.models import Appointment, Feedback
+    from packages.models import PackageBooking
+    from .models import PatientAnalytics
+
+    patients = User.objects.filter(user_type='patient')
+    if since is None:
+        return list(patients.order_by('pk').values_list('pk', flat=True))
+
+    changed = set(Appointment.objects.filter(updated_at__date__gte=since).values_list('patient_id', flat=True).distinct().order_by())
+    changed.update(PackageBooking.objects.filter(updated_at__date__gte=since).values_list('patient_id', flat=True).distinct().order_by())
+    changed.update(Feedback.objects.filter(created_at__date__gte=since).values_list('appointment__patient_id', flat=True).distinct().order_by())
+    changed.update(
+        patients.filter(Q(created_at__date__gte=since) | ~Q(pk__in=PatientAnalytics.objects.values('patient_id')))
+        .values_list('pk', flat=True)
+    )
+    return sorted(patients.filter(pk__in=changed).values_list('pk', flat=True)) if changed else []
+
+
+def id_ranges(patient_ids, partitions):
+    """Split sorted patient ids into contiguous ID ranges of similar size"""
+    partitions = max(1, min(partitions, len(patient_ids)))
+    size = -(-len(patient_ids) // partitions) if patient_ids else 0
+    return [patient_ids[start:start + size] for start in range(0, len(patient_ids), size)] if size else []
+
+
+def build_patient_analytics(patient_ids):
+    """
+    Rebuild PatientAnalytics counts, spend and visit history for the given patients
+
+    Uses a fixed number of grouped queries per chunk of patients. Risk scores
+    are left to risk.update_risk_scores().
+
+    Returns:
+        int: Number of rows written
+    """
+    from appointments.models import Appointment
+    from .ltv import lifetime_value_rows
+    from .models import PatientAnalytics
+
+    written = 0
+    now = timezone.now()
+    for chunk in chunked(patient_ids):
+        values = lifetime_value_rows(chunk)
+        counts = {
+            row['patient_id']: row for row in Appointment.objects.filter(patient_id__in=chunk)
+            .values('patient_id').annotate(
+                total=Count('id'),
+                cancelled=Count('id', filter=Q(status='cancelled')),
+            ).order_by()
+        }
+
+        preferred = defaultdict(list)
+        names = Appointment.objects.filter(
+            patient_id__in=chunk, status='completed', service__isnull=False
+        ).order_by('patient_id', '-created_at').values_list('patient_id', 'service__service_name')
+        for patient_id, name in names.iterator():
+            services = preferred[patient_id]
+            if len(services) < 5 and name not in services:
+                services.append(name)
+
+        rows = []
+        for patient_id, value in values.items():
+            completed = value['appointment_count']
+            frequency = 0
+            if completed > 1:
+                frequency = (value['last_visit'] - value['first_visit']).days / (completed - 1)
+            count = counts.get(patient_id, {})
+            rows.append(PatientAnalytics(
+                patient_id=patient_id,
+                total_appointments=count.get('total', 0),
+                completed_appointments=completed,
+                cancelled_appointments=count.get('cancelled', 0),
+                total_spent=value['total_spent'],
+                last_visit=value['last_visit'],
+                average_visit_frequency=frequency,
+                preferred_services=preferred.get(patient_id, []),
+                updated_at=now,
+            ))
+        written += upsert_rows(PatientAnalytics, 'patient_id', rows, PATIENT_ANALYTICS_FIELDS)
+    return written
+
+
+def segment_for(total_spent, completed_appointments, risk_score):
+    """(segment, segment_score) for a patient's analytics figures"""
+    if total_spent >= 10000:  # High value threshold
+        return 'high_value', min(1.0, float(total_spent) / 20000)
+    if completed_appointments >= 10:  # Frequent threshold
+        return 'frequent', min(1.0, completed_appointments / 20)
+    if risk_score >= 0.7:  # At risk threshold
+        return 'at_risk', risk_score
+    if completed_appointments <= 2:  # New patient threshold
+        return 'new', 1.0 - (completed_appointments / 3)
+    return 'occasional', min(1.0, completed_appointments / 10)
+
+
+def build_patient_segments(patient_ids):
+    """
+    Rebuild PatientSegment rows from the stored PatientAnalytics figures
+
+    Patients without analytics are placed in the 'new' segment.
+
+    Returns:
+        int: Number of rows written
+    """
+    from .models import PatientAnalytics, PatientSegment
+
+    written = 0
+    now = timezone.now()
+    for chunk in chunked(patient_ids):
+        figures = {}
+        # Oldest row wins when a patient has duplicates, as with the per-patient lookup
+        for row in PatientAnalytics.objects.filter(patient_id__in=chunk).order_by('-pk').values(
+            'patient_id', 'total_spent', 'completed_appointments', 'risk_score'
+        ):
+            figures[row['patient_id']] = row
+
+        rows = []
+        for patient_id in chunk:
+            row = figures.get(patient_id)
+            if row:
+                segment, score = segment_for(row['total_spent'], row['completed_appointments'], row['risk_score'])
+            else:
+                segment, score = 'new', 1.0
+            rows.append(PatientSegment(patient_id=patient_id, segment=segment, segment_score=score, last_updated=now))
+        written += upsert_rows(PatientSegment, 'patient_id', rows, SEGMENT_FIELDS)
+    return written
+
+
+def build_service_analytics():
+    """
+    Rebuild ServiceAnalytics for every service with three grouped queries
+
+    Popularity is a rank across all services, so services are always rebuilt together.
+
+    Returns:
+        int: Number of rows written
+    """
+    from appointments.models import Appointment, Feedback
+    from services.models import Service
+    from .models import ServiceAnalytics
+
+    services = list(Service.objects.order_by('pk').values_list('pk', 'price'))
+    completed = Q(status='completed')
+    counts = {
+        row['service_id']: row for row in Appointment.objects.filter(service__isnull=False)
+        .values('service_id').annotate(
+            total=Count('id'),
+            completed=Count('id', filter=completed),
+            cancelled=Count('id', filter=Q(status='cancelled')),
+        ).order_by()
+    }
+    ratings = dict(
+        Feedback.objects.filter(appointment__status='completed', appointment__service__isnull=False)
+        .values('appointment__service_id').annotate(rating=Avg('rating')).order_by()
+        .values_list('appointment__service_id', 'rating')
+    )
+    seasonal = defaultdict(lambda: {str(month): 0 for month in range(1, 13)})
+    monthly = Appointment.objects.filter(completed, service__isnull=False).annotate(
+        month=ExtractMonth('appointment_date')
+    ).values('service_id', 'month').annotate(total=Count('id')).order_by()
+    for row in monthly:
+        seasonal[row['service_id']][str(row['month'])] = row['total']
+
+    ranked = sorted(
+        (service_id for service_id, _ in services if counts.get(service_id, {}).get('completed')),
+        key=lambda service_id: (-counts[service_id]['completed'], service_id),
+    )
+    rank = {service_id: position for position, service_id in enumerate(ranked, start=1)}
+
+    now = timezone.now()
+    rows = []
+    for service_id, price in services:
+        count = counts.get(service_id, {})
+        completed_count = count.get('completed', 0)
+        rows.append(ServiceAnalytics(
+            service_id=service_id,
+            total_bookings=count.get('total', 0),
+            completed_bookings=completed_count,
+            cancelled_bookings=count.get('cancelled', 0),
+            total_revenue=(price or Decimal('0')) * completed_count,
+            average_rating=ratings.get(service_id) or 0,
+            popularity_score=1 - (rank[service_id] - 1) / len(services) if service_id in rank else 0,
+            seasonal_trends=seasonal[service_id],
+            updated_at=now,
+        ))
+    return upsert_rows(ServiceAnalytics, 'service_id', rows, SERVICE_ANALYTICS_FIELDS)
+
+
+PATIENT_STAGES = {
+    'patients': build_patient_analytics,
+    'risk': update_risk_scores,
+    'segments': build_patient_segments,
+}
+
+
+def init_worker():
+    """Give each worker process its own database connections"""
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def run_patient_stage(stage, patient_ids):
+    """
+    Run one patient stage over a partition; the entry point for worker processes
+
+    Returns:
+        tuple: (rows written, seconds taken)
+    """
+    started = time.perf_counter()
+    written = PATIENT_STAGES[stage](patient_ids)
+    return written, time.perf_counter() - started
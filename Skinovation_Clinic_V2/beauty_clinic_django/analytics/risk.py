@@ -0,0 +1,207 @@
+from collections import defaultdict
+from django.db.models import Avg, Count, F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+import math
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; the pure Python path gives the same scores
+    np = None
+
+# Patients scored per round of queries
+RISK_CHUNK_SIZE = 2000
+
+# Completed visits needed to compare recent and older visit gaps
+TREND_VISITS = 5
+
+SIGNAL_FIELDS = [
+    'days_since_last_visit', 'total_appointments', 'cancelled_appointments',
+    'recent_gap', 'older_gap', 'average_rating',
+]
+
+
+def _visit_gap(dates):
+    """Average days between consecutive visits, newest first"""
+    if len(dates) < 2:
+        return 0
+    return (dates[0] - dates[-1]).days / (len(dates) - 1)
+
+
+def risk_signals(patient_ids, completed_dates, counts, ratings, today):
+    """
+    Arrange per-patient figures into one list per signal
+
+    Args:
+        patient_ids (list): Patients, in the order the scores should come back
+        completed_dates (dict): {patient_id: completed visit dates, newest first};
+            only the six newest are used
+        counts (dict): {patient_id: (total appointments, cancelled appointments)}
+        ratings (dict): {patient_id: average feedback rating}
+        today (date): Day recency is measured from
+
+    Returns:
+        dict: Lists keyed by SIGNAL_FIELDS, NaN where a signal is missing
+    """
+    nan = math.nan
+    signals = {field: [] for field in SIGNAL_FIELDS}
+    for patient_id in patient_ids:
+        dates = completed_dates.get(patient_id, [])
+        total, cancelled = counts.get(patient_id, (0, 0))
+        trend = len(dates) >= TREND_VISITS
+        signals['days_since_last_visit'].append((today - dates[0]).days if dates else nan)
+        signals['total_appointments'].append(total)
+        signals['cancelled_appointments'].append(cancelled)
+        signals['recent_gap'].append(_visit_gap(dates[:3]) if trend else nan)
+        signals['older_gap'].append(_visit_gap(dates[3:6]) if trend else nan)
+        rating = ratings.get(patient_id)
+        signals['average_rating'].append(nan if rating is None else rating)
+    return signals
+
+
+def score_risk_signals(signals, use_numpy=None):
+    """
+    Churn risk (0-1) for every patient at once, as the share of warning signs shown
+
+    The four signs are recency (over 60 or 90 days since the last visit),
+    cancellation ratio (over 20% or 30%), a visit gap that grew by half over
+    the last three visits, and an average rating below 3. Signs that cannot
+    be measured for a patient are left out of their share.
+
+    Args:
+        signals (dict): Output of risk_signals()
+        use_numpy (bool): Force or disable the NumPy path; defaults to NumPy when installed
+
+    Returns:
+        list: Risk scores, in the order of the signals
+    """
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy and np is None:
+        raise ImportError('NumPy is not installed')
+    if not use_numpy:
+        return [churn_risk_score(*values) for values in zip(*(signals[field] for field in SIGNAL_FIELDS))]
+
+    days, total, cancelled, recent, older, rating = (
+        np.asarray(signals[field], dtype=float) for field in SIGNAL_FIELDS
+    )
+    risk = np.zeros_like(days)
+    factors = np.zeros_like(days)
+
+    measured = ~np.isnan(days)
+    risk += np.where(measured & (days > 90), 1.0, np.where(measured & (days > 60), 0.5, 0.0))
+    factors += measured
+
+    measured = total > 0
+    ratio = np.divide(cancelled, total, out=np.zeros_like(total), where=measured)
+    risk += np.where(measured & (ratio > 0.3), 1.0, np.where(measured & (ratio > 0.2), 0.5, 0.0))
+    factors += measured
+
+    measured = ~np.isnan(recent)
+    risk += measured & (recent > older * 1.5)
+    factors += measured
+
+    measured = ~np.isnan(rating)
+    risk += measured & (rating < 3.0)
+    factors += measured
+
+    scores = np.minimum(1.0, np.divide(risk, factors, out=np.zeros_like(risk), where=factors > 0))
+    return scores.tolist()
+
+
+def churn_risk_score(days_since_last_visit, total_appointments, cancelled_appointments,
+                     recent_gap, older_gap, average_rating):
+    """
+    Churn risk (0-1) for one patient; NaN marks a signal that cannot be measured
+
+    Returns:
+        float: Risk score between 0 and 1
+    """
+    risk_factors = 0
+    total_factors = 0
+
+    # Factor 1: Time since last visit
+    if not math.isnan(days_since_last_visit):
+        if days_since_last_visit > 90:
+            risk_factors += 1
+        elif days_since_last_visit > 60:
+            risk_factors += 0.5
+        total_factors += 1
+
+    # Factor 2: Cancellation rate
+    if total_appointments > 0:
+        cancellation_rate = cancelled_appointments / total_appointments
+        if cancellation_rate > 0.3:
+            risk_factors += 1
+        elif cancellation_rate > 0.2:
+            risk_factors += 0.5
+        total_factors += 1
+
+    # Factor 3: Visit frequency decline
+    if not math.isnan(recent_gap):
+        if recent_gap > older_gap * 1.5:
+            risk_factors += 1
+        total_factors += 1
+
+    # Factor 4: Low satisfaction
+    if not math.isnan(average_rating):
+        if average_rating < 3.0:
+            risk_factors += 1
+        total_factors += 1
+
+    return min(1.0, risk_factors / total_factors) if total_factors else 0.0
+
+
+def load_risk_signals(patient_ids, today=None):
+    """
+    Read the risk signals for the given patients in three grouped queries
+
+    Returns:
+        dict: Output of risk_signals() for patient_ids
+    """
+    from appointments.models import Appointment, Feedback
+
+    today = today or timezone.now().date()
+    counts = {
+        row['patient_id']: (row['total'], row['cancelled'])
+        for row in Appointment.objects.filter(patient_id__in=patient_ids).values('patient_id').annotate(
+            total=Count('id'),
+            cancelled=Count('id', filter=Q(status='cancelled')),
+        ).order_by()
+    }
+
+    # Only each patient's six newest visits matter
+    completed_dates = defaultdict(list)
+    visits = Appointment.objects.filter(patient_id__in=patient_ids, status='completed').annotate(
+        visit=Window(RowNumber(), partition_by=F('patient_id'), order_by=F('appointment_date').desc())
+    ).filter(visit__lte=6).order_by('patient_id', '-appointment_date').values_list('patient_id', 'appointment_date')
+    for patient_id, day in visits:
+        completed_dates[patient_id].append(day)
+
+    ratings = dict(
+        Feedback.objects.filter(appointment__patient_id__in=patient_ids)
+        .values('appointment__patient_id').annotate(rating=Avg('rating')).order_by()
+        .values_list('appointment__patient_id', 'rating')
+    )
+    return risk_signals(patient_ids, completed_dates, counts, ratings, today)
+
+
+def update_risk_scores(patient_ids, today=None, chunk_size=RISK_CHUNK_SIZE):
+    """
+    Recompute PatientAnalytics.risk_score for the given patients, in bulk
+
+    Returns:
+        int: Number of rows updated
+    """
+    from .models import PatientAnalytics
+
+    written = 0
+    for start in range(0, len(patient_ids), chunk_size):
+        chunk = list(patient_ids[start:start + chunk_size])
+        scores = dict(zip(chunk, score_risk_signals(load_risk_signals(chunk, today))))
+        rows = list(PatientAnalytics.objects.filter(patient_id__in=chunk).only('pk', 'patient_id'))
+        for row in rows:
+            row.risk_score = scores[row.patient_id]
+        PatientAnalytics.objects.bulk_update(rows, ['risk_score'], batch_size=500)
+        written += len(rows)
+    return written
@@ -0,0 +1,249 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db.models import Avg, Count, Q, Sum
+from django.db.models.functions import TruncDate
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Days rebuilt per round of grouped queries during a backfill
+BACKFILL_CHUNK_DAYS = 90
+
+ROLLUP_FIELDS = [
+    'total_appointments', 'completed_appointments', 'cancelled_appointments',
+    'new_patients', 'returning_patients', 'service_revenue', 'product_revenue',
+    'package_revenue', 'total_revenue', 'average_appointment_value',
+    'patient_satisfaction_score', 'updated_at',
+]
+
+
+def _rollup_models():
+    from accounts.models import User
+    from appointments.models import Appointment, Feedback
+    from packages.models import PackageBooking
+    from .models import BusinessAnalytics
+    return Appointment, Feedback, PackageBooking, User, BusinessAnalytics
+
+
+def refresh_business_days(dates):
+    """
+    Recompute the BusinessAnalytics rows for the given days
+
+    Every metric is rebuilt from the source tables with one grouped query per
+    table, so the rows are exact no matter which change triggered the refresh.
+    Revenue is valued at the current service, product and package prices; the
+    signal handlers rebuild the affected days when one of those prices changes.
+
+    Args:
+        dates (iterable): Days to rebuild
+
+    Returns:
+        int: Number of rows written
+    """
+    dates = sorted({day for day in dates if day is not None})
+    if not dates:
+        return 0
+    Appointment, Feedback, PackageBooking, User, BusinessAnalytics = _rollup_models()
+
+    completed = Q(status='completed')
+    appointment_rows = Appointment.objects.filter(appointment_date__in=dates).values('appointment_date').annotate(
+        total=Count('id'),
+        completed=Count('id', filter=completed),
+        cancelled=Count('id', filter=Q(status='cancelled')),
+        patients=Count('patient', distinct=True),
+        service_revenue=Sum('service__price', filter=completed & Q(service__isnull=False)),
+        product_revenue=Sum('product__price', filter=completed & Q(product__isnull=False)),
+    ).order_by()
+    appointments = {row['appointment_date']: row for row in appointment_rows}
+
+    package_revenue = dict(
+        PackageBooking.objects.annotate(day=TruncDate('created_at')).filter(day__in=dates)
+        .values('day').annotate(total=Sum('package__price')).order_by().values_list('day', 'total')
+    )
+    new_patients = dict(
+        User.objects.filter(user_type='patient').annotate(day=TruncDate('created_at')).filter(day__in=dates)
+        .values('day').annotate(total=Count('id')).order_by().values_list('day', 'total')
+    )
+    satisfaction = dict(
+        Feedback.objects.filter(appointment__appointment_date__in=dates)
+        .values('appointment__appointment_date').annotate(score=Avg('rating')).order_by()
+        .values_list('appointment__appointment_date', 'score')
+    )
+
+    rows = []
+    for day in dates:
+        counts = appointments.get(day, {})
+        service_revenue = counts.get('service_revenue') or Decimal('0')
+        product_revenue = counts.get('product_revenue') or Decimal('0')
+        packages = package_revenue.get(day) or Decimal('0')
+        total_revenue = service_revenue + product_revenue + packages
+        completed_count = counts.get('completed', 0)
+        rows.append(BusinessAnalytics(
+            date=day,
+            total_appointments=counts.get('total', 0),
+            completed_appointments=completed_count,
+            cancelled_appointments=counts.get('cancelled', 0),
+            new_patients=new_patients.get(day, 0),
+            returning_patients=counts.get('patients', 0),
+            service_revenue=service_revenue,
+            product_revenue=product_revenue,
+            package_revenue=packages,
+            total_revenue=total_revenue,
+            average_appointment_value=(total_revenue / completed_count) if completed_count else 0,
+            patient_satisfaction_score=satisfaction.get(day) or 0,
+        ))
+
+    BusinessAnalytics.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['date'], update_fields=ROLLUP_FIELDS
+    )
+    return len(rows)
+
+
+def activity_dates(since=None):
+    """
+    Every day that has appointments, package bookings or new patients
+
+    Args:
+        since (date): Only return days on or after this date
+
+    Returns:
+        list: Sorted dates
+    """
+    Appointment, Feedback, PackageBooking, User, BusinessAnalytics = _rollup_models()
+
+    appointments = Appointment.objects.values_list('appointment_date', flat=True)
+    packages = PackageBooking.objects.annotate(day=TruncDate('created_at')).values_list('day', flat=True)
+    patients = User.objects.filter(user_type='patient').annotate(day=TruncDate('created_at')).values_list('day', flat=True)
+    if since:
+        appointments = appointments.filter(appointment_date__gte=since)
+        packages = packages.filter(day__gte=since)
+        patients = patients.filter(day__gte=since)
+
+    days = set(appointments.distinct().order_by())
+    days.update(packages.distinct().order_by())
+    days.update(patients.distinct().order_by())
+    return sorted(day for day in days if day is not None)
+
+
+def backfill_business_analytics(since=None, chunk_days=BACKFILL_CHUNK_DAYS):
+    """
+    Rebuild the rollup for every active day, in chunks of days
+
+    Rows for days that no longer have any activity are removed.
+
+    Args:
+        since (date): Only rebuild days on or after this date
+        chunk_days (int): Days rebuilt per round of grouped queries
+
+    Returns:
+        int: Number of rows written
+    """
+    from .models import BusinessAnalytics
+
+    days = activity_dates(since)
+    stale = BusinessAnalytics.objects.exclude(date__in=days)
+    if since:
+        stale = stale.filter(date__gte=since)
+    stale.delete()
+
+    written = refresh_in_chunks(days, chunk_days)
+    logger.info(f"Rebuilt {written} business analytics rows")
+    return written
+
+
+def refresh_in_chunks(days, chunk_days=BACKFILL_CHUNK_DAYS):
+    """Rebuild many days, chunk_days at a time"""
+    days = sorted(days)
+    return sum(
+        refresh_business_days(days[start:start + chunk_days])
+        for start in range(0, len(days), chunk_days)
+    )
+
+
+def priced_days(service=None, product=None, package=None):
+    """
+    Days whose revenue was computed from a service, product or package price
+
+    Revenue is valued at the current catalogue price, so these days have to be
+    rebuilt when that price changes.
+
+    Args:
+        service (int): Service id
+        product (int): Product id
+        package (int): Package id
+
+    Returns:
+        list: Sorted dates
+    """
+    Appointment, Feedback, PackageBooking, User, BusinessAnalytics = _rollup_models()
+
+    if package is not None:
+        days = PackageBooking.objects.filter(package_id=package).annotate(
+            day=TruncDate('created_at')
+        ).values_list('day', flat=True)
+    else:
+        item = {'service_id': service} if service is not None else {'product_id': product}
+        days = Appointment.objects.filter(status='completed', **item).values_list('appointment_date', flat=True)
+    return sorted(day for day in days.distinct().order_by() if day is not None)
+
+
+def refresh_priced_days(**item):
+    """Rebuild the days that use a changed price; takes the same arguments as priced_days()"""
+    return refresh_in_chunks(priced_days(**item))
+
+
+def read_business_totals(since=None):
+    """
+    Sum the rollup rows, optionally from a start date onwards
+
+    Returns:
+        dict: Summed counts and revenues
+    """
+    from .models import BusinessAnalytics
+
+    rows = BusinessAnalytics.objects.all()
+    if since:
+        rows = rows.filter(date__gte=since)
+    totals = rows.aggregate(
+        total_appointments=Sum('total_appointments'),
+        completed_appointments=Sum('completed_appointments'),
+        cancelled_appointments=Sum('cancelled_appointments'),
+        new_patients=Sum('new_patients'),
+        service_revenue=Sum('service_revenue'),
+        product_revenue=Sum('product_revenue'),
+        package_revenue=Sum('package_revenue'),
+    )
+    return {key: value or 0 for key, value in totals.items()}
+
+
+def read_revenue_trend(daily_since, monthly_since):
+    """
+    Daily and monthly appointment revenue from the rollup
+
+    Args:
+        daily_since (date): First day of the daily series
+        monthly_since (date): First day of the monthly series
+
+    Returns:
+        tuple: (daily, monthly) lists shaped like the old per-appointment queries:
+            [{'day': 'YYYY-MM-DD', 'revenue'}], [{'month': 'YYYY-MM', 'revenue', 'appointments'}]
+    """
+    from .models import BusinessAnalytics
+
+    rows = BusinessAnalytics.objects.filter(
+        date__gte=min(daily_since, monthly_since),
+        completed_appointments__gt=0,
+    ).order_by('date').values_list('date', 'service_revenue', 'product_revenue', 'completed_appointments')
+
+    daily = []
+    monthly = defaultdict(lambda: {'revenue': Decimal('0'), 'appointments': 0})
+    for day, service_revenue, product_revenue, completed_count in rows:
+        revenue = service_revenue + product_revenue
+        if day >= daily_since:
+            daily.append({'day': day.isoformat(), 'revenue': revenue})
+        if day >= monthly_since:
+            month = monthly[day.strftime('%Y-%m')]
+            month['revenue'] += revenue
+            month['appointments'] += completed_count
+
+    return daily, [{'month': month, **values} for month, values in sorted(monthly.items())]
@@ -1,15 +1,63 @@
 from django.db.models import Count, Sum, Avg, Q, F, Case, When, IntegerField
 from django.db.models.functions import TruncMonth, TruncWeek, TruncDay, Extract
+from django.db import connection
 from django.utils import timezone
+from django.utils.functional import cached_property
 from datetime import datetime, timedelta
 from collections import defaultdict
+from functools import wraps
+import logging
 import statistics
+import time
 from accounts.models import User
 from appointments.models import Appointment, Feedback
 from services.models import Service
 from products.models import Product
-from packages.models import Package, PackageBooking
+from packages.models import Package
 from .models import PatientAnalytics, ServiceAnalytics, BusinessAnalytics, TreatmentCorrelation, PatientSegment
+from .ltv import top_patients_by_value
+from .rollups import read_business_totals, read_revenue_trend
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    """Database execute wrapper that counts queries"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def analytics_section(name):
+    """
+    Compute an AnalyticsService section at most once per service instance
+
+    The first call records the section's query count and duration in
+    section_stats. Counts include nested sections computed on the way, e.g.
+    insights includes the overview it builds on.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self):
+            if name in self._sections:
+                return self._sections[name]
+
+            counter = QueryCounter()
+            started = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                value = self._load_section(name, lambda: method(self))
+            elapsed = time.perf_counter() - started
+
+            self._sections[name] = value
+            self.section_stats[name] = {'queries': counter.count, 'seconds': elapsed}
+            logger.debug(f"Analytics section {name}: {counter.count} queries in {elapsed * 1000:.1f} ms")
+            return value
+        return wrapper
+    return decorator
 
 
 class AnalyticsService:
@@ -20,28 +68,64 @@ class AnalyticsService:
         self.last_30_days = self.today - timedelta(days=30)
         self.last_90_days = self.today - timedelta(days=90)
         self.last_year = self.today - timedelta(days=365)
+        self._sections = {}
+        self.section_stats = {}
+    
+    @classmethod
+    def for_request(cls, request):
+        """Get the service shared by everything rendering this request"""
+        attribute = f'_{cls.__name__}'
+        service = getattr(request, attribute, None)
+        if service is None:
+            service = cls()
+            setattr(request, attribute, service)
+        return service
+    
+    @staticmethod
+    def run_all_analytics(sections=None, max_workers=4, time_budget=None):
+        """
+        Rebuild every stored analytics table from one shared data snapshot
+
+        Args:
+            sections (list): Table groups to rebuild (patients, services, business,
+                correlations); all by default
+            max_workers (int): Sections computed in parallel
+            time_budget (float): Seconds after which no new section is started
+
+        Returns:
+            dict: JSON-serialisable timing report
+        """
+        from .snapshot import run_all_analytics
+        return run_all_analytics(sections=sections, max_workers=max_workers, time_budget=time_budget)
+    
+    def _load_section(self, name, compute):
+        """Produce a section's value; subclasses can serve it from elsewhere"""
+        return compute()
+    
+    @cached_property
+    def patients(self):
+        """Patient queryset shared by the sections"""
+        return User.objects.filter(user_type='patient')
     
+    @cached_property
+    def patient_count(self):
+        return self.patients.count()
+    
+    @analytics_section('overview')
     def get_business_overview(self):
-        """Get comprehensive business overview metrics"""
-        total_patients = User.objects.filter(user_type='patient').count()
-        total_appointments = Appointment.objects.count()
-        completed_appointments = Appointment.objects.filter(status='completed').count()
-        cancelled_appointments = Appointment.objects.filter(status='cancelled').count()
-        
-        # Revenue calculations
-        service_revenue = Appointment.objects.filter(
-            status='completed',
-            service__isnull=False
-        ).aggregate(total=Sum('service__price'))['total'] or 0
+        """Get comprehensive business overview metrics from the daily rollup"""
+        totals = read_business_totals()
+        recent = read_business_totals(since=self.last_30_days)
         
-        product_revenue = Appointment.objects.filter(
-            status='completed',
-            product__isnull=False
-        ).aggregate(total=Sum('product__price'))['total'] or 0
+        total_patients = self.patient_count
+        total_appointments = totals['total_appointments']
+        completed_appointments = totals['completed_appointments']
+        cancelled_appointments = totals['cancelled_appointments']
         
-        package_revenue = PackageBooking.objects.aggregate(
-            total=Sum('package__price')
-        )['total'] or 0
+        # Revenue calculations
+        service_revenue = totals['service_revenue']
+        product_revenue = totals['product_revenue']
+        package_revenue = totals['package_revenue']
         
         total_revenue = service_revenue + product_revenue + package_revenue
         
@@ -51,34 +135,17 @@ class AnalyticsService:
         avg_appointment_value = (total_revenue / completed_appointments) if completed_appointments > 0 else 0
         
         # Recent performance (last 30 days)
-        recent_appointments = Appointment.objects.filter(
-            appointment_date__gte=self.last_30_days
-        ).count()
-        
-        recent_revenue = Appointment.objects.filter(
-            status='completed',
-            appointment_date__gte=self.last_30_days
-        ).aggregate(
-            total=Sum(
-                Case(
-                    When(service__isnull=False, then='service__price'),
-                    When(product__isnull=False, then='product__price'),
-                    default=0,
-                    output_field=IntegerField()
-                )
-            )
-        )['total'] or 0
+        recent_appointments = recent['total_appointments']
+        recent_revenue = recent['service_revenue'] + recent['product_revenue']
         
         # Patient growth
-        new_patients_30_days = User.objects.filter(
-            user_type='patient',
-            created_at__gte=self.last_30_days
-        ).count()
+        new_patients_30_days = recent['new_patients']
         
-        active_patients = User.objects.filter(
-            user_type='patient',
-            appointments__appointment_date__gte=self.last_30_days
-        ).distinct().count()
+        # Distinct patients are not additive across days, so this one stays a live count
+        active_patients = Appointment.objects.filter(
+            appointment_date__gte=self.last_30_days,
+            patient__user_type='patient'
+        ).values('patient').distinct().count()
         
         # Calculate pending appointments
         pending_appointments = total_appointments - completed_appointments - cancelled_appointments
@@ -102,42 +169,11 @@ class AnalyticsService:
             'active_patients': active_patients,
         }
     
+    @analytics_section('revenue')
     def get_revenue_analytics(self):
         """Get detailed revenue analytics with trends"""
-        # Daily revenue for last 30 days
-        daily_revenue = Appointment.objects.filter(
-            status='completed',
-            appointment_date__gte=self.last_30_days
-        ).extra(
-            select={'day': "strftime('%%Y-%%m-%%d', appointment_date)"}
-        ).values('day').annotate(
-            revenue=Sum(
-                Case(
-                    When(service__isnull=False, then='service__price'),
-                    When(product__isnull=False, then='product__price'),
-                    default=0,
-                    output_field=IntegerField()
-                )
-            )
-        ).order_by('day')
-        
-        # Monthly revenue for last 12 months
-        monthly_revenue = Appointment.objects.filter(
-            status='completed',
-            appointment_date__gte=self.last_year
-        ).extra(
-            select={'month': "strftime('%%Y-%%m', appointment_date)"}
-        ).values('month').annotate(
-            revenue=Sum(
-                Case(
-                    When(service__isnull=False, then='service__price'),
-                    When(product__isnull=False, then='product__price'),
-                    default=0,
-                    output_field=IntegerField()
-                )
-            ),
-            appointments=Count('id')
-        ).order_by('month')
+        # Daily revenue for last 30 days and monthly revenue for last 12 months
+        daily_revenue, monthly_revenue_list = read_revenue_trend(self.last_30_days, self.last_year)
         
         # Revenue by service category
         category_revenue = Service.objects.values('category__name').annotate(
@@ -146,14 +182,13 @@ class AnalyticsService:
         ).filter(revenue__isnull=False).order_by('-revenue')
         
         # Revenue trends and growth
-        monthly_revenue_list = list(monthly_revenue)
         current_month_revenue = sum([item['revenue'] for item in monthly_revenue_list[-1:]]) if monthly_revenue_list else 0
         previous_month_revenue = sum([item['revenue'] for item in monthly_revenue_list[-2:-1]]) if len(monthly_revenue_list) > 1 else 0
         
         revenue_growth = ((current_month_revenue - previous_month_revenue) / previous_month_revenue * 100) if previous_month_revenue > 0 else 0
         
         return {
-            'daily_revenue': list(daily_revenue),
+            'daily_revenue': daily_revenue,
             'monthly_revenue': monthly_revenue_list,
             'category_revenue': list(category_revenue),
             'revenue_growth': revenue_growth,
@@ -161,6 +196,7 @@ class AnalyticsService:
             'previous_month_revenue': previous_month_revenue,
         }
     
+    @analytics_section('patients')
     def get_patient_analytics(self):
         """Get comprehensive patient analytics"""
         # Patient segments
@@ -168,34 +204,8 @@ class AnalyticsService:
             count=Count('id')
         ).order_by('-count')
         
-        # Patient lifetime value analysis
-        patient_lifetime_values = []
-        for patient in User.objects.filter(user_type='patient'):
-            appointments = Appointment.objects.filter(patient=patient, status='completed')
-            total_spent = sum([
-                app.service.price if app.service else 
-                app.product.price if app.product else 0
-                for app in appointments
-            ])
-            
-            # Add package spending
-            package_spending = PackageBooking.objects.filter(patient=patient).aggregate(
-                total=Sum('package__price')
-            )['total'] or 0
-            
-            total_spent += package_spending
-            
-            patient_lifetime_values.append({
-                'patient': patient,
-                'total_spent': total_spent,
-                'appointment_count': appointments.count(),
-                'first_visit': appointments.order_by('appointment_date').first(),
-                'last_visit': appointments.order_by('-appointment_date').first(),
-                'avg_visit_value': total_spent / appointments.count() if appointments.count() > 0 else 0,
-            })
-        
-        # Sort by total spent
-        patient_lifetime_values.sort(key=lambda x: x['total_spent'], reverse=True)
+        # Patient lifetime value analysis (top 20 by total spent)
+        patient_lifetime_values = top_patients_by_value(20)
         
         # Patient retention analysis
         retention_data = []
@@ -226,7 +236,7 @@ class AnalyticsService:
         
         # Patient demographics
         demographics = {
-            'gender': User.objects.filter(user_type='patient').values('gender').annotate(
+            'gender': self.patients.values('gender').annotate(
                 count=Count('id')
             ).order_by('-count'),
             'age_groups': self._get_age_groups(),
@@ -234,11 +244,12 @@ class AnalyticsService:
         
         return {
             'segments': list(segments),
-            'patient_lifetime_values': patient_lifetime_values[:20],  # Top 20
+            'patient_lifetime_values': patient_lifetime_values,
             'retention_data': retention_data,
             'demographics': demographics,
         }
     
+    @analytics_section('services')
     def get_service_analytics(self):
         """Get comprehensive service performance analytics"""
         # Service performance metrics
@@ -299,6 +310,7 @@ class AnalyticsService:
             'popularity_trends': popularity_trends,
         }
     
+    @analytics_section('correlations')
     def get_treatment_correlations(self):
         """Get treatment correlation analysis"""
         correlations = TreatmentCorrelation.objects.select_related(
@@ -324,6 +336,7 @@ class AnalyticsService:
             'all_correlations': list(correlations[:50]),  # Top 50
         }
     
+    @analytics_section('insights')
     def get_business_insights(self):
         """Generate actionable business insights and recommendations"""
         overview = self.get_business_overview()
@@ -415,7 +428,7 @@ class AnalyticsService:
         """Calculate age groups for patients"""
         age_groups = defaultdict(int)
         
-        for patient in User.objects.filter(user_type='patient', birthday__isnull=False):
+        for patient in self.patients.filter(birthday__isnull=False).only('birthday'):
             if patient.birthday:
                 age = (self.today - patient.birthday).days // 365
                 if age < 25:
@@ -433,6 +446,7 @@ class AnalyticsService:
         
         return dict(age_groups)
     
+    @analytics_section('diagnostics')
     def get_diagnostic_metrics(self):
         """Get diagnostic metrics for business health"""
         overview = self.get_business_overview()
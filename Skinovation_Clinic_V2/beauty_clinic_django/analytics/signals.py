@@ -0,0 +1,148 @@
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from accounts.models import User
+from appointments.availability import to_date
+from appointments.models import Appointment, Feedback
+from packages.models import Package, PackageBooking
+from products.models import Product
+from services.models import Service
+from .cache import (
+    APPOINTMENT_SECTIONS, FEEDBACK_SECTIONS, PACKAGE_SECTIONS, PATIENT_SECTIONS, SEGMENT_SECTIONS,
+    invalidate_sections_on_commit,
+)
+from .correlations import refresh_service_correlations
+from .models import PatientSegment
+from .rollups import refresh_business_days, refresh_priced_days
+
+ROLLUP_FIELDS = ('appointment_date', 'status', 'service_id', 'product_id', 'patient_id')
+
+# Catalogue models whose price is part of the rollup revenue, by priced_days() argument
+PRICED_MODELS = {Service: 'service', Product: 'product', Package: 'package'}
+
+
+def _day(value):
+    try:
+        return to_date(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _local_day(value):
+    return timezone.localtime(value).date() if value else None
+
+
+def _completed_service(state):
+    """(patient_id, service_id) when the snapshot is a completed service appointment"""
+    if state and state[1] == 'completed' and state[2]:
+        return state[4], state[2]
+    return None
+
+
+def _refresh_correlations_on_commit(*states):
+    """Only services whose completed-patient sets may have changed are recomputed"""
+    service_ids = {completed[1] for completed in map(_completed_service, states) if completed}
+    if service_ids:
+        transaction.on_commit(lambda: refresh_service_correlations(service_ids), robust=True)
+        invalidate_sections_on_commit('correlations')
+
+
+def _refresh_on_commit(*days):
+    days = {day for day in days if day}
+    if days:
+        # A failed refresh must never fail the booking that triggered it
+        transaction.on_commit(lambda: refresh_business_days(days), robust=True)
+
+
+@receiver(post_init, sender=Appointment)
+def remember_rollup_fields(sender, instance, **kwargs):
+    """Remember the fields the daily rollup depends on, without loading deferred ones"""
+    instance._rollup_state = tuple(instance.__dict__.get(field) for field in ROLLUP_FIELDS)
+
+
+@receiver(post_save, sender=Appointment)
+def update_rollup_on_appointment_save(sender, instance, created, **kwargs):
+    """Rebuild the affected days, and correlations of services gaining or losing a completed patient"""
+    previous = getattr(instance, '_rollup_state', None)
+    current = tuple(instance.__dict__.get(field) for field in ROLLUP_FIELDS)
+    if created or previous != current:
+        _refresh_on_commit(_day(instance.appointment_date), _day(previous[0]) if previous else None)
+        invalidate_sections_on_commit(*APPOINTMENT_SECTIONS)
+    before = None if created else _completed_service(previous)
+    if before != _completed_service(current):
+        _refresh_correlations_on_commit(None if created else previous, current)
+    instance._rollup_state = current
+
+
+@receiver(post_delete, sender=Appointment)
+def update_rollup_on_appointment_delete(sender, instance, **kwargs):
+    _refresh_on_commit(_day(instance.appointment_date))
+    invalidate_sections_on_commit(*APPOINTMENT_SECTIONS)
+    _refresh_correlations_on_commit(tuple(instance.__dict__.get(field) for field in ROLLUP_FIELDS))
+
+
+@receiver(post_save, sender=Feedback)
+@receiver(post_delete, sender=Feedback)
+def update_rollup_on_feedback(sender, instance, **kwargs):
+    """Patient satisfaction is averaged per appointment day"""
+    day = Appointment.objects.filter(pk=instance.appointment_id).values_list('appointment_date', flat=True).first()
+    _refresh_on_commit(day)
+    invalidate_sections_on_commit(*FEEDBACK_SECTIONS)
+
+
+@receiver(post_save, sender=PackageBooking)
+@receiver(post_delete, sender=PackageBooking)
+def update_rollup_on_package_booking(sender, instance, **kwargs):
+    """Package revenue is counted on the day of the booking"""
+    _refresh_on_commit(_local_day(instance.created_at))
+    invalidate_sections_on_commit(*PACKAGE_SECTIONS)
+
+
+@receiver(post_save, sender=User)
+def update_rollup_on_new_patient(sender, instance, created, **kwargs):
+    if created and instance.user_type == 'patient':
+        _refresh_on_commit(_local_day(instance.created_at))
+        invalidate_sections_on_commit(*PATIENT_SECTIONS)
+
+
+@receiver(post_delete, sender=User)
+def update_rollup_on_patient_delete(sender, instance, **kwargs):
+    if instance.user_type == 'patient':
+        _refresh_on_commit(_local_day(instance.created_at))
+        invalidate_sections_on_commit(*PATIENT_SECTIONS)
+
+
+@receiver(post_save, sender=PatientSegment)
+@receiver(post_delete, sender=PatientSegment)
+def invalidate_segment_sections(sender, instance, **kwargs):
+    invalidate_sections_on_commit(*SEGMENT_SECTIONS)
+
+
+@receiver(post_init, sender=Service)
+@receiver(post_init, sender=Product)
+@receiver(post_init, sender=Package)
+def remember_price(sender, instance, **kwargs):
+    instance._rollup_price = instance.__dict__.get('price')
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Package)
+def update_rollup_on_price_change(sender, instance, created, **kwargs):
+    """Revenue is valued at the current price, so rebuild every day that used the old one"""
+    if not created and getattr(instance, '_rollup_price', None) != instance.price:
+        item = {PRICED_MODELS[sender]: instance.pk}
+        transaction.on_commit(lambda: refresh_priced_days(**item), robust=True)
+    instance._rollup_price = instance.price
+
+
+@receiver(post_save, sender=Service)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Package)
+@receiver(post_delete, sender=Service)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Package)
+def invalidate_catalogue_sections(sender, instance, **kwargs):
+    """Every section shows catalogue names or prices; connected after the rollup refresh so it runs after it"""
+    invalidate_sections_on_commit()
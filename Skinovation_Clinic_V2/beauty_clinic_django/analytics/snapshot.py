@@ -0,0 +1,418 @@
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.db import connection, transaction
+from django.utils import timezone
+from itertools import groupby
+from operator import attrgetter
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0')
+
+# Appointment rows fetched per round trip while the snapshot streams them
+STREAM_CHUNK_SIZE = 2000
+
+# Newest completed visit dates kept per patient; risk_signals() reads six
+RECENT_VISITS = 6
+
+AppointmentRow = namedtuple('AppointmentRow', [
+    'id', 'patient_id', 'service_id', 'product_id', 'status', 'appointment_date', 'created_at',
+    'service_price', 'product_price', 'service_name', 'ratings',
+])
+
+PatientTotals = namedtuple('PatientTotals', [
+    'total', 'completed', 'cancelled', 'visit_spend', 'recent_dates', 'first_visit', 'preferred',
+    'rating_total', 'rating_count',
+])
+
+
+def _new_service():
+    return {'total': 0, 'completed': 0, 'cancelled': 0, 'months': Counter(), 'rating_total': 0, 'rating_count': 0}
+
+
+def _new_day():
+    return {
+        'total': 0, 'completed': 0, 'cancelled': 0, 'patients': 0, 'service_revenue': ZERO,
+        'product_revenue': ZERO, 'package_revenue': ZERO, 'new_patients': 0, 'rating_total': 0, 'rating_count': 0,
+    }
+
+
+def _with_ratings(rows):
+    """One AppointmentRow per appointment, carrying the ratings of all its feedback rows"""
+    current = None
+    for *fields, rating in rows:
+        if current and current.id == fields[0]:
+            current.ratings.append(rating)
+            continue
+        if current:
+            yield current
+        current = AppointmentRow(*fields, ratings=[] if rating is None else [rating])
+    if current:
+        yield current
+
+
+class AnalyticsSnapshot:
+    """
+    Running totals for every analytics table, read from the source tables once
+
+    Appointments are streamed one patient at a time, with their feedback
+    joined in, and folded into per-patient, per-service and per-day totals,
+    so memory grows with patients, services and days rather than with
+    appointments. Feedback arrives in the same statement as its appointment,
+    so the two cannot disagree about which appointments exist.
+    """
+
+    def __init__(self, today=None):
+        from accounts.models import User
+        from appointments.models import Appointment
+        from packages.models import PackageBooking
+        from services.models import Service
+
+        started = time.perf_counter()
+        self.today = today or timezone.now().date()
+        self.patients = dict(User.objects.filter(user_type='patient').order_by('pk').values_list('pk', 'created_at'))
+        self.services = list(Service.objects.order_by('service_name', 'pk').values_list('pk', 'price'))
+        self.patient_totals = {}
+        self.service_totals = defaultdict(_new_service)
+        self.service_patients = defaultdict(set)
+        self.days = defaultdict(_new_day)
+        self.package_spend = defaultdict(lambda: ZERO)
+        self.rows = {'appointments': 0, 'feedback': 0, 'package_bookings': 0}
+
+        rows = Appointment.objects.order_by('patient_id', 'pk').values_list(
+            'id', 'patient_id', 'service_id', 'product_id', 'status', 'appointment_date', 'created_at',
+            'service__price', 'product__price', 'service__service_name', 'feedback__rating',
+        ).iterator(chunk_size=STREAM_CHUNK_SIZE)
+        for patient_id, visits in groupby(_with_ratings(rows), key=attrgetter('patient_id')):
+            self._add_patient(patient_id, list(visits))
+
+        for patient_id, price, created_at in PackageBooking.objects.values_list(
+            'patient_id', 'package__price', 'created_at'
+        ).iterator(chunk_size=STREAM_CHUNK_SIZE):
+            self.package_spend[patient_id] += price or ZERO
+            self.days[self.local_day(created_at)]['package_revenue'] += price or ZERO
+            self.rows['package_bookings'] += 1
+        for created_at in self.patients.values():
+            self.days[self.local_day(created_at)]['new_patients'] += 1
+        self.days.pop(None, None)
+        self.load_seconds = time.perf_counter() - started
+
+    def _add_patient(self, patient_id, visits):
+        """Fold one patient's appointments into the running totals"""
+        completed = [visit for visit in visits if visit.status == 'completed']
+        dates = sorted((visit.appointment_date for visit in completed), reverse=True)
+        preferred = []
+        for visit in sorted(completed, key=attrgetter('created_at'), reverse=True):
+            if visit.service_id and visit.service_name not in preferred and len(preferred) < 5:
+                preferred.append(visit.service_name)
+        ratings = [rating for visit in visits for rating in visit.ratings]
+        visit_spend = ZERO
+        for visit in completed:
+            visit_spend += (visit.service_price if visit.service_id else visit.product_price) or ZERO
+
+        self.patient_totals[patient_id] = PatientTotals(
+            total=len(visits),
+            completed=len(completed),
+            cancelled=sum(1 for visit in visits if visit.status == 'cancelled'),
+            visit_spend=visit_spend,
+            recent_dates=dates[:RECENT_VISITS],
+            first_visit=dates[-1] if dates else None,
+            preferred=preferred,
+            rating_total=sum(ratings),
+            rating_count=len(ratings),
+        )
+        for day in {visit.appointment_date for visit in visits}:
+            self.days[day]['patients'] += 1
+        for visit in completed:
+            if visit.service_id:
+                self.service_patients[visit.service_id].add(patient_id)
+        for visit in visits:
+            self._add_visit(visit)
+        self.rows['appointments'] += len(visits)
+        self.rows['feedback'] += len(ratings)
+
+    def _add_visit(self, visit):
+        day = self.days[visit.appointment_date]
+        day['total'] += 1
+        day['rating_total'] += sum(visit.ratings)
+        day['rating_count'] += len(visit.ratings)
+        if visit.status == 'completed':
+            day['completed'] += 1
+            if visit.service_id:
+                day['service_revenue'] += visit.service_price or ZERO
+            if visit.product_id:
+                day['product_revenue'] += visit.product_price or ZERO
+        elif visit.status == 'cancelled':
+            day['cancelled'] += 1
+
+        if not visit.service_id:
+            return
+        service = self.service_totals[visit.service_id]
+        service['total'] += 1
+        if visit.status == 'completed':
+            service['completed'] += 1
+            service['months'][visit.appointment_date.month] += 1
+            service['rating_total'] += sum(visit.ratings)
+            service['rating_count'] += len(visit.ratings)
+        elif visit.status == 'cancelled':
+            service['cancelled'] += 1
+
+    def counts(self):
+        return {**self.rows, 'patients': len(self.patients), 'services': len(self.services)}
+
+    @staticmethod
+    def local_day(value):
+        return timezone.localtime(value).date() if value else None
+
+
+def compute_patient_tables(snapshot):
+    """
+    PatientAnalytics (including risk scores) and PatientSegment rows for every patient
+
+    Returns:
+        tuple: (PatientAnalytics rows, PatientSegment rows), unsaved
+    """
+    from .models import PatientAnalytics, PatientSegment
+    from .pipeline import segment_for
+    from .risk import risk_signals, score_risk_signals
+
+    empty = PatientTotals(0, 0, 0, ZERO, [], None, [], 0, 0)
+    totals = {patient_id: snapshot.patient_totals.get(patient_id, empty) for patient_id in snapshot.patients}
+    risk_scores = score_risk_signals(risk_signals(
+        list(snapshot.patients),
+        {patient_id: patient.recent_dates for patient_id, patient in totals.items()},
+        {patient_id: (patient.total, patient.cancelled) for patient_id, patient in totals.items()},
+        {
+            patient_id: patient.rating_total / patient.rating_count
+            for patient_id, patient in totals.items() if patient.rating_count
+        },
+        snapshot.today,
+    ))
+
+    now = timezone.now()
+    analytics_rows, segment_rows = [], []
+    for (patient_id, patient), risk_score in zip(totals.items(), risk_scores):
+        total_spent = snapshot.package_spend.get(patient_id, ZERO) + patient.visit_spend
+        last_visit = patient.recent_dates[0] if patient.recent_dates else None
+        frequency = (last_visit - patient.first_visit).days / (patient.completed - 1) if patient.completed > 1 else 0
+        analytics_rows.append(PatientAnalytics(
+            patient_id=patient_id,
+            total_appointments=patient.total,
+            completed_appointments=patient.completed,
+            cancelled_appointments=patient.cancelled,
+            total_spent=total_spent,
+            last_visit=last_visit,
+            average_visit_frequency=frequency,
+            preferred_services=patient.preferred,
+            risk_score=risk_score,
+            updated_at=now,
+        ))
+        segment, score = segment_for(total_spent, patient.completed, risk_score)
+        segment_rows.append(PatientSegment(patient_id=patient_id, segment=segment, segment_score=score, last_updated=now))
+
+    return analytics_rows, segment_rows
+
+
+def write_patient_tables(tables):
+    """Insert or overwrite each patient's rows, keyed on the unique patient column"""
+    from .models import PatientAnalytics, PatientSegment
+    from .pipeline import PATIENT_ANALYTICS_FIELDS, SEGMENT_FIELDS, WRITE_BATCH_SIZE
+
+    analytics_rows, segment_rows = tables
+    with transaction.atomic():
+        PatientAnalytics.objects.bulk_create(
+            analytics_rows, batch_size=WRITE_BATCH_SIZE, update_conflicts=True, unique_fields=['patient'],
+            update_fields=PATIENT_ANALYTICS_FIELDS + ['risk_score'],
+        )
+        PatientSegment.objects.bulk_create(
+            segment_rows, batch_size=WRITE_BATCH_SIZE, update_conflicts=True, unique_fields=['patient'],
+            update_fields=SEGMENT_FIELDS,
+        )
+    return len(analytics_rows)
+
+
+def compute_service_table(snapshot):
+    """
+    ServiceAnalytics rows for every service
+
+    Returns:
+        list: Unsaved ServiceAnalytics rows
+    """
+    from .models import ServiceAnalytics
+
+    totals = {service_id: snapshot.service_totals.get(service_id) or _new_service() for service_id, _ in snapshot.services}
+    ranked = sorted(
+        (service_id for service_id, service in totals.items() if service['completed']),
+        key=lambda service_id: (-totals[service_id]['completed'], service_id),
+    )
+    rank = {service_id: position for position, service_id in enumerate(ranked, start=1)}
+
+    now = timezone.now()
+    rows = []
+    for service_id, price in snapshot.services:
+        service = totals[service_id]
+        rows.append(ServiceAnalytics(
+            service_id=service_id,
+            total_bookings=service['total'],
+            completed_bookings=service['completed'],
+            cancelled_bookings=service['cancelled'],
+            total_revenue=(price or ZERO) * service['completed'],
+            average_rating=service['rating_total'] / service['rating_count'] if service['rating_count'] else 0,
+            popularity_score=1 - (rank[service_id] - 1) / len(snapshot.services) if service_id in rank else 0,
+            seasonal_trends={str(month): service['months'][month] for month in range(1, 13)},
+            updated_at=now,
+        ))
+    return rows
+
+
+def write_service_table(rows):
+    from .models import ServiceAnalytics
+    from .pipeline import SERVICE_ANALYTICS_FIELDS, upsert_rows
+
+    return upsert_rows(ServiceAnalytics, 'service_id', rows, SERVICE_ANALYTICS_FIELDS)
+
+
+def compute_business_table(snapshot):
+    """
+    BusinessAnalytics daily rollup rows for every day with activity
+
+    Returns:
+        list: Unsaved BusinessAnalytics rows, one per day
+    """
+    from .models import BusinessAnalytics
+
+    rows = []
+    for date, day in sorted(snapshot.days.items()):
+        total_revenue = day['service_revenue'] + day['product_revenue'] + day['package_revenue']
+        rows.append(BusinessAnalytics(
+            date=date,
+            total_appointments=day['total'],
+            completed_appointments=day['completed'],
+            cancelled_appointments=day['cancelled'],
+            new_patients=day['new_patients'],
+            returning_patients=day['patients'],
+            service_revenue=day['service_revenue'],
+            product_revenue=day['product_revenue'],
+            package_revenue=day['package_revenue'],
+            total_revenue=total_revenue,
+            average_appointment_value=(total_revenue / day['completed']) if day['completed'] else 0,
+            patient_satisfaction_score=day['rating_total'] / day['rating_count'] if day['rating_count'] else 0,
+        ))
+
+    return rows
+
+
+def write_business_table(rows):
+    """Replace the rollup; days without activity any more are removed"""
+    from .models import BusinessAnalytics
+    from .rollups import ROLLUP_FIELDS
+
+    with transaction.atomic():
+        BusinessAnalytics.objects.exclude(date__in=[row.date for row in rows]).delete()
+        BusinessAnalytics.objects.bulk_create(
+            rows, batch_size=500, update_conflicts=True, unique_fields=['date'], update_fields=ROLLUP_FIELDS
+        )
+    return len(rows)
+
+
+def compute_correlation_table(snapshot):
+    """
+    Correlations between services from the completed appointments in the snapshot
+
+    Returns:
+        list: compute_correlations() rows
+    """
+    from .correlations import compute_correlations
+
+    service_ids = [service_id for service_id, _ in snapshot.services]
+    patients = {service_id: snapshot.service_patients.get(service_id, set()) for service_id in service_ids}
+    return compute_correlations(service_ids, patients)
+
+
+def write_correlation_table(results):
+    from .correlations import write_treatment_correlations
+
+    return write_treatment_correlations(results)
+
+
+# Sections only read the snapshot and write their own tables, so they can run side by side.
+# Each is (compute from the snapshot, write the computed rows).
+SECTIONS = {
+    'patients': (compute_patient_tables, write_patient_tables),
+    'services': (compute_service_table, write_service_table),
+    'business': (compute_business_table, write_business_table),
+    'correlations': (compute_correlation_table, write_correlation_table),
+}
+
+# SQLite allows a single writer, so writes there go one section at a time
+_sqlite_write_lock = threading.Lock()
+
+
+def run_all_analytics(sections=None, max_workers=4, time_budget=None):
+    """
+    Rebuild every analytics table from one shared snapshot
+
+    Sections are computed in parallel threads and write their own tables;
+    on SQLite the writes are serialised. With a time budget, sections that
+    have not started when it runs out are skipped; a section already running
+    is allowed to finish.
+
+    Args:
+        sections (list): Section names to run, all of SECTIONS by default
+        max_workers (int): Sections computed at the same time
+        time_budget (float): Seconds the whole run may take
+
+    Returns:
+        dict: JSON-serialisable timing report
+    """
+    from .cache import invalidate_sections
+
+    started = time.perf_counter()
+    deadline = started + time_budget if time_budget else None
+    names = list(sections or SECTIONS)
+    unknown = set(names) - set(SECTIONS)
+    if unknown:
+        raise ValueError(f"Unknown analytics sections: {', '.join(sorted(unknown))}")
+
+    snapshot = AnalyticsSnapshot()
+    report = {
+        'started_at': timezone.now().isoformat(),
+        'time_budget_seconds': time_budget,
+        'snapshot': {'seconds': round(snapshot.load_seconds, 4), 'rows': snapshot.counts()},
+        'sections': {},
+    }
+
+    def run_section(name):
+        section_started = time.perf_counter()
+        if deadline and section_started >= deadline:
+            return {'status': 'skipped', 'rows': 0, 'seconds': 0}
+        compute, write = SECTIONS[name]
+        try:
+            computed = compute(snapshot)
+            if connection.vendor == 'sqlite':
+                with _sqlite_write_lock:
+                    rows = write(computed)
+            else:
+                rows = write(computed)
+            status = 'completed'
+        except Exception as e:
+            logger.exception(f"Analytics section {name} failed")
+            rows, status = 0, f'failed: {e}'
+        finally:
+            # Each worker thread opened its own connection
+            connection.close()
+        return {'status': status, 'rows': rows, 'seconds': round(time.perf_counter() - section_started, 4)}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for name, result in zip(names, executor.map(run_section, names)):
+            report['sections'][name] = result
+
+    invalidate_sections()
+    report['total_seconds'] = round(time.perf_counter() - started, 4)
+    report['complete'] = all(result['status'] == 'completed' for result in report['sections'].values())
+    report['over_budget'] = bool(time_budget) and report['total_seconds'] > time_budget
+    return report
@@ -0,0 +1,477 @@
+from datetime import date, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from unittest import skipUnless
+from accounts.models import Attendant, User
+from appointments.models import Appointment, Feedback
+from packages.models import Package, PackageBooking
+from products.models import Product
+from services.models import Service, ServiceCategory
+from .cache import CachedAnalyticsService, get_analytics_cache
+from .correlations import (
+    _co_occurrence_numpy, _co_occurrence_python, compute_correlations, np, rebuild_treatment_correlations,
+    verify_treatment_correlations,
+)
+from .ltv import lifetime_value_rows
+from .models import BusinessAnalytics, PatientAnalytics, PatientSegment, ServiceAnalytics, TreatmentCorrelation
+from .patient_stats import PATIENTS_PER_PAGE, patient_stats, patient_stats_page
+from .pipeline import patient_ids_to_refresh, upsert_rows
+from .risk import SIGNAL_FIELDS, churn_risk_score, risk_signals, score_risk_signals
+from .rollups import backfill_business_analytics
+from .services import AnalyticsService
+from .snapshot import SECTIONS, AnalyticsSnapshot
+import math
+import random
+
+
+class PatientStatsTests(TestCase):
+    """Patient lists read their figures from one annotated query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = ServiceCategory.objects.create(name='Facial')
+        cls.service = Service.objects.create(service_name='Facial', duration=60, category=category, price=1000)
+        product = Product.objects.create(product_name='Toner', price=250, stock=10)
+        package = Package.objects.create(package_name='Glow', price=5000, sessions=3, duration_days=90, grace_period_days=7)
+        cls.attendant = Attendant.objects.create(
+            first_name='Attendant', last_name='Test', shift_date=date.today(), shift_time=time(9, 0)
+        )
+        cls.patient = User.objects.create_user('patient', user_type='patient', first_name='Ana', last_name='Santos')
+        for status, days_ago, item in (
+            ('completed', 20, {'service': cls.service}),
+            ('completed', 5, {'product': product}),
+            ('cancelled', 2, {'service': cls.service}),
+        ):
+            Appointment.objects.create(
+                patient=cls.patient, attendant=cls.attendant, status=status, appointment_time=time(10, 0),
+                appointment_date=date.today() - timedelta(days=days_ago), **item
+            )
+        PackageBooking.objects.create(patient=cls.patient, package=package, sessions_remaining=3)
+        PatientSegment.objects.create(patient=cls.patient, segment='frequent')
+
+    def test_figures_match_lifetime_value(self):
+        patient = patient_stats().get(pk=self.patient.pk)
+        self.assertEqual(patient.total_spent, lifetime_value_rows([self.patient.pk])[self.patient.pk]['total_spent'])
+        self.assertEqual(
+            (patient.total_appointments, patient.completed_appointments, patient.cancelled_appointments),
+            (3, 2, 1)
+        )
+        self.assertEqual(patient.last_visit, date.today() - timedelta(days=5))
+        self.assertEqual(patient.current_segment, 'frequent')
+
+    def test_page_queries_do_not_grow_with_patients(self):
+        def page(sort):
+            with CaptureQueriesContext(connection) as queries:
+                context = patient_stats_page(RequestFactory().get('/', {'sort': sort} if sort else {}))
+            return context, len(queries)
+
+        counts = {sort: page(sort)[1] for sort in ('-spent', 'name', None)}
+        for number in range(PATIENTS_PER_PAGE + 5):
+            other = User.objects.create_user(f'patient-{number}', user_type='patient', last_name=f'{number:03d}')
+            Appointment.objects.create(
+                patient=other, attendant=self.attendant, service=self.service, status='completed',
+                appointment_date=date.today() - timedelta(days=1), appointment_time=time(9, 0),
+            )
+        for sort, count in counts.items():
+            context, queries = page(sort)
+            self.assertEqual(queries, count)
+            self.assertEqual(len(context['page_obj']), PATIENTS_PER_PAGE)
+        self.assertEqual(page('-spent')[0]['page_obj'][0], self.patient)
+
+        # The default page is picked from the patient table alone
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(patient_stats_page(RequestFactory().get('/'))['sort'], 'name')
+        self.assertNotIn(f'"{Appointment._meta.db_table}"', queries.captured_queries[1]['sql'])  # After the count
+
+
+class BusinessRollupTests(TestCase):
+    """The daily rollup follows source changes and matches a full backfill"""
+
+    def setUp(self):
+        category = ServiceCategory.objects.create(name='Facial')
+        self.service = Service.objects.create(service_name='Facial', duration=60, category=category, price=1000)
+        self.attendant = Attendant.objects.create(
+            first_name='Attendant', last_name='Test', shift_date=date.today(), shift_time=time(9, 0)
+        )
+        self.patient = User.objects.create_user('patient', user_type='patient')
+        self.day = date.today() - timedelta(days=3)
+
+    def book(self, status='completed'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Appointment.objects.create(
+                patient=self.patient, attendant=self.attendant, service=self.service, status=status,
+                appointment_date=self.day, appointment_time=time(10, 0),
+            )
+
+    def row(self):
+        return BusinessAnalytics.objects.values(
+            'total_appointments', 'completed_appointments', 'cancelled_appointments',
+            'service_revenue', 'total_revenue', 'patient_satisfaction_score',
+        ).get(date=self.day)
+
+    def test_rollup_follows_appointments_and_feedback(self):
+        appointment = self.book()
+        self.book(status='pending')
+        self.assertEqual(
+            (self.row()['total_appointments'], self.row()['completed_appointments'], self.row()['service_revenue']),
+            (2, 1, Decimal('1000'))
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Feedback.objects.create(appointment=appointment, patient=self.patient, rating=4)
+        self.assertEqual(self.row()['patient_satisfaction_score'], 4)
+
+        appointment.status = 'cancelled'
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.save()
+        self.assertEqual(
+            (self.row()['completed_appointments'], self.row()['cancelled_appointments'], self.row()['total_revenue']),
+            (0, 1, Decimal('0'))
+        )
+
+    def test_price_edit_rebuilds_days_that_used_it(self):
+        self.book()
+        self.service.price = 1500
+        with self.captureOnCommitCallbacks(execute=True):
+            self.service.save()
+        self.assertEqual(self.row()['service_revenue'], Decimal('1500'))
+
+    def test_incremental_rows_match_backfill(self):
+        self.book()
+        self.book(status='cancelled')
+        incremental = self.row()
+        BusinessAnalytics.objects.all().delete()
+        backfill_business_analytics()
+        self.assertEqual(self.row(), incremental)
+
+
+class SectionInvalidationTests(TestCase):
+    """Cached dashboard sections are dropped when the data they read changes"""
+
+    def setUp(self):
+        get_analytics_cache().clear()
+        self.patient = User.objects.create_user('patient', user_type='patient')
+
+    def overview(self):
+        return CachedAnalyticsService().get_business_overview()
+
+    def test_new_patients_and_segments_refresh_their_sections(self):
+        self.assertEqual(self.overview()['total_patients'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.create_user('another', user_type='patient')
+        self.assertEqual(self.overview()['total_patients'], 2)
+
+        self.assertEqual(CachedAnalyticsService().get_patient_analytics()['segments'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            PatientSegment.objects.create(patient=self.patient, segment='new')
+        self.assertEqual(
+            CachedAnalyticsService().get_patient_analytics()['segments'], [{'segment': 'new', 'count': 1}]
+        )
+
+    def test_catalogue_edits_refresh_every_section(self):
+        category = ServiceCategory.objects.create(name='Facial')
+        service = Service.objects.create(service_name='Facial', duration=60, category=category, price=1000)
+        names = lambda: [service.service_name for service in CachedAnalyticsService().get_service_analytics()['services']]
+        self.assertEqual(names(), ['Facial'])
+        service.service_name = 'Deep Facial'
+        with self.captureOnCommitCallbacks(execute=True):
+            service.save()
+        self.assertEqual(names(), ['Deep Facial'])
+
+
+class SectionStatsTests(TestCase):
+    """Sections run once per service and record their own query counts"""
+
+    def test_sections_are_memoized_and_counted(self):
+        User.objects.create_user('patient', user_type='patient')
+        service = AnalyticsService()
+        with CaptureQueriesContext(connection) as queries:
+            overview = service.get_business_overview()
+        self.assertEqual(service.section_stats['overview']['queries'], len(queries))
+
+        with self.assertNumQueries(0):
+            self.assertIs(service.get_business_overview(), overview)
+
+        # Sections computed on the way are counted in the section that needed them
+        service = AnalyticsService()
+        with CaptureQueriesContext(connection) as queries:
+            service.get_business_insights()
+        stats = service.section_stats
+        self.assertEqual(stats['insights']['queries'], len(queries))
+        nested = [name for name in stats if name != 'insights']
+        self.assertIn('overview', nested)
+        self.assertGreaterEqual(stats['insights']['queries'], sum(stats[name]['queries'] for name in nested))
+
+    def test_request_shares_one_service(self):
+        request = RequestFactory().get('/')
+        self.assertIs(AnalyticsService.for_request(request), AnalyticsService.for_request(request))
+        self.assertIsNot(AnalyticsService.for_request(request), CachedAnalyticsService.for_request(request))
+
+
+class CorrelationComputationTests(SimpleTestCase):
+    """The NumPy and pure Python co-occurrence paths agree"""
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.service_ids = list(range(1, 13))
+        self.patients = {
+            service_id: {rng.randrange(200) for _ in range(rng.randrange(5, 60))}
+            for service_id in self.service_ids
+        }
+
+    @skipUnless(np is not None, 'NumPy is not installed')
+    def test_numpy_matches_python(self):
+        expected = dict(_co_occurrence_python(self.service_ids, self.patients))
+        # A small block spreads the patients over many matrix products
+        self.assertEqual(_co_occurrence_numpy(self.service_ids, self.patients, block_size=17), expected)
+        self.assertEqual(
+            compute_correlations(self.service_ids, self.patients, use_numpy=True),
+            compute_correlations(self.service_ids, self.patients, use_numpy=False),
+        )
+
+
+class RiskScoreTests(SimpleTestCase):
+    """Churn risk is the share of measurable warning signs, on both scoring paths"""
+
+    def setUp(self):
+        rng = random.Random(11)
+        today = date(2026, 6, 1)
+        self.patient_ids = list(range(300))
+        completed_dates = {
+            patient_id: sorted(
+                (today - timedelta(days=rng.randrange(400)) for _ in range(rng.randrange(8))), reverse=True
+            )
+            for patient_id in self.patient_ids
+        }
+        counts = {}
+        for patient_id in self.patient_ids:
+            total = rng.randrange(12)
+            counts[patient_id] = (total, rng.randrange(total + 1))
+        ratings = {patient_id: rng.choice([1, 2, 2.5, 3, 4, 5]) for patient_id in self.patient_ids[::3]}
+        self.signals = risk_signals(self.patient_ids, completed_dates, counts, ratings, today)
+
+    def test_each_sign_counts_towards_the_share(self):
+        nan = math.nan
+        self.assertEqual(churn_risk_score(nan, 0, 0, nan, nan, nan), 0)
+        self.assertEqual(churn_risk_score(100, 0, 0, nan, nan, nan), 1)
+        self.assertEqual(churn_risk_score(70, 0, 0, nan, nan, nan), 0.5)
+        self.assertEqual(churn_risk_score(10, 4, 1, nan, nan, nan), 0.25)  # 25% cancelled
+        self.assertEqual(churn_risk_score(10, 10, 0, 30, 10, 2), 0.5)  # Growing gap and low rating
+        self.assertEqual(churn_risk_score(10, 10, 0, 12, 10, 4), 0)
+
+    def test_python_path_matches_churn_risk_score(self):
+        expected = [
+            churn_risk_score(*values) for values in zip(*(self.signals[field] for field in SIGNAL_FIELDS))
+        ]
+        self.assertEqual(score_risk_signals(self.signals, use_numpy=False), expected)
+
+    @skipUnless(np is not None, 'NumPy is not installed')
+    def test_numpy_matches_python(self):
+        python_scores = score_risk_signals(self.signals, use_numpy=False)
+        numpy_scores = score_risk_signals(self.signals, use_numpy=True)
+        self.assertEqual(len(numpy_scores), len(self.patient_ids))
+        for numpy_score, python_score in zip(numpy_scores, python_scores):
+            self.assertAlmostEqual(numpy_score, python_score)
+        self.assertGreater(len(set(python_scores)), 5)  # The sample mixes many combinations of signs
+
+
+class CorrelationRefreshTests(TestCase):
+    """Completing appointments keeps stored correlations equal to a full rebuild"""
+
+    def setUp(self):
+        category = ServiceCategory.objects.create(name='Facial')
+        self.services = [
+            Service.objects.create(service_name=name, duration=60, category=category, price=1000)
+            for name in ('Acne', 'Botox', 'Chemical Peel')
+        ]
+        self.attendant = Attendant.objects.create(
+            first_name='Attendant', last_name='Test', shift_date=date.today(), shift_time=time(9, 0)
+        )
+        self.patients = [User.objects.create_user(f'patient-{number}', user_type='patient') for number in range(4)]
+
+    def complete(self, patient, service):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Appointment.objects.create(
+                patient=patient, attendant=self.attendant, service=service, status='completed',
+                appointment_date=date.today() - timedelta(days=1), appointment_time=time(10, 0),
+            )
+
+    def stored(self):
+        return set(TreatmentCorrelation.objects.values_list(
+            'primary_service_id', 'secondary_service_id', 'frequency', 'correlation_strength'
+        ))
+
+    def test_completions_refresh_only_affected_pairs(self):
+        acne, botox, peel = self.services
+        for patient, services in zip(self.patients, ((acne, botox), (acne, botox), (acne, peel), (botox, peel))):
+            for service in services:
+                self.complete(patient, service)
+        incremental = self.stored()
+        self.assertEqual(len(incremental), 3)
+
+        rebuild_treatment_correlations()
+        self.assertEqual(self.stored(), incremental)
+
+        appointment = Appointment.objects.get(patient=self.patients[2], service=peel)
+        appointment.status = 'cancelled'
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.save()
+        self.assertEqual(len(self.stored()), 2)
+        report = verify_treatment_correlations()
+        self.assertEqual((report['missing'], report['unexpected'], report['changed']), ([], [], []))
+
+    def test_verify_command_reports_and_repairs_drift(self):
+        acne, botox, peel = self.services
+        for patient in self.patients[:2]:
+            self.complete(patient, acne)
+            self.complete(patient, botox)
+        self.complete(self.patients[2], peel)
+        self.complete(self.patients[2], acne)
+        TreatmentCorrelation.objects.filter(secondary_service=botox).update(frequency=99)
+
+        with self.assertRaisesMessage(CommandError, '1 treatment correlations drifted'):
+            call_command('verify_treatment_correlations', stdout=StringIO())
+        output = StringIO()
+        call_command('verify_treatment_correlations', repair=True, stdout=output)
+        self.assertIn('Recomputed correlations for 2 services', output.getvalue())
+        output = StringIO()
+        call_command('verify_treatment_correlations', stdout=output)
+        self.assertIn('up to date', output.getvalue())
+
+
+class PopulatePipelineTests(TestCase):
+    """populate_analytics upserts rows and --since only touches changed patients"""
+
+    def setUp(self):
+        category = ServiceCategory.objects.create(name='Facial')
+        self.service = Service.objects.create(service_name='Facial', duration=60, category=category, price=1000)
+        self.attendant = Attendant.objects.create(
+            first_name='Attendant', last_name='Test', shift_date=date.today(), shift_time=time(9, 0)
+        )
+        self.quiet, self.busy = (
+            User.objects.create_user(username, user_type='patient') for username in ('quiet', 'busy')
+        )
+        for patient in (self.quiet, self.busy):
+            self.book(patient)
+        self.long_ago = timezone.now() - timedelta(days=60)
+        User.objects.update(created_at=self.long_ago)
+        Appointment.objects.update(updated_at=self.long_ago)
+
+    def book(self, patient):
+        return Appointment.objects.create(
+            patient=patient, attendant=self.attendant, service=self.service, status='completed',
+            appointment_date=date.today() - timedelta(days=60), appointment_time=time(10, 0),
+        )
+
+    def test_upsert_rows_updates_existing_keys_and_creates_missing(self):
+        existing = PatientAnalytics.objects.create(patient=self.quiet, total_appointments=9)
+        rows = [PatientAnalytics(patient=patient, total_appointments=1) for patient in (self.quiet, self.busy)]
+        self.assertEqual(upsert_rows(PatientAnalytics, 'patient_id', rows, ['total_appointments'], batch_size=1), 2)
+        self.assertEqual(
+            dict(PatientAnalytics.objects.values_list('patient_id', 'total_appointments')),
+            {self.quiet.pk: 1, self.busy.pk: 1}
+        )
+        self.assertEqual(PatientAnalytics.objects.get(patient=self.quiet).pk, existing.pk)
+
+    def test_since_only_refreshes_changed_patients(self):
+        since = date.today() - timedelta(days=7)
+        self.assertEqual(patient_ids_to_refresh(since), [self.quiet.pk, self.busy.pk])  # No rows yet
+
+        call_command('populate_analytics', stdout=StringIO())
+        self.assertEqual(patient_ids_to_refresh(since), [])
+        self.assertEqual(patient_ids_to_refresh(), [self.quiet.pk, self.busy.pk])
+
+        self.book(self.busy)
+        self.assertEqual(patient_ids_to_refresh(since), [self.busy.pk])
+        PatientAnalytics.objects.update(total_appointments=0)
+        call_command('populate_analytics', since=since.isoformat(), stdout=StringIO())
+        self.assertEqual(
+            dict(PatientAnalytics.objects.values_list('patient_id', 'total_appointments')),
+            {self.quiet.pk: 0, self.busy.pk: 2}
+        )
+
+        with self.assertRaises(CommandError):
+            call_command('populate_analytics', since='last week', stdout=StringIO())
+
+
+class SnapshotAnalyticsTests(TestCase):
+    """run_analytics folds streamed appointments into every table and overwrites rows in place"""
+
+    def setUp(self):
+        category = ServiceCategory.objects.create(name='Facial')
+        self.service = Service.objects.create(service_name='Facial', duration=60, category=category, price=1000)
+        self.product = Product.objects.create(product_name='Toner', price=250, stock=10)
+        package = Package.objects.create(package_name='Glow', price=5000, sessions=3, duration_days=90, grace_period_days=7)
+        self.attendant = Attendant.objects.create(
+            first_name='Attendant', last_name='Test', shift_date=date.today(), shift_time=time(9, 0)
+        )
+        self.patient, self.other = (
+            User.objects.create_user(username, user_type='patient') for username in ('patient', 'other')
+        )
+        self.day = date.today() - timedelta(days=10)
+        self.visit = self.book(self.patient, service=self.service)
+        self.book(self.patient, days_ago=40, service=self.service)
+        self.book(self.patient, product=self.product)
+        self.book(self.patient, status='cancelled', service=self.service)
+        self.book(self.other, service=self.service)
+        # Two feedback rows on one appointment must not count it twice
+        Feedback.objects.create(appointment=self.visit, patient=self.patient, rating=5)
+        Feedback.objects.create(appointment=self.visit, patient=self.other, rating=3)
+        PackageBooking.objects.create(patient=self.patient, package=package, sessions_remaining=3)
+
+    def book(self, patient, status='completed', days_ago=10, **item):
+        return Appointment.objects.create(
+            patient=patient, attendant=self.attendant, status=status, appointment_time=time(10, 0),
+            appointment_date=date.today() - timedelta(days=days_ago), **item
+        )
+
+    def run_sections(self):
+        snapshot = AnalyticsSnapshot()
+        for compute, write in SECTIONS.values():
+            write(compute(snapshot))
+        return snapshot
+
+    def test_tables_are_folded_from_streamed_rows(self):
+        snapshot = self.run_sections()
+        self.assertEqual(snapshot.counts()['appointments'], 5)
+        self.assertEqual(snapshot.counts()['feedback'], 2)
+
+        analytics = PatientAnalytics.objects.get(patient=self.patient)
+        self.assertEqual(
+            (analytics.total_appointments, analytics.completed_appointments, analytics.cancelled_appointments),
+            (4, 3, 1)
+        )
+        self.assertEqual(analytics.total_spent, Decimal('7250'))
+        self.assertEqual(analytics.average_visit_frequency, 15)
+        self.assertEqual(analytics.preferred_services, ['Facial'])
+
+        service = ServiceAnalytics.objects.get(service=self.service)
+        self.assertEqual((service.total_bookings, service.completed_bookings, service.average_rating), (4, 3, 4))
+
+        day = BusinessAnalytics.objects.get(date=self.day)
+        self.assertEqual(
+            (day.total_appointments, day.completed_appointments, day.returning_patients, day.patient_satisfaction_score),
+            (4, 3, 2, 4)
+        )
+        self.assertEqual(day.service_revenue + day.product_revenue, Decimal('2250'))
+
+    def test_rerun_overwrites_rows_in_place(self):
+        self.run_sections()
+        pks = dict(PatientAnalytics.objects.values_list('patient_id', 'pk'))
+        segment_pks = dict(PatientSegment.objects.values_list('patient_id', 'pk'))
+
+        self.visit.status = 'cancelled'
+        self.visit.save()
+        self.run_sections()
+        self.assertEqual(dict(PatientAnalytics.objects.values_list('patient_id', 'pk')), pks)
+        self.assertEqual(dict(PatientSegment.objects.values_list('patient_id', 'pk')), segment_pks)
+        self.assertEqual(
+            PatientAnalytics.objects.values_list('completed_appointments', 'cancelled_appointments')
+            .get(patient=self.patient),
+            (2, 2)
+        )
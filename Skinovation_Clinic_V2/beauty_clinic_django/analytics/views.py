@@ -5,6 +5,7 @@ from django.db.models import Count, Sum, Avg, Q
 from django.db.models.functions import TruncMonth, TruncWeek
 from datetime import datetime, timedelta
 from .models import PatientAnalytics, ServiceAnalytics, BusinessAnalytics, TreatmentCorrelation, PatientSegment
+from .patient_stats import patient_stats_page
 from accounts.models import User
 from appointments.models import Appointment
 from services.models import Service
@@ -103,12 +104,11 @@ def patient_analytics(request):
     segment_filter = request.GET.get('segment', '')
     search_query = request.GET.get('search', '')
     
-    # Get patients with analytics
-    patients = User.objects.filter(user_type='patient').prefetch_related('analytics')
+    patients = User.objects.filter(user_type='patient')
     
     # Apply filters
     if segment_filter:
-        patients = patients.filter(segments__segment=segment_filter)
+        patients = patients.filter(pk__in=PatientSegment.objects.filter(segment=segment_filter).values('patient'))
     
     if search_query:
         patients = patients.filter(
@@ -117,29 +117,14 @@ def patient_analytics(request):
             Q(email__icontains=search_query)
         )
     
-    # Calculate analytics for each patient
-    patient_analytics_list = []
-    for patient in patients:
-        appointments = Appointment.objects.filter(patient=patient)
-        analytics_data = {
-            'patient': patient,
-            'total_appointments': appointments.count(),
-            'completed_appointments': appointments.filter(status='completed').count(),
-            'cancelled_appointments': appointments.filter(status='cancelled').count(),
-            'total_spent': sum([app.service.price for app in appointments.filter(status='completed') if app.service]),
-            'last_visit': appointments.filter(status='completed').order_by('-appointment_date').first(),
-            'segment': patient.segments.first().segment if patient.segments.exists() else 'unclassified',
-        }
-        patient_analytics_list.append(analytics_data)
-    
-    # Sort by total spent
-    patient_analytics_list.sort(key=lambda x: x['total_spent'], reverse=True)
-    
-    context = {
-        'patient_analytics': patient_analytics_list,
+    # One annotated query for the page of patients, sorted by ?sort= (highest spend first)
+    context = patient_stats_page(request, patients)
+    context.update({
+        'patient_analytics': context['page_obj'],
         'segment_filter': segment_filter,
+        'segment_choices': PatientSegment.SEGMENT_CHOICES,
         'search_query': search_query,
-    }
+    })
     
     return render(request, 'analytics/patient_analytics.html', context)
 
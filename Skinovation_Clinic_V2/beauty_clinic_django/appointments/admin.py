@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Appointment, Request, CancellationRequest, Feedback, Notification, SMSTemplate, SMSHistory
+from .models import Appointment, Request, CancellationRequest, Feedback, Notification, NotificationRecipient, SMSTemplate, SMSHistory, SMSOutbox, ReminderDelivery
 
 
 @admin.register(Appointment)
@@ -52,6 +52,15 @@ class NotificationAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at',)
 
 
+@admin.register(NotificationRecipient)
+class NotificationRecipientAdmin(admin.ModelAdmin):
+    """Admin for NotificationRecipient model"""
+    list_display = ('notification', 'recipient', 'is_read', 'read_at')
+    list_filter = ('is_read',)
+    search_fields = ('notification__title', 'recipient__first_name', 'recipient__last_name')
+    raw_id_fields = ('notification', 'recipient')
+
+
 @admin.register(SMSTemplate)
 class SMSTemplateAdmin(admin.ModelAdmin):
     """Admin for SMS Template model"""
@@ -105,4 +114,24 @@ class SMSHistoryAdmin(admin.ModelAdmin):
             'fields': ('sent_at', 'formatted_sent_at', 'time_ago'),
             'classes': ('collapse',)
         }),
-    )
\ No newline at end of file
+    )
+
+
+@admin.register(SMSOutbox)
+class SMSOutboxAdmin(admin.ModelAdmin):
+    """Admin for queued outgoing SMS"""
+    list_display = ('phone_number', 'provider', 'status', 'attempts', 'next_attempt_at', 'created_at')
+    list_filter = ('status', 'provider', 'created_at')
+    search_fields = ('phone_number', 'message')
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'sent_at', 'claimed_at', 'claim_token', 'history')
+
+
+@admin.register(ReminderDelivery)
+class ReminderDeliveryAdmin(admin.ModelAdmin):
+    """Admin for the appointment reminder ledger"""
+    list_display = ('appointment', 'reminder_type', 'status', 'attempts', 'sent_at')
+    list_filter = ('reminder_type', 'status', 'sent_at')
+    search_fields = ('appointment__patient__first_name', 'appointment__patient__last_name')
+    ordering = ('-created_at',)
+    readonly_fields = ('created_at', 'sent_at', 'claimed_at', 'claim_token', 'sms_history')
@@ -2,14 +2,29 @@ from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Q, Sum
+from django.core.paginator import Paginator
+from django.db.models import Count, F, Max, Q, Sum
 from django.http import JsonResponse
 from .models import Appointment, Notification
+from .notifications import notify_owners
 from accounts.models import User, Attendant, AttendantProfile
 from services.models import Service, ServiceImage
 from products.models import Product, ProductImage
 from services.utils import send_appointment_sms
 
+# Columns the patient list can be sorted by, as ?sort=<key> or ?sort=-<key>
+PATIENT_SORT_FIELDS = {
+    'id': ['id'],
+    'name': ['last_name', 'first_name'],
+    'appointments': ['total_appointments'],
+    'completed': ['completed_appointments'],
+    'cancelled': ['cancelled_appointments'],
+    'packages': ['packages_count'],
+    'last_visit': ['last_visit'],
+}
+
+PATIENTS_PER_PAGE = 25
+
 def is_admin(user):
     """Check if user is staff/admin"""
     return user.is_authenticated and user.user_type == 'admin'
@@ -104,7 +119,10 @@ def admin_appointments(request):
 @user_passes_test(is_admin)
 def admin_appointment_detail(request, appointment_id):
     """Admin view for appointment details"""
-    appointment = get_object_or_404(Appointment, id=appointment_id)
+    appointment = get_object_or_404(
+        Appointment.objects.select_related('patient', 'attendant', 'service__category', 'product', 'package'),
+        id=appointment_id
+    )
     
     context = {
         'appointment': appointment,
@@ -215,7 +233,7 @@ def admin_reassign_attendant(request, appointment_id):
     if sms_result.get('success'):
         messages.success(
             request,
-            f'Appointment reassigned to {new_attendant.first_name} {new_attendant.last_name}. Patient notified via SMS.'
+            f'Appointment reassigned to {new_attendant.first_name} {new_attendant.last_name}. Patient SMS queued.'
         )
     else:
         messages.warning(
@@ -246,21 +264,17 @@ def admin_confirm_appointment(request, appointment_id):
         )
         
         # Notify owner of appointment confirmation
-        from accounts.models import User as UserModel
-        owner_users = UserModel.objects.filter(user_type='owner', is_active=True)
-        for owner in owner_users:
-            Notification.objects.create(
-                type='confirmation',
-                appointment_id=appointment.id,
-                title='Appointment Confirmed',
-                message=f'Appointment for {appointment.patient.get_full_name()} - {appointment.get_service_name()} on {appointment.appointment_date} at {appointment.appointment_time} has been confirmed.',
-                patient=None  # Owner notification
-            )
+        notify_owners(
+            type='confirmation',
+            appointment_id=appointment.id,
+            title='Appointment Confirmed',
+            message=f'Appointment for {appointment.patient.get_full_name()} - {appointment.get_service_name()} on {appointment.appointment_date} at {appointment.appointment_time} has been confirmed.',
+        )
         
         # Send SMS confirmation
         sms_result = send_appointment_sms(appointment, 'confirmation')
         if sms_result['success']:
-            messages.success(request, f'Appointment for {appointment.patient.full_name} has been confirmed. SMS sent.')
+            messages.success(request, f'Appointment for {appointment.patient.full_name} has been confirmed. SMS queued.')
         else:
             messages.success(request, f'Appointment for {appointment.patient.full_name} has been confirmed. (SMS failed)')
     else:
@@ -313,21 +327,17 @@ def admin_cancel_appointment(request, appointment_id):
         )
         
         # Notify owner of appointment cancellation
-        from accounts.models import User as UserModel
-        owner_users = UserModel.objects.filter(user_type='owner', is_active=True)
-        for owner in owner_users:
-            Notification.objects.create(
-                type='cancellation',
-                appointment_id=appointment.id,
-                title='Appointment Cancelled',
-                message=f'Appointment for {appointment.patient.get_full_name()} - {appointment.get_service_name()} on {appointment.appointment_date} at {appointment.appointment_time} has been cancelled.',
-                patient=None  # Owner notification
-            )
+        notify_owners(
+            type='cancellation',
+            appointment_id=appointment.id,
+            title='Appointment Cancelled',
+            message=f'Appointment for {appointment.patient.get_full_name()} - {appointment.get_service_name()} on {appointment.appointment_date} at {appointment.appointment_time} has been cancelled.',
+        )
         
         # Send SMS cancellation notification
         sms_result = send_appointment_sms(appointment, 'cancellation')
         if sms_result['success']:
-            messages.success(request, f'Appointment for {appointment.patient.full_name} has been cancelled. SMS sent.')
+            messages.success(request, f'Appointment for {appointment.patient.full_name} has been cancelled. SMS queued.')
         else:
             messages.success(request, f'Appointment for {appointment.patient.full_name} has been cancelled. (SMS failed)')
     else:
@@ -363,37 +373,52 @@ def admin_maintenance(request):
 @user_passes_test(is_admin)
 def admin_patients(request):
     """Admin patients management page"""
-    from accounts.models import User
+    search_query = request.GET.get('search', '').strip()
+    sort = request.GET.get('sort', '-id')
+    if sort.lstrip('-') not in PATIENT_SORT_FIELDS:
+        sort = '-id'
+    
+    # Every search word has to match the name, username, email or phone
+    matching = User.objects.filter(user_type='patient')
+    for term in search_query.split():
+        matching = matching.filter(
+            Q(first_name__icontains=term) |
+            Q(last_name__icontains=term) |
+            Q(username__icontains=term) |
+            Q(email__icontains=term) |
+            Q(phone__icontains=term)
+        )
     
-    # Get all patients (non-admin users)
-    patients = User.objects.filter(user_type='patient').order_by('-id')
+    # Every count comes from one grouped query over the page of patients
+    patients = matching.annotate(
+        total_appointments=Count('appointments'),
+        completed_appointments=Count('appointments', filter=Q(appointments__status='completed')),
+        cancelled_appointments=Count('appointments', filter=Q(appointments__status='cancelled')),
+        packages_count=Count('appointments', filter=Q(appointments__package__isnull=False)),
+        last_visit=Max('appointments__appointment_date', filter=Q(appointments__status='completed')),
+    )
     
-    # Get statistics for each patient
-    patient_stats = []
-    for patient in patients:
-        appointments = Appointment.objects.filter(patient=patient)
-        total_appointments = appointments.count()
-        completed_appointments = appointments.filter(status='completed').count()
-        cancelled_appointments = appointments.filter(status='cancelled').count()
-        
-        # Count packages (you might need to adjust this based on your model)
-        packages_count = appointments.filter(package__isnull=False).count()
-        
-        # Get last visit
-        last_visit = appointments.filter(status='completed').order_by('-appointment_date').first()
-        last_visit_date = last_visit.appointment_date if last_visit else None
-        
-        patient_stats.append({
-            'patient': patient,
-            'total_appointments': total_appointments,
-            'completed_appointments': completed_appointments,
-            'cancelled_appointments': cancelled_appointments,
-            'packages_count': packages_count,
-            'last_visit': last_visit_date,
-        })
+    descending = sort.startswith('-')
+    ordering = [
+        F(field).desc(nulls_last=True) if descending else F(field).asc(nulls_last=True)
+        for field in PATIENT_SORT_FIELDS[sort.lstrip('-')]
+    ]
+    patients = patients.order_by(*ordering, '-id')
+    
+    paginator = Paginator(patients, PATIENTS_PER_PAGE)
+    paginator.count = matching.count()  # Counting patients does not need the appointments join
+    page_obj = paginator.get_page(request.GET.get('page'))
+    
+    # Pagination links keep the search and sort
+    query = request.GET.copy()
+    query.pop('page', None)
     
     context = {
-        'patient_stats': patient_stats,
+        'patients': page_obj,
+        'page_obj': page_obj,
+        'search_query': search_query,
+        'sort': sort,
+        'query_string': query.urlencode(),
     }
     
     return render(request, 'appointments/admin_patients.html', context)
@@ -0,0 +1,228 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from django.core.cache import cache
+from django.db.models import Count
+from .models import Appointment, ClosedDay
+
+# Maximum number of patients per attendant per time slot
+SLOT_CAPACITY = 3
+
+# Appointment statuses that occupy a slot
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+# Time slots offered on the booking pages (9 AM to 6 PM, every hour)
+SLOT_TIMES = [
+    '09:00', '10:00', '11:00', '12:00', '13:00', '14:00', '15:00', '16:00', '17:00', '18:00'
+]
+
+# Day indexes are display-only (bookings claim seats through AppointmentSlot), and
+# other processes' caches are not invalidated, so keep them short-lived
+INDEX_TIMEOUT = 60
+SCHEDULE_TIMEOUT = 60 * 5
+VERSION_KEY = 'slot_index:version'
+
+
+def to_date(value):
+    """Normalize a date or ISO date string to a date object"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+
+def to_slot(value):
+    """Normalize a time or 'HH:MM[:SS]' string to an 'HH:MM' slot label"""
+    if isinstance(value, str):
+        return value[:5]
+    return value.strftime('%H:%M')
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(VERSION_KEY, version, None)
+    return version
+
+
+def _day_key(day):
+    return f'slot_index:{_version()}:day:{day.isoformat()}'
+
+
+def _schedule_key():
+    return f'slot_index:{_version()}:schedules'
+
+
+def invalidate_index():
+    """Drop every cached index, e.g. after an attendant's work schedule changes"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+def get_attendant_schedules():
+    """
+    Map each Attendant id to its work schedule
+
+    Attendants are linked to their user account by first and last name. Attendants
+    without a single matching active user or without a profile map to None, which
+    means they are available at any time (backward compatibility).
+
+    Returns:
+        dict: {attendant_id: {'work_days': [...], 'start_time': time, 'end_time': time} or None}
+    """
+    schedules = cache.get(_schedule_key())
+    if schedules is not None:
+        return schedules
+
+    from accounts.models import User, Attendant
+
+    users_by_name = defaultdict(list)
+    attendant_users = User.objects.filter(
+        user_type='attendant', is_active=True
+    ).select_related('attendant_profile')
+    for user in attendant_users:
+        users_by_name[(user.first_name, user.last_name)].append(user)
+
+    schedules = {}
+    for attendant_id, first_name, last_name in Attendant.objects.values_list('id', 'first_name', 'last_name'):
+        matches = users_by_name.get((first_name, last_name), [])
+        profile = getattr(matches[0], 'attendant_profile', None) if len(matches) == 1 else None
+        if profile:
+            schedules[attendant_id] = {
+                'work_days': list(profile.work_days or []),
+                'start_time': profile.start_time,
+                'end_time': profile.end_time,
+            }
+        else:
+            schedules[attendant_id] = None
+
+    cache.set(_schedule_key(), schedules, SCHEDULE_TIMEOUT)
+    return schedules
+
+
+class SlotAvailabilityIndex:
+    """
+    Per-attendant occupancy of every time slot on a single day
+
+    The index is built with one grouped query the first time a day is requested
+    and cached for INDEX_TIMEOUT seconds. The Appointment signal handlers in
+    signals.py drop the day when one of its appointments changes, which only
+    reaches this process's cache; other workers catch up when their copy expires.
+    Capacity is enforced by the AppointmentSlot counters at booking time, so a
+    stale index can only show a slot as free or full for a short while.
+    """
+
+    def __init__(self, day, counts, closed=False, schedules=None):
+        self.day = day
+        self.day_name = day.strftime('%A')
+        self.counts = counts
+        self.closed = closed
+        self.schedules = schedules if schedules is not None else get_attendant_schedules()
+
+    @classmethod
+    def for_date(cls, day):
+        """Get the index for a single day"""
+        return cls.for_range(to_date(day), 1)[0]
+
+    @classmethod
+    def for_range(cls, start, days=7):
+        """
+        Get the indexes for consecutive days, building the missing ones together
+
+        Args:
+            start (date): First day of the range
+            days (int): Number of days in the range
+
+        Returns:
+            list: SlotAvailabilityIndex for each day in order
+        """
+        start = to_date(start)
+        dates = [start + timedelta(days=offset) for offset in range(days)]
+        keys = {day: _day_key(day) for day in dates}
+        cached = cache.get_many(list(keys.values()))
+
+        missing = [day for day in dates if keys[day] not in cached]
+        if missing:
+            built = {day: {'counts': {}, 'closed': False} for day in missing}
+            rows = Appointment.objects.filter(
+                appointment_date__in=missing,
+                status__in=ACTIVE_STATUSES,
+            ).values('appointment_date', 'attendant_id', 'appointment_time').annotate(total=Count('id'))
+            for row in rows:
+                slot = (row['attendant_id'], to_slot(row['appointment_time']))
+                built[row['appointment_date']]['counts'][slot] = row['total']
+            for closed_date in ClosedDay.objects.filter(date__in=missing).values_list('date', flat=True):
+                built[closed_date]['closed'] = True
+
+            cache.set_many({keys[day]: data for day, data in built.items()}, INDEX_TIMEOUT)
+            cached.update({keys[day]: data for day, data in built.items()})
+
+        schedules = get_attendant_schedules()
+        return [
+            cls(day, cached[keys[day]]['counts'], cached[keys[day]]['closed'], schedules)
+            for day in dates
+        ]
+
+    def occupancy(self, attendant_id, slot_time):
+        """Number of active appointments for the attendant at the slot"""
+        return self.counts.get((attendant_id, to_slot(slot_time)), 0)
+
+    def schedule_for(self, attendant_id):
+        """Work schedule of the attendant, or None if unrestricted"""
+        return self.schedules.get(attendant_id)
+
+    def works_at(self, attendant_id, slot_time):
+        """Check the attendant's work days and hours"""
+        schedule = self.schedule_for(attendant_id)
+        if not schedule:
+            return True
+        slot = datetime.strptime(to_slot(slot_time), '%H:%M').time()
+        return (
+            self.day_name in schedule['work_days']
+            and schedule['start_time'] <= slot < schedule['end_time']
+        )
+
+    def has_capacity(self, attendant_id, slot_time):
+        """Check whether the attendant can take another patient at the slot"""
+        return self.occupancy(attendant_id, slot_time) < SLOT_CAPACITY
+
+    def available_attendant_ids(self, slot_time):
+        """Attendants working at the slot that still have capacity"""
+        if self.closed:
+            return []
+        return [
+            attendant_id for attendant_id in self.schedules
+            if self.works_at(attendant_id, slot_time) and self.has_capacity(attendant_id, slot_time)
+        ]
+
+    def working_attendant_ids(self, slot_time):
+        """Attendants working at the slot regardless of capacity"""
+        return [attendant_id for attendant_id in self.schedules if self.works_at(attendant_id, slot_time)]
+
+    def slot_status(self, slot_time, attendant_id=None):
+        """Return 'closed', 'free' or 'full' for the slot"""
+        if self.closed:
+            return 'closed'
+        if attendant_id is not None:
+            available = self.works_at(attendant_id, slot_time) and self.has_capacity(attendant_id, slot_time)
+        else:
+            available = bool(self.available_attendant_ids(slot_time))
+        return 'free' if available else 'full'
+
+    def grid(self, attendant_id=None):
+        """Status of every booking page slot for the day"""
+        return {
+            slot: {
+                'status': self.slot_status(slot, attendant_id),
+                'available_attendants': [] if self.closed else self.available_attendant_ids(slot),
+            }
+            for slot in SLOT_TIMES
+        }
+
+
+def invalidate_day(day):
+    """Drop the cached index for a single day"""
+    cache.delete(_day_key(to_date(day)))
@@ -1,20 +1,14 @@
-from .models import Notification
+from .notifications import unread_count
 
 
 def notification_count(request):
-    """Add notification count to all templates"""
+    """Add notification count to all templates; read from a cached counter"""
     if request.user.is_authenticated:
-        if request.user.user_type == 'admin':
-            # For admin, show all notifications
-            count = Notification.objects.filter(patient__isnull=True).count()
-        else:
-            # For patients, show their notifications
-            count = Notification.objects.filter(patient=request.user, is_read=False).count()
+        # Admins share the counter for notifications without a patient
+        count = unread_count(request.user)
     else:
         count = 0
     
     return {
         'notification_count': count
     }
-
-
@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from services.sms_queue import ProviderThrottle, claim_batch, deliver
+import time
+
+
+def _deliver_in_thread(entry, throttle):
+    """Deliver one message on a worker thread and release its DB connection"""
+    try:
+        return deliver(entry, throttle)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued SMS messages from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'SMS_OUTBOX_WORKERS', 4),
+            help='Number of messages sent in parallel'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Number of messages claimed per round'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait when the outbox is empty'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Deliver the messages that are due now and exit'
+        )
+
+    def handle(self, *args, **options):
+        throttle = ProviderThrottle()
+        totals = {'sent': 0, 'queued': 0, 'failed': 0}
+
+        self.stdout.write(f"Processing SMS outbox with {options['workers']} workers")
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            try:
+                while True:
+                    batch = claim_batch(options['batch_size'])
+                    if not batch:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+
+                    for status in pool.map(lambda entry: _deliver_in_thread(entry, throttle), batch):
+                        totals[status] += 1
+            except KeyboardInterrupt:
+                self.stdout.write(self.style.WARNING('Stopping SMS outbox worker'))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"SMS outbox processed. Sent: {totals['sent']}, "
+                f"Retrying: {totals['queued']}, Failed: {totals['failed']}"
+            )
+        )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from appointments.notifications import UNREAD_TIMEOUT, reconcile_unread_counts
+
+
+class Command(BaseCommand):
+    help = 'Recount the cached unread notification counters from the notifications table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of counters written to the cache at a time'
+        )
+
+    def handle(self, *args, **options):
+        written = reconcile_unread_counts(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciled {written} unread counters (they also expire every {UNREAD_TIMEOUT} seconds)'
+        ))
@@ -1,52 +1,172 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from datetime import timedelta
-from appointments.models import Appointment
-from services.utils import send_appointment_sms
+from appointments.models import SMSHistory, ReminderDelivery
+from appointments.reminders import REMINDER_WINDOWS, claim, eligible_appointments
+from services.sms_queue import DEFAULT_PROVIDER, ProviderThrottle
+from services.sms_service import sms_service
+from services.template_service import template_service
+import time
+
 
 class Command(BaseCommand):
-    help = 'Send SMS reminders for appointments scheduled for tomorrow'
+    help = 'Send SMS reminders for upcoming appointments (24 hours and 2 hours before)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window',
+            choices=sorted(REMINDER_WINDOWS),
+            action='append',
+            help='Reminder window to process; repeat for several (default: all windows)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=getattr(settings, 'SMS_OUTBOX_WORKERS', 4),
+            help='Number of reminders sent in parallel'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            default=getattr(settings, 'SMS_PROVIDER_RATE_LIMITS', {}).get(DEFAULT_PROVIDER),
+            help='Maximum reminders per second (default: the provider rate limit)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help='Number of reminders claimed and sent together'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Render the reminders without sending them or touching the ledger'
+        )
 
     def handle(self, *args, **options):
-        # Get tomorrow's date
-        tomorrow = timezone.now().date() + timedelta(days=1)
-        
-        # Get confirmed appointments for tomorrow
-        appointments = Appointment.objects.filter(
-            appointment_date=tomorrow,
-            status='confirmed'
-        )
-        
-        sent_count = 0
-        failed_count = 0
-        
-        for appointment in appointments:
-            if appointment.patient.phone:
-                sms_result = send_appointment_sms(appointment, 'reminder')
-                if sms_result['success']:
-                    sent_count += 1
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f'Reminder sent to {appointment.patient.full_name} for {appointment.appointment_date}'
-                        )
-                    )
-                else:
-                    failed_count += 1
-                    self.stdout.write(
-                        self.style.ERROR(
-                            f'Failed to send reminder to {appointment.patient.full_name}: {sms_result.get("error", "Unknown error")}'
-                        )
+        started = time.monotonic()
+
+        template = template_service.get_template('reminder')
+        if not template:
+            self.stdout.write(self.style.ERROR('No active reminder template found'))
+            return
+
+        throttle = ProviderThrottle({DEFAULT_PROVIDER: options['rate']})
+        totals = {'sent': 0, 'failed': 0, 'skipped': 0}
+
+        for reminder_type in options['window'] or sorted(REMINDER_WINDOWS):
+            # Stream the eligible set so memory stays flat on busy days
+            appointments = eligible_appointments(reminder_type).iterator(chunk_size=options['batch_size'])
+            batch = []
+            for appointment in appointments:
+                if not appointment.patient.phone:
+                    totals['skipped'] += 1
+                    self.stdout.write(self.style.WARNING(f'No phone number for {appointment.patient.full_name}'))
+                    continue
+                batch.append(appointment)
+                if len(batch) >= options['batch_size']:
+                    self.process_batch(batch, reminder_type, template, throttle, totals, options)
+                    batch = []
+            if batch:
+                self.process_batch(batch, reminder_type, template, throttle, totals, options)
+
+        elapsed = time.monotonic() - started
+        processed = totals['sent'] + totals['failed']
+        throughput = processed / elapsed if elapsed else 0
+
+        if options['dry_run']:
+            self.stdout.write(
+                self.style.SUCCESS(f"Dry run completed. Would send: {totals['sent']}, Skipped: {totals['skipped']}")
+            )
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Reminder sending completed. Sent: {totals['sent']}, Failed: {totals['failed']}, "
+                f"Skipped: {totals['skipped']} in {elapsed:.1f}s ({throughput:.1f} messages/s)"
+            )
+        )
+
+    def process_batch(self, appointments, reminder_type, template, throttle, totals, options):
+        """Claim, render, send and record one batch of reminders"""
+        if options['dry_run']:
+            for appointment, message in self.build_reminders(appointments, template):
+                self.stdout.write(f'[dry run] {reminder_type} {appointment.patient.phone}: {message}')
+                totals['sent'] += 1
+            return
+
+        # Reminders already claimed by an overlapping run are left to that run
+        deliveries = claim(appointments, reminder_type)
+        reminders = self.build_reminders(
+            [appointment for appointment in appointments if appointment.pk in deliveries], template
+        )
+        results = self.dispatch(reminders, options['concurrency'], throttle)
+        self.record(reminders, results, template, deliveries, totals)
+
+    def build_reminders(self, appointments, template):
+        """Render every reminder of a batch up front"""
+        return [
+            (appointment, template_service.build_appointment_message(appointment, 'reminder', template=template)[1])
+            for appointment in appointments
+        ]
+
+    def dispatch(self, reminders, concurrency, throttle):
+        """Send the rendered reminders on a worker pool; results keep the input order"""
+        sender_id = getattr(settings, 'SMS_SENDER_ID', 'BEAUTY')
+
+        def send(reminder):
+            appointment, message = reminder
+            throttle.wait(DEFAULT_PROVIDER)
+            try:
+                result = sms_service.send_sms(appointment.patient.phone, message, sender_id)
+            except Exception as e:
+                return {'success': False, 'error': str(e)}
+            # record() reads every result as a dict; an empty one must still settle the ledger row
+            return result or {'success': False, 'error': 'No response from SMS provider'}
+
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+            return list(pool.map(send, reminders))
+
+    def record(self, reminders, results, template, deliveries, totals):
+        """Write SMS history and settle the ledger rows of a batch"""
+        history = []
+        for (appointment, message), result in zip(reminders, results):
+            if result.get('success'):
+                totals['sent'] += 1
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f'Reminder sent to {appointment.patient.full_name} for {appointment.appointment_date}'
                     )
+                )
             else:
-                failed_count += 1
+                totals['failed'] += 1
                 self.stdout.write(
-                    self.style.WARNING(
-                        f'No phone number for {appointment.patient.full_name}'
+                    self.style.ERROR(
+                        f'Failed to send reminder to {appointment.patient.full_name}: {result.get("error", "Unknown error")}'
                     )
                 )
-        
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'Reminder sending completed. Sent: {sent_count}, Failed: {failed_count}'
-            )
+            history.append(SMSHistory(
+                sender=appointment.patient,
+                phone_number=appointment.patient.phone,
+                message=message,
+                template_used=template,
+                status='sent' if result.get('success') else 'failed',
+                message_id=result.get('message_id'),
+                api_response=result,
+            ))
+        history = SMSHistory.objects.bulk_create(history, batch_size=500)
+
+        now = timezone.now()
+        settled = []
+        for (appointment, _), result, entry in zip(reminders, results, history):
+            delivery = deliveries[appointment.pk]
+            delivery.status = 'sent' if result.get('success') else 'failed'
+            delivery.sent_at = now if result.get('success') else None
+            delivery.last_error = None if result.get('success') else result.get('error', 'Unknown error')
+            delivery.sms_history_id = entry.pk
+            delivery.claim_token = None
+            settled.append(delivery)
+        ReminderDelivery.objects.bulk_update(
+            settled, ['status', 'sent_at', 'last_error', 'sms_history', 'claim_token'], batch_size=500
         )
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_slot_counters(apps, schema_editor):
+    Appointment = apps.get_model('appointments', 'Appointment')
+    AppointmentSlot = apps.get_model('appointments', 'AppointmentSlot')
+    rows = Appointment.objects.filter(
+        status__in=['pending', 'confirmed']
+    ).values('attendant_id', 'appointment_date', 'appointment_time').annotate(booked=Count('id'))
+    AppointmentSlot.objects.bulk_create(
+        [AppointmentSlot(**row) for row in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_attendantleaverequest'),
+        ('appointments', '0011_historylog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appointment_date', models.DateField()),
+                ('appointment_time', models.TimeField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('attendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='accounts.attendant')),
+            ],
+            options={
+                'db_table': 'appointment_slots',
+                'unique_together': {('attendant', 'appointment_date', 'appointment_time')},
+            },
+        ),
+        migrations.RunPython(populate_slot_counters, migrations.RunPython.noop),
+    ]
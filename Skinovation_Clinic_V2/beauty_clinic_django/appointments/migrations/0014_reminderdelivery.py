@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0013_smsoutbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reminder_type', models.CharField(choices=[('24h', '24 hours before'), ('2h', '2 hours before')], max_length=10)),
+                ('status', models.CharField(choices=[('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='sending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('claim_token', models.CharField(blank=True, max_length=32, null=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='appointments.appointment')),
+                ('sms_history', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reminders', to='appointments.smshistory')),
+            ],
+            options={
+                'db_table': 'reminder_deliveries',
+                'ordering': ['-created_at'],
+                'unique_together': {('appointment', 'reminder_type')},
+            },
+        ),
+    ]
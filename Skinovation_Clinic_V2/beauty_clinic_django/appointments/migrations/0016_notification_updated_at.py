@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def stamp_existing(apps, schema_editor):
+    """Existing notifications last changed when they were created, as far as anyone knows"""
+    Notification = apps.get_model('appointments', 'Notification')
+    Notification.objects.update(updated_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0015_notificationrecipient'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(stamp_existing, migrations.RunPython.noop),
+    ]
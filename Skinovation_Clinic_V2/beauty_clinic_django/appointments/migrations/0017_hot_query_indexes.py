@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0016_notification_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['appointment_date', 'appointment_time', 'attendant', 'status'], name='appt_slot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['attendant', 'appointment_date', 'appointment_time'], name='appt_attendant_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'status', 'appointment_date'], name='appt_patient_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('product__isnull', True)), fields=['status'], name='appt_booking_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('product__isnull', False)), fields=['-appointment_date', '-appointment_time'], name='appt_preorder_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historylog',
+            index=models.Index(fields=['-timestamp'], name='history_logs_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historylog',
+            index=models.Index(fields=['item_type', '-timestamp'], name='history_logs_item_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['patient', 'is_read', 'created_at'], name='notif_patient_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='smshistory',
+            index=models.Index(fields=['sender', '-sent_at'], name='sms_history_sender_idx'),
+        ),
+    ]
@@ -41,6 +41,22 @@ class Appointment(models.Model):
     class Meta:
         db_table = 'appointments'
         ordering = ['-created_at']
+        indexes = [
+            # Slot checks and the availability index: date, time, attendant and status.
+            # Read backwards, it also serves appointment lists, newest first
+            models.Index(fields=['appointment_date', 'appointment_time', 'attendant', 'status'], name='appt_slot_idx'),
+            # Attendant dashboards and schedules
+            models.Index(fields=['attendant', 'appointment_date', 'appointment_time'], name='appt_attendant_date_idx'),
+            # Patient history and spend
+            models.Index(fields=['patient', 'status', 'appointment_date'], name='appt_patient_status_idx'),
+            # Admin dashboard counts of bookings that are not pre-orders, by status
+            models.Index(fields=['status'], condition=models.Q(product__isnull=True), name='appt_booking_status_idx'),
+            # Pre-order lists, newest first
+            models.Index(
+                fields=['-appointment_date', '-appointment_time'], condition=models.Q(product__isnull=False),
+                name='appt_preorder_date_idx',
+            ),
+        ]
     
     def __str__(self):
         return f"Appointment {self.id} - {self.patient.get_full_name()}"
@@ -56,6 +72,26 @@ class Appointment(models.Model):
         else:
             return "No service assigned"
 
+class AppointmentSlot(models.Model):
+    """
+    Booked-seat counter for one attendant time slot.
+
+    Bookings claim a seat with a conditional UPDATE on this row inside the booking
+    transaction, so the slot capacity holds under concurrent requests while bookings
+    for other slots never wait on each other.
+    """
+    attendant = models.ForeignKey('accounts.Attendant', on_delete=models.CASCADE, related_name='slots')
+    appointment_date = models.DateField()
+    appointment_time = models.TimeField()
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'appointment_slots'
+        unique_together = ['attendant', 'appointment_date', 'appointment_time']
+
+    def __str__(self):
+        return f"Slot {self.appointment_date} {self.appointment_time} - {self.booked} booked"
+
 class CancellationRequest(models.Model):
     """Cancellation request model"""
     APPOINTMENT_TYPE_CHOICES = [
@@ -146,6 +182,7 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     archived = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Bulk updates must set it too; the sync API reads it
     
     # Foreign Keys
     patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications', blank=True, null=True)
@@ -153,10 +190,37 @@ class Notification(models.Model):
     class Meta:
         db_table = 'notifications'
         ordering = ['-created_at']
+        indexes = [
+            # Unread counts and a user's newest notifications
+            models.Index(fields=['patient', 'is_read', 'created_at'], name='notif_patient_unread_idx'),
+        ]
     
     def __str__(self):
         return f"Notification {self.id} - {self.title}"
 
+class NotificationRecipient(models.Model):
+    """
+    Delivery and read state of a shared notification for one recipient.
+
+    A notification sent to several users (e.g. every owner) is stored once, with
+    patient left empty, and gets one of these rows per recipient. Each recipient
+    reads and marks their own copy without touching the others'.
+    """
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='deliveries')
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notification_deliveries')
+    is_read = models.BooleanField(default=False)
+    read_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'notification_recipients'
+        unique_together = ['recipient', 'notification']
+        indexes = [
+            models.Index(fields=['recipient', 'is_read'], name='notif_recipient_unread_idx'),
+        ]
+
+    def __str__(self):
+        return f"Notification {self.notification_id} for user {self.recipient_id}"
+
 class Request(models.Model):
     """Request model"""
     TYPE_CHOICES = [
@@ -313,6 +377,9 @@ class SMSHistory(models.Model):
         ordering = ['-sent_at']
         verbose_name = 'SMS History'
         verbose_name_plural = 'SMS Histories'
+        indexes = [
+            models.Index(fields=['sender', '-sent_at'], name='sms_history_sender_idx'),
+        ]
     
     def __str__(self):
         return f"SMS to {self.phone_number} - {self.sent_at.strftime('%Y-%m-%d %H:%M')}"
@@ -339,6 +406,74 @@ class SMSHistory(models.Model):
         else:
             return "Just now"
 
+class SMSOutbox(models.Model):
+    """Outgoing SMS waiting to be delivered by the process_sms_outbox worker"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    provider = models.CharField(max_length=20, default='iprog')
+    phone_number = models.CharField(max_length=15)
+    message = models.TextField()
+    sender = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='queued_sms')
+    template_used = models.ForeignKey(SMSTemplate, on_delete=models.SET_NULL, null=True, blank=True, related_name='queued_messages')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True, null=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    history = models.ForeignKey(SMSHistory, on_delete=models.SET_NULL, null=True, blank=True, related_name='outbox_entries')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        db_table = 'sms_outbox'
+        ordering = ['created_at']
+        verbose_name = 'SMS Outbox'
+        verbose_name_plural = 'SMS Outbox'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='sms_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"SMS to {self.phone_number} ({self.get_status_display()})"
+
+class ReminderDelivery(models.Model):
+    """Ledger of appointment reminders, one row per appointment and reminder window"""
+    REMINDER_TYPE_CHOICES = [
+        ('24h', '24 hours before'),
+        ('2h', '2 hours before'),
+    ]
+    STATUS_CHOICES = [
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='reminders')
+    reminder_type = models.CharField(max_length=10, choices=REMINDER_TYPE_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='sending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claim_token = models.CharField(max_length=32, blank=True, null=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    sms_history = models.ForeignKey(SMSHistory, on_delete=models.SET_NULL, null=True, blank=True, related_name='reminders')
+    sent_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'reminder_deliveries'
+        unique_together = ['appointment', 'reminder_type']
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.get_reminder_type_display()} reminder for appointment {self.appointment_id} ({self.status})"
+
 class HistoryLog(models.Model):
     """Model to track history of add/edit/archive actions for services, products, and packages"""
     ACTION_CHOICES = [
@@ -366,6 +501,10 @@ class HistoryLog(models.Model):
         ordering = ['-timestamp']
         verbose_name = 'History Log'
         verbose_name_plural = 'History Logs'
+        indexes = [
+            models.Index(fields=['-timestamp'], name='history_logs_time_idx'),
+            models.Index(fields=['item_type', '-timestamp'], name='history_logs_item_time_idx'),
+        ]
     
     def __str__(self):
         return f"{self.get_action_type_display()} {self.get_item_type_display()} - {self.item_name} by {self.performed_by.get_full_name() if self.performed_by else 'System'}"
\ No newline at end of file
@@ -0,0 +1,104 @@
+from collections import defaultdict
+from django.conf import settings
+from django.utils.module_loading import import_string
+import asyncio
+import threading
+
+DEFAULT_BROKER = 'appointments.notification_broker.LocalNotificationBroker'
+
+_broker = None
+
+
+class Subscription:
+    """One waiting request's interest in an unread counter"""
+
+    def __init__(self, broker, owner):
+        self.broker = broker
+        self.owner = owner
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def notify(self):
+        """Wake the waiting request; safe to call from any thread"""
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            pass  # The request's event loop has already closed
+
+    async def wait(self, timeout):
+        """
+        Wait for a publish to this subscription's owner
+
+        Returns:
+            bool: True when woken by a publish, False when the timeout passed
+        """
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.event.clear()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class LocalNotificationBroker:
+    """
+    In-process pub/sub between notification writes and waiting stream requests
+
+    Owners are the unread counter owners of notifications.py: a user id, or
+    STAFF for the admins' shared feed. Publishing only reaches requests served
+    by the same process; run a single ASGI worker, or set NOTIFICATION_BROKER to
+    a broker with the same methods backed by a shared channel (e.g. Redis
+    pub/sub). Waiting requests also recheck the table when they time out, so a
+    missed publish only delays an update.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, owner):
+        """Start listening for an owner; call from the waiting request's event loop"""
+        subscription = Subscription(self, owner)
+        with self._lock:
+            self._subscriptions[owner].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.owner)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.owner]
+
+    def publish(self, owner):
+        """Wake every request waiting on an owner's notifications"""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(owner, ()))
+        for subscription in subscriptions:
+            subscription.notify()
+
+    def publish_all(self):
+        """Wake every waiting request, e.g. after a bulk change"""
+        with self._lock:
+            subscriptions = [subscription for group in self._subscriptions.values() for subscription in group]
+        for subscription in subscriptions:
+            subscription.notify()
+
+
+def get_broker():
+    """The process's broker, built from settings.NOTIFICATION_BROKER"""
+    global _broker
+    if _broker is None:
+        _broker = import_string(getattr(settings, 'NOTIFICATION_BROKER', DEFAULT_BROKER))()
+    return _broker
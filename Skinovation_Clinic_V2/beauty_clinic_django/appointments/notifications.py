@@ -0,0 +1,466 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from .models import Notification, NotificationRecipient
+from .notification_broker import get_broker
+import time
+
+# Rows per INSERT when fanning a notification out
+FANOUT_BATCH_SIZE = 500
+
+# Cached unread counters are recounted from the table at least this often. Changes
+# only adjust the counters in the cache of the process that made them, so with a
+# per-process cache this is how long other processes may show a stale badge.
+UNREAD_TIMEOUT = 60
+UNREAD_VERSION_KEY = 'notifications:unread:version'
+
+# Counter for notifications without a patient, which admins read as a shared feed
+STAFF = 'staff'
+
+SYNC_PAGE_SIZE = 50  # Notifications a sync response carries at most
+SYNC_OVERLAP = timedelta(seconds=5)  # Changes stamped this long before a sync are sent again, in case they committed late
+
+STREAM_TIMEOUT = 25  # Seconds a stream request waits for changes, below common proxy timeouts
+STREAM_BATCH_SIZE = 20  # Newest notifications a stream response carries at most
+
+
+def notify(recipient_ids, **fields):
+    """
+    Send one notification to several users
+
+    The message is stored once, with patient left empty so staff still see it
+    in their feed, and each recipient gets a NotificationRecipient row holding
+    their own read state.
+
+    Args:
+        recipient_ids (iterable): Users to deliver to
+        **fields: Notification fields (type, title, message, appointment_id)
+
+    Returns:
+        Notification: The stored message, or None when there are no recipients
+    """
+    recipient_ids = list(dict.fromkeys(recipient_ids))
+    if not recipient_ids:
+        return None
+
+    with transaction.atomic():
+        notification = Notification.objects.create(patient=None, **fields)
+        NotificationRecipient.objects.bulk_create(
+            [NotificationRecipient(notification=notification, recipient_id=user_id) for user_id in recipient_ids],
+            batch_size=FANOUT_BATCH_SIZE,
+        )
+        for user_id in recipient_ids:
+            adjust_unread(user_id, 1)
+    return notification
+
+
+def notify_owners(**fields):
+    """Send one notification to every active owner; see notify()"""
+    from accounts.models import User
+
+    owners = User.objects.filter(user_type='owner', is_active=True).values_list('pk', flat=True)
+    return notify(owners, **fields)
+
+
+def recent_notifications(user, limit=10):
+    """
+    Newest notifications addressed to a user, sent directly or fanned out
+
+    Fanned-out notifications carry the user's own read state in is_read, so
+    the returned objects are for display only and must not be saved.
+
+    Returns:
+        list: Notification objects, newest first
+    """
+    direct = list(Notification.objects.filter(patient=user).order_by('-created_at', '-pk')[:limit])
+    deliveries = NotificationRecipient.objects.filter(recipient=user).select_related('notification').order_by(
+        '-notification_id'
+    )[:limit]
+    for delivery in deliveries:
+        notification = delivery.notification
+        notification.is_read = delivery.is_read
+        direct.append(notification)
+    direct.sort(key=lambda notification: (notification.created_at, notification.pk), reverse=True)
+    return direct[:limit]
+
+
+def _unread_version():
+    version = cache.get(UNREAD_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(UNREAD_VERSION_KEY, version, None)
+    return version
+
+
+def _unread_key(owner):
+    return f'notifications:unread:{_unread_version()}:{owner}'
+
+
+def _counter_owner(user):
+    return STAFF if user.user_type == 'admin' else user.pk
+
+
+def count_unread(owner):
+    """Count a user's unread notifications (or the STAFF feed's) in the table"""
+    if owner == STAFF:
+        return Notification.objects.filter(patient__isnull=True, is_read=False).count()
+    return (
+        Notification.objects.filter(patient=owner, is_read=False).count()
+        + NotificationRecipient.objects.filter(recipient=owner, is_read=False).count()
+    )
+
+
+def unread_count(user):
+    """
+    Unread notifications for a user, sent directly or fanned out
+
+    Read from a cached counter, so a page view costs no queries once the
+    counter exists. Admins share the STAFF counter for notifications without
+    a patient. Counters are recounted when missing and expire after
+    UNREAD_TIMEOUT, which reconciles any drift with the table. Counters are
+    exact across processes only when the default cache is shared (Redis,
+    memcached); with the per-process LocMemCache, a badge in another process
+    can lag by up to UNREAD_TIMEOUT.
+
+    Returns:
+        int: Number of unread notifications
+    """
+    owner = _counter_owner(user)
+    key = _unread_key(owner)
+    count = cache.get(key)
+    if count is None:
+        count = count_unread(owner)
+        cache.add(key, count, UNREAD_TIMEOUT)
+    return max(count, 0)
+
+
+def _feed_key(owner):
+    return f'notifications:feed:{_unread_version()}:{owner}'
+
+
+def feed_version(owner):
+    """
+    Cached version of a user's (or the STAFF) notification feed
+
+    It changes whenever a notification in the feed is created, read, unread or
+    deleted. Changes only bump the version in the cache of the process that
+    made them, so versions also expire after UNREAD_TIMEOUT: a change made in
+    another process is then sent with the next sync, because the clients'
+    cursors and ETags no longer match. A lost or expired version restarts from
+    the clock, so it never repeats one a client may still hold.
+    """
+    key = _feed_key(owner)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(key, version, UNREAD_TIMEOUT):
+            version = cache.get(key, version)
+    return version
+
+
+def _feed_changed(owner):
+    """Move a feed to a new version and wake its stream requests"""
+    try:
+        cache.incr(_feed_key(owner))
+    except ValueError:
+        pass
+    get_broker().publish(owner)
+
+
+def adjust_unread(owner, delta):
+    """
+    Add delta to an unread counter once the current transaction commits
+
+    Missing counters are left alone; they are recounted on their next read.
+
+    Args:
+        owner: User id, or STAFF
+        delta (int): Change in unread notifications
+    """
+    def apply():
+        try:
+            cache.incr(_unread_key(owner), delta)
+        except ValueError:
+            pass
+        _feed_changed(owner)
+
+    transaction.on_commit(apply)
+
+
+def reset_unread(owner, count=0):
+    """Store an unread counter that is known exactly, e.g. after marking everything read"""
+    def apply():
+        cache.set(_unread_key(owner), count, UNREAD_TIMEOUT)
+        _feed_changed(owner)
+
+    transaction.on_commit(apply)
+
+
+def forget_unread(owner):
+    """Drop one unread counter after a change that cannot be applied as a delta"""
+    def apply():
+        cache.delete(_unread_key(owner))
+        _feed_changed(owner)
+
+    transaction.on_commit(apply)
+
+
+def invalidate_unread_counts():
+    """Drop every cached unread counter, e.g. after a bulk change to notifications"""
+    try:
+        cache.incr(UNREAD_VERSION_KEY)
+    except ValueError:
+        cache.set(UNREAD_VERSION_KEY, 2, None)
+    get_broker().publish_all()
+
+
+def reconcile_unread_counts(batch_size=1000):
+    """
+    Recount every user's unread counter, and the STAFF one, from the table
+
+    Args:
+        batch_size (int): Counters written to the cache at a time
+
+    Returns:
+        int: Number of counters written
+    """
+    from accounts.models import User
+
+    direct = dict(
+        Notification.objects.filter(patient__isnull=False, is_read=False).values_list('patient')
+        .annotate(count=Count('pk')).order_by()
+    )
+    delivered = dict(
+        NotificationRecipient.objects.filter(is_read=False).values_list('recipient')
+        .annotate(count=Count('pk')).order_by()
+    )
+    counters = {_unread_key(STAFF): count_unread(STAFF)}
+    written = 0
+    for user_id in User.objects.values_list('pk', flat=True).iterator(chunk_size=batch_size):
+        counters[_unread_key(user_id)] = direct.get(user_id, 0) + delivered.get(user_id, 0)
+        if len(counters) >= batch_size:
+            cache.set_many(counters, UNREAD_TIMEOUT)
+            written += len(counters)
+            counters = {}
+    cache.set_many(counters, UNREAD_TIMEOUT)
+    return written + len(counters)
+
+
+def mark_read(user, notification_id):
+    """
+    Mark one notification read for a user
+
+    Returns:
+        bool: Whether the user had the notification
+    """
+    now = timezone.now()
+    read = NotificationRecipient.objects.filter(
+        recipient=user, notification_id=notification_id, is_read=False
+    ).update(is_read=True, read_at=now)
+    read += Notification.objects.filter(pk=notification_id, patient=user, is_read=False).update(
+        is_read=True, updated_at=now
+    )
+    if read:
+        adjust_unread(user.pk, -read)
+        return True
+    return (
+        NotificationRecipient.objects.filter(recipient=user, notification_id=notification_id).exists()
+        or Notification.objects.filter(pk=notification_id, patient=user).exists()
+    )
+
+
+def mark_all_read(user):
+    """
+    Mark every notification read for a user; fanned-out ones in a single indexed update
+
+    Admins mark the shared feed of notifications without a patient instead.
+    """
+    now = timezone.now()
+    if user.user_type == 'admin':
+        Notification.objects.filter(patient__isnull=True, is_read=False).update(is_read=True, updated_at=now)
+    else:
+        Notification.objects.filter(patient=user, is_read=False).update(is_read=True, updated_at=now)
+        NotificationRecipient.objects.filter(recipient=user, is_read=False).update(is_read=True, read_at=now)
+    reset_unread(_counter_owner(user))
+
+
+def notification_feed(user):
+    """
+    Every notification a user sees, sent directly or fanned out
+
+    Admins see the shared feed of notifications without a patient. Rows carry
+    user_is_read and user_changed_at, the read state as this user sees it and
+    when it last changed.
+
+    Returns:
+        QuerySet: Unordered notifications
+    """
+    if user.user_type == 'admin':
+        return Notification.objects.filter(patient__isnull=True).annotate(
+            user_is_read=F('is_read'), user_changed_at=F('updated_at')
+        )
+    deliveries = NotificationRecipient.objects.filter(notification=OuterRef('pk'), recipient=user)
+    return Notification.objects.filter(Q(patient=user) | Q(deliveries__recipient=user)).annotate(
+        user_is_read=Coalesce(Subquery(deliveries.values('is_read')[:1]), F('is_read')),
+        user_changed_at=Coalesce(Subquery(deliveries.values('read_at')[:1]), F('updated_at')),
+    )
+
+
+def notification_payload(notification):
+    """A notification as the JSON APIs send it"""
+    return {
+        'notification_id': notification.id,
+        'type': notification.type,
+        'title': notification.title,
+        'message': notification.message,
+        'is_read': getattr(notification, 'user_is_read', notification.is_read),
+        'created_at_formatted': notification.created_at.strftime('%Y-%m-%d %H:%M'),
+    }
+
+
+def _changes_since(user, cursor):
+    """Notifications newer than cursor (oldest first), the new cursor and the unread count"""
+    if cursor is None:
+        latest = notification_feed(user).aggregate(latest=Max('pk'))['latest']
+        return [], latest or 0, unread_count(user)
+    notifications = list(notification_feed(user).filter(pk__gt=cursor).order_by('pk')[:STREAM_BATCH_SIZE])
+    if notifications:
+        cursor = notifications[-1].pk
+    return notifications, cursor, unread_count(user)
+
+
+async def wait_for_changes(user, cursor=None, unread=None, timeout=STREAM_TIMEOUT):
+    """
+    Wait until a user has notifications newer than a cursor, or a different unread count
+
+    Waiting holds no thread or database connection: the request sleeps on the
+    notification broker, which wakes it when the user's unread counter changes,
+    and the table is only checked on wake-up and at the timeout. Without a
+    cursor it answers at once with the current one.
+
+    Args:
+        user (User): The listening user
+        cursor (int): Newest notification id the client has
+        unread (int): Unread count the client shows
+        timeout (float): Seconds to wait at most
+
+    Returns:
+        tuple: (notifications oldest first, new cursor, unread count)
+    """
+    deadline = time.monotonic() + timeout
+    with get_broker().subscribe(_counter_owner(user)) as subscription:
+        while True:
+            notifications, new_cursor, count = await sync_to_async(_changes_since)(user, cursor)
+            remaining = deadline - time.monotonic()
+            if cursor is None or notifications or count != unread or remaining <= 0:
+                return notifications, new_cursor, count
+            await subscription.wait(remaining)
+
+
+def _parse_cursor(value):
+    """(last id, synced at, feed version) from a sync cursor, or None"""
+    try:
+        last_id, synced_ms, version = (int(part) for part in value.split('.'))
+        synced_at = datetime.fromtimestamp(synced_ms / 1000, tz=dt_timezone.utc)
+    except (AttributeError, ValueError, OverflowError, OSError):
+        return None
+    return last_id, synced_at, version
+
+
+def sync_notifications(user, cursor=None, limit=10, types=None):
+    """
+    A user's notifications changed since a sync cursor
+
+    Without a cursor, returns the newest `limit` notifications. With one,
+    returns every notification created after it or read or unread since it,
+    newest first and at most SYNC_PAGE_SIZE, in one query. When the user's feed
+    version still matches the cursor's, nothing changed and the notification
+    rows are not read at all. The unread count comes from the cached counter.
+
+    Args:
+        user (User): The syncing user
+        cursor (str): Cursor from the previous sync
+        limit (int): Notifications for a first sync
+        types (iterable): Only these notification types, e.g. for attendants
+
+    Returns:
+        dict: notifications (list of Notification), cursor (str, for the next
+            sync), unread_count (int) and version (int, the feed version)
+    """
+    owner = _counter_owner(user)
+    version = feed_version(owner)  # Read before the rows, so a concurrent change is sent again next time
+    parsed = _parse_cursor(cursor) if cursor else None
+    if parsed and parsed[2] == version:
+        return {'notifications': [], 'cursor': cursor, 'unread_count': unread_count(user), 'version': version}
+
+    synced_at = timezone.now()
+    feed = notification_feed(user)
+    if types:
+        feed = feed.filter(type__in=types)
+    if parsed:
+        last_id, since, _ = parsed
+        feed = feed.filter(Q(pk__gt=last_id) | Q(user_changed_at__gt=since - SYNC_OVERLAP))
+        limit = SYNC_PAGE_SIZE
+    else:
+        last_id = 0
+    notifications = list(feed.order_by('-pk')[:limit])
+    last_id = max([last_id] + [notification.pk for notification in notifications])
+    return {
+        'notifications': notifications,
+        'cursor': f'{last_id}.{int(synced_at.timestamp() * 1000)}.{version}',
+        'unread_count': unread_count(user),
+        'version': version,
+    }
+
+
+def sync_payload(notification):
+    """A notification as the v2 API sends it; timestamps are ISO 8601"""
+    return {
+        'id': notification.id,
+        'type': notification.type,
+        'title': notification.title,
+        'message': notification.message,
+        'is_read': getattr(notification, 'user_is_read', notification.is_read),
+        'appointment_id': notification.appointment_id,
+        'created_at': notification.created_at.isoformat(),
+    }
+
+
+def notification_etag(request, *args, **kwargs):
+    """ETag of the requesting user's notification feed, read from the cache (for @condition)"""
+    if not request.user.is_authenticated:
+        return None
+    owner = _counter_owner(request.user)
+    return f'{owner}-{feed_version(owner)}'
+
+
+def sync_response(request, types=None):
+    """
+    JSON response of sync_notifications() for a v2 API request
+
+    Reads ?cursor= and ?limit= (first sync only, at most SYNC_PAGE_SIZE).
+    Responses must be revalidated, so browsers send If-None-Match and get a
+    304 from @condition(etag_func=notification_etag) until the feed changes.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'success': False, 'error': 'Not authenticated'}, status=401)
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), SYNC_PAGE_SIZE)
+    except ValueError:
+        limit = 10
+
+    sync = sync_notifications(request.user, request.GET.get('cursor'), limit, types)
+    response = JsonResponse({
+        'success': True,
+        'cursor': sync['cursor'],
+        'unread_count': sync['unread_count'],
+        'notifications': [sync_payload(notification) for notification in sync['notifications']],
+    })
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,126 @@
+from datetime import timedelta
+from django.db.models import Exists, OuterRef, Q, F
+from django.utils import timezone
+from .models import Appointment, ReminderDelivery
+import uuid
+
+# How long before the appointment each reminder type is sent
+REMINDER_WINDOWS = {
+    '24h': timedelta(hours=24),
+    '2h': timedelta(hours=2),
+}
+
+# Failed reminders are retried on later runs up to this many attempts
+MAX_ATTEMPTS = 3
+
+# Reminders left in 'sending' by a run that crashed are retried after this long
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def window_bounds(reminder_type, now):
+    """
+    Start and end of a reminder window
+
+    A window ends at its lead time and starts where the next shorter window ends,
+    so each appointment is in exactly one window at a time: (now+2h, now+24h] for
+    '24h' and (now, now+2h] for '2h'.
+
+    Returns:
+        tuple: (start, end) datetimes; appointments in (start, end] are in the window
+    """
+    lead = REMINDER_WINDOWS[reminder_type]
+    shorter = [window for window in REMINDER_WINDOWS.values() if window < lead]
+    return now + max(shorter, default=timedelta(0)), now + lead
+
+
+def eligible_appointments(reminder_type, now=None):
+    """
+    Confirmed appointments inside the reminder window that still need the reminder
+
+    An appointment is eligible while it starts within the window (see
+    window_bounds). Once it moves into a shorter window, the longer reminder is
+    no longer sent. Appointments whose reminder was sent, is being sent by
+    another run, or failed too many times are excluded.
+
+    Args:
+        reminder_type (str): Key of REMINDER_WINDOWS
+        now (datetime): Current time (default: timezone.now())
+
+    Returns:
+        QuerySet: Appointments with patient, service, product, package and attendant loaded
+    """
+    now = timezone.localtime(now or timezone.now())
+    start, end = window_bounds(reminder_type, now)
+    start_date, start_time = start.date(), start.time()
+    end_date, end_time = end.date(), end.time()
+
+    if start_date == end_date:
+        in_window = Q(appointment_date=start_date, appointment_time__gt=start_time, appointment_time__lte=end_time)
+    else:
+        in_window = (
+            Q(appointment_date=start_date, appointment_time__gt=start_time)
+            | Q(appointment_date__gt=start_date, appointment_date__lt=end_date)
+            | Q(appointment_date=end_date, appointment_time__lte=end_time)
+        )
+
+    handled = ReminderDelivery.objects.filter(
+        appointment=OuterRef('pk'),
+        reminder_type=reminder_type,
+    ).filter(
+        Q(status='sent')
+        | Q(status='failed', attempts__gte=MAX_ATTEMPTS)
+        | Q(status='sending', claimed_at__gte=now - CLAIM_TIMEOUT)
+    )
+
+    return Appointment.objects.filter(
+        in_window,
+        status='confirmed',
+    ).exclude(
+        Exists(handled)
+    ).select_related(
+        'patient', 'service', 'product', 'package', 'attendant'
+    ).order_by('appointment_date', 'appointment_time', 'id')
+
+
+def claim(appointments, reminder_type):
+    """
+    Claim ledger rows for a batch of appointments
+
+    New rows are inserted already claimed; existing rows are claimed only if
+    they failed or were abandoned by a crashed run. Unique (appointment,
+    reminder_type) rows mean two overlapping runs never claim the same reminder.
+
+    Args:
+        appointments (list): Appointments to claim
+        reminder_type (str): Key of REMINDER_WINDOWS
+
+    Returns:
+        dict: {appointment_id: ReminderDelivery} for the claimed reminders
+    """
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    ids = [appointment.pk for appointment in appointments]
+
+    ReminderDelivery.objects.bulk_create([
+        ReminderDelivery(
+            appointment_id=appointment_id,
+            reminder_type=reminder_type,
+            status='sending',
+            attempts=1,
+            claim_token=token,
+            claimed_at=now,
+        )
+        for appointment_id in ids
+    ], ignore_conflicts=True)
+
+    ReminderDelivery.objects.filter(
+        Q(status='failed', attempts__lt=MAX_ATTEMPTS)
+        | Q(status='sending', claimed_at__lt=now - CLAIM_TIMEOUT),
+        appointment_id__in=ids,
+        reminder_type=reminder_type,
+    ).update(status='sending', claim_token=token, claimed_at=now, attempts=F('attempts') + 1)
+
+    return {
+        delivery.appointment_id: delivery
+        for delivery in ReminderDelivery.objects.filter(claim_token=token)
+    }
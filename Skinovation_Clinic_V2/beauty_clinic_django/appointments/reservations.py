@@ -0,0 +1,104 @@
+from django.db import transaction, OperationalError
+from django.db.models import F
+from .models import Appointment, AppointmentSlot
+from .availability import SLOT_CAPACITY
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# SQLite reports lock contention instead of waiting on row locks, so retry briefly
+LOCK_RETRIES = 20
+LOCK_RETRY_DELAY = 0.05
+
+
+class SlotUnavailable(Exception):
+    """Raised when a time slot has no capacity left"""
+
+
+class OutOfStock(Exception):
+    """Raised when a pre-ordered product has no stock left"""
+
+
+def reserve_slot(attendant_id, appointment_date, appointment_time, capacity=SLOT_CAPACITY):
+    """
+    Claim one seat in a time slot. Must run inside transaction.atomic().
+
+    Args:
+        attendant_id (int): Attendant of the slot
+        appointment_date: Date of the slot
+        appointment_time: Time of the slot
+        capacity (int): Maximum seats, or None to claim without a limit
+
+    Raises:
+        SlotUnavailable: If the slot is already full
+    """
+    slot, _ = AppointmentSlot.objects.get_or_create(
+        attendant_id=attendant_id,
+        appointment_date=appointment_date,
+        appointment_time=appointment_time,
+    )
+
+    # The conditional UPDATE locks only this slot row and re-checks the count
+    seats = AppointmentSlot.objects.filter(pk=slot.pk)
+    if capacity is not None:
+        seats = seats.filter(booked__lt=capacity)
+    if not seats.update(booked=F('booked') + 1):
+        raise SlotUnavailable(f"Slot {appointment_date} {appointment_time} is fully booked")
+
+
+def release_slot(attendant_id, appointment_date, appointment_time):
+    """Give back one seat in a time slot"""
+    AppointmentSlot.objects.filter(
+        attendant_id=attendant_id,
+        appointment_date=appointment_date,
+        appointment_time=appointment_time,
+        booked__gt=0,
+    ).update(booked=F('booked') - 1)
+
+
+def book_appointment(capacity=SLOT_CAPACITY, **fields):
+    """
+    Reserve a seat and create the appointment in one transaction
+
+    Args:
+        capacity (int): Slot capacity, or None for no limit
+        **fields: Appointment field values; must include attendant, appointment_date
+            and appointment_time. A product pre-order also takes one unit of stock.
+
+    Returns:
+        Appointment: The created appointment
+
+    Raises:
+        SlotUnavailable: If the slot is already full
+        OutOfStock: If the pre-ordered product is out of stock
+    """
+    attendant = fields['attendant']
+    product = fields.get('product')
+
+    for attempt in range(LOCK_RETRIES):
+        try:
+            with transaction.atomic():
+                if product is not None:
+                    from products.models import Product
+                    in_stock = Product.objects.filter(pk=product.pk, stock__gt=0).update(stock=F('stock') - 1)
+                    if not in_stock:
+                        raise OutOfStock(f"{product.product_name} is out of stock")
+
+                reserve_slot(attendant.pk, fields['appointment_date'], fields['appointment_time'], capacity)
+
+                appointment = Appointment(**fields)
+                appointment._slot_reserved = True
+                appointment.save()
+
+            if product is not None:
+                product.refresh_from_db(fields=['stock'])
+            return appointment
+        except OperationalError as e:
+            if 'locked' not in str(e):
+                raise
+            if attempt == LOCK_RETRIES - 1:
+                logger.warning(f"Database still locked after {LOCK_RETRIES} booking attempts")
+                raise
+            logger.debug(f"Database locked while booking, retrying ({attempt + 1}/{LOCK_RETRIES})")
+            time.sleep(LOCK_RETRY_DELAY * (attempt + 1))
@@ -0,0 +1,146 @@
+from django.db import transaction
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from accounts.models import Attendant, AttendantProfile, User
+from .models import Appointment, ClosedDay, Notification
+from .availability import ACTIVE_STATUSES, invalidate_day, invalidate_index, to_date, to_slot
+from .notifications import STAFF, adjust_unread, forget_unread
+from .reservations import reserve_slot, release_slot
+
+SLOT_FIELDS = {'appointment_date', 'appointment_time', 'attendant_id', 'status'}
+UNKNOWN_SLOT = 'unknown'
+
+
+def _slot_snapshot(appointment):
+    """The slot an appointment occupies, or None if it does not occupy one"""
+    if appointment.status not in ACTIVE_STATUSES or not appointment.attendant_id:
+        return None
+    if not appointment.appointment_date or not appointment.appointment_time:
+        return None
+    try:
+        return (
+            appointment.attendant_id,
+            to_date(appointment.appointment_date),
+            to_slot(appointment.appointment_time),
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+@receiver(post_init, sender=Appointment)
+def remember_appointment_slot(sender, instance, **kwargs):
+    """Remember the loaded slot so saves know which counters to move"""
+    if not instance.pk:
+        instance._occupied_slot = None
+    elif SLOT_FIELDS & instance.get_deferred_fields():
+        # Never trigger extra queries for instances loaded with .only()/.defer()
+        instance._occupied_slot = UNKNOWN_SLOT
+    else:
+        instance._occupied_slot = _slot_snapshot(instance)
+
+
+@receiver(pre_save, sender=Appointment)
+@receiver(pre_delete, sender=Appointment)
+def load_unknown_slot(sender, instance, **kwargs):
+    """Load the stored slot for instances that were loaded with deferred fields"""
+    if getattr(instance, '_occupied_slot', None) != UNKNOWN_SLOT:
+        return
+    stored = Appointment.objects.filter(pk=instance.pk).only(*SLOT_FIELDS).first()
+    instance._occupied_slot = _slot_snapshot(stored) if stored else None
+
+
+@receiver(post_save, sender=Appointment)
+def update_slot_on_save(sender, instance, **kwargs):
+    """Move the appointment between slot counters and the availability index"""
+    previous = getattr(instance, '_occupied_slot', None)
+    current = _slot_snapshot(instance)
+    if previous != current:
+        if previous:
+            release_slot(*previous)
+            transaction.on_commit(lambda: invalidate_day(previous[1]))
+        if current:
+            # Bookings made through book_appointment() already hold their seat;
+            # staff changes such as reassignments are applied without a limit
+            if not getattr(instance, '_slot_reserved', False):
+                reserve_slot(*current, capacity=None)
+            transaction.on_commit(lambda: invalidate_day(current[1]))
+    instance._occupied_slot = current
+    instance._slot_reserved = False
+
+
+@receiver(post_delete, sender=Appointment)
+def update_slot_on_delete(sender, instance, **kwargs):
+    """Free the slot of a deleted appointment"""
+    previous = getattr(instance, '_occupied_slot', None)
+    if previous:
+        release_slot(*previous)
+        transaction.on_commit(lambda: invalidate_day(previous[1]))
+
+
+@receiver(post_save, sender=ClosedDay)
+@receiver(post_delete, sender=ClosedDay)
+def update_slot_index_on_closed_day(sender, instance, **kwargs):
+    """Rebuild the day index when the clinic opens or closes a day"""
+    invalidate_day(instance.date)
+
+
+@receiver(post_save, sender=AttendantProfile)
+@receiver(post_delete, sender=AttendantProfile)
+@receiver(post_save, sender=Attendant)
+@receiver(post_delete, sender=Attendant)
+def update_slot_index_on_schedule_change(sender, instance, **kwargs):
+    """Work schedules changed, so every cached index is stale"""
+    invalidate_index()
+
+
+@receiver(post_save, sender=User)
+def update_slot_index_on_attendant_user_change(sender, instance, **kwargs):
+    """Attendant accounts are matched by name, so renames change schedules"""
+    if instance.user_type == 'attendant':
+        invalidate_index()
+
+
+def _unread_owner(notification):
+    """The unread counter a notification belongs to"""
+    return notification.patient_id or STAFF
+
+
+@receiver(post_init, sender=Notification)
+def remember_notification_read_state(sender, instance, **kwargs):
+    """Remember the loaded read state so saves can be applied as deltas"""
+    if not instance.pk or 'is_read' in instance.get_deferred_fields():
+        instance._was_unread = None
+    else:
+        instance._was_unread = not instance.is_read
+
+
+@receiver(post_save, sender=Notification)
+def update_unread_on_save(sender, instance, created, **kwargs):
+    """Count new unread notifications and ones read or unread through save()"""
+    unread = not instance.is_read
+    previous = False if created else getattr(instance, '_was_unread', None)
+    if previous is None:
+        # Loaded with the read state deferred, so the change is unknown
+        forget_unread(_unread_owner(instance))
+    elif unread != previous:
+        adjust_unread(_unread_owner(instance), 1 if unread else -1)
+    instance._was_unread = unread
+
+
+@receiver(pre_delete, sender=Notification)
+def remember_unread_deliveries(sender, instance, **kwargs):
+    """Note who has not read a fanned-out notification before its deliveries are deleted"""
+    instance._unread_recipients = []
+    if instance.patient_id is None:
+        instance._unread_recipients = list(
+            instance.deliveries.filter(is_read=False).values_list('recipient_id', flat=True)
+        )
+
+
+@receiver(post_delete, sender=Notification)
+def update_unread_on_delete(sender, instance, **kwargs):
+    """Uncount a deleted notification for everyone who had not read it"""
+    if not instance.is_read:
+        adjust_unread(_unread_owner(instance), -1)
+    for user_id in getattr(instance, '_unread_recipients', []):
+        adjust_unread(user_id, -1)
@@ -1,3 +1,807 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import date, time, timedelta
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from unittest import skipUnless
+from unittest.mock import patch
+from accounts.models import User, Attendant
+from products.models import Product
+from requests import Response
+from requests.adapters import HTTPAdapter
+from services.models import Service, ServiceCategory
+from services.sms_queue import CLAIM_TIMEOUT, ProviderThrottle, claim_batch, deliver, enqueue_sms, retry_delay
+from services.sms_service import IPROGSMSService
+from services.utils import send_appointment_sms
+from .admin_views import PATIENTS_PER_PAGE
+from .availability import ACTIVE_STATUSES, SLOT_CAPACITY, SLOT_TIMES, SlotAvailabilityIndex
+from .context_processors import notification_count
+from .models import (
+    Appointment, AppointmentSlot, ClosedDay, Feedback, HistoryLog, Notification, NotificationRecipient, ReminderDelivery,
+    SMSHistory, SMSOutbox, SMSTemplate,
+)
+from .notification_broker import LocalNotificationBroker
+from .notifications import (
+    STAFF, UNREAD_TIMEOUT, count_unread, mark_all_read, mark_read, notify_owners, recent_notifications,
+    unread_count,
+)
+from .reminders import CLAIM_TIMEOUT as REMINDER_CLAIM_TIMEOUT, claim, eligible_appointments
+from .reservations import book_appointment, SlotUnavailable, OutOfStock
+import asyncio
+import json
+import threading
+import time as time_module
 
-# Create your tests here.
+
+def create_booking_fixtures(attendant_count=1):
+    """Create a patient, a service and attendants for booking tests"""
+    patient = User.objects.create_user('patient', password='test-pass-123', user_type='patient')
+    category = ServiceCategory.objects.create(name='Facial')
+    service = Service.objects.create(service_name='Facial', duration=60, category=category, price=1000)
+    attendants = [
+        Attendant.objects.create(
+            first_name=f'Attendant{i}', last_name='Test',
+            shift_date=date.today(), shift_time=time(9, 0)
+        )
+        for i in range(attendant_count)
+    ]
+    return patient, service, attendants
+
+
+class SlotReservationTests(TestCase):
+    """Slot counters stay in step with appointment changes"""
+
+    def setUp(self):
+        cache.clear()
+        self.patient, self.service, (self.attendant,) = create_booking_fixtures()
+        self.day = date.today() + timedelta(days=7)
+
+    def book(self, appointment_time='10:00', **kwargs):
+        return book_appointment(
+            patient=self.patient, service=self.service, attendant=self.attendant,
+            appointment_date=self.day, appointment_time=appointment_time, status='confirmed', **kwargs
+        )
+
+    def booked(self, appointment_time='10:00'):
+        slot = AppointmentSlot.objects.filter(
+            attendant=self.attendant, appointment_date=self.day, appointment_time=appointment_time
+        ).first()
+        return slot.booked if slot else 0
+
+    def test_capacity_is_enforced(self):
+        for _ in range(SLOT_CAPACITY):
+            self.book()
+        with self.assertRaises(SlotUnavailable):
+            self.book()
+        self.assertEqual(self.booked(), SLOT_CAPACITY)
+
+    def test_cancelling_frees_the_seat(self):
+        appointments = [self.book() for _ in range(SLOT_CAPACITY)]
+        appointment = Appointment.objects.get(pk=appointments[0].pk)
+        appointment.status = 'cancelled'
+        appointment.save()
+        self.assertEqual(self.booked(), SLOT_CAPACITY - 1)
+        self.book()
+
+    def test_rescheduling_moves_the_seat(self):
+        appointment = Appointment.objects.get(pk=self.book().pk)
+        appointment.appointment_time = time(11, 0)
+        appointment.save()
+        self.assertEqual((self.booked('10:00'), self.booked('11:00')), (0, 1))
+
+    def test_product_stock_is_enforced(self):
+        product = Product.objects.create(product_name='Toner', price=500, stock=1)
+        book_appointment(
+            capacity=None, patient=self.patient, product=product, attendant=self.attendant,
+            appointment_date=self.day, appointment_time='10:00', status='confirmed'
+        )
+        with self.assertRaises(OutOfStock):
+            book_appointment(
+                capacity=None, patient=self.patient, product=product, attendant=self.attendant,
+                appointment_date=self.day, appointment_time='10:00', status='confirmed'
+            )
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 0)
+
+
+class SlotAvailabilityIndexTests(TestCase):
+    """The cached day index follows bookings and feeds the weekly grid"""
+
+    def setUp(self):
+        cache.clear()
+        self.patient, self.service, (self.attendant,) = create_booking_fixtures()
+        self.day = date.today() + timedelta(days=7)
+
+    def book(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return book_appointment(
+                patient=self.patient, service=self.service, attendant=self.attendant,
+                appointment_date=self.day, appointment_time='10:00', status='confirmed'
+            )
+
+    def status(self):
+        return SlotAvailabilityIndex.for_date(self.day).slot_status('10:00', self.attendant.pk)
+
+    def test_index_is_cached_and_dropped_on_change(self):
+        appointments = [self.book() for _ in range(SLOT_CAPACITY)]
+        self.assertEqual(self.status(), 'full')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.status(), 'full')
+
+        appointment = Appointment.objects.get(pk=appointments[0].pk)
+        appointment.status = 'cancelled'
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.save()
+        self.assertEqual(self.status(), 'free')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ClosedDay.objects.create(date=self.day)
+        self.assertEqual(self.status(), 'closed')
+
+    def test_week_grid(self):
+        for _ in range(SLOT_CAPACITY):
+            self.book()
+        self.client.force_login(self.patient)
+        url = reverse('appointments:availability_week')
+        data = self.client.get(url, {'start': self.day.isoformat(), 'attendant': self.attendant.pk}).json()
+
+        self.assertEqual(data['slots'], SLOT_TIMES)
+        self.assertEqual(list(data['days']), [(self.day + timedelta(days=n)).isoformat() for n in range(7)])
+        grid = data['days'][self.day.isoformat()]
+        self.assertEqual(grid['10:00']['status'], 'full')
+        self.assertEqual(grid['11:00'], {'status': 'free', 'available_attendants': [self.attendant.pk]})
+        self.assertEqual(self.client.get(url, {'attendant': 'x'}).status_code, 400)
+
+
+class ConcurrentBookingStressTests(TransactionTestCase):
+    """Hundreds of parallel bookings never overbook a slot"""
+
+    REQUESTS = 200
+    WORKERS = 16
+
+    def setUp(self):
+        cache.clear()
+        self.day = date.today() + timedelta(days=7)
+
+    def _book_in_thread(self, patient, service, attendant, appointment_time):
+        try:
+            book_appointment(
+                patient=patient, service=service, attendant=attendant,
+                appointment_date=self.day, appointment_time=appointment_time, status='confirmed'
+            )
+            return True
+        except SlotUnavailable:
+            return False
+        finally:
+            connection.close()
+
+    def test_parallel_bookings_respect_capacity(self):
+        patient, service, (attendant,) = create_booking_fixtures()
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            results = list(pool.map(
+                lambda _: self._book_in_thread(patient, service, attendant, '10:00'),
+                range(self.REQUESTS)
+            ))
+
+        self.assertEqual(results.count(True), SLOT_CAPACITY)
+        self.assertEqual(
+            Appointment.objects.filter(attendant=attendant, appointment_date=self.day).count(),
+            SLOT_CAPACITY
+        )
+        self.assertEqual(AppointmentSlot.objects.get(attendant=attendant).booked, SLOT_CAPACITY)
+
+    def test_parallel_bookings_for_different_slots_all_succeed(self):
+        patient, service, attendants = create_booking_fixtures(attendant_count=4)
+        slots = [
+            (attendant, appointment_time)
+            for attendant in attendants
+            for appointment_time in ('09:00', '10:00', '11:00', '12:00')
+        ]
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            results = list(pool.map(
+                lambda slot: self._book_in_thread(patient, service, *slot),
+                slots * SLOT_CAPACITY
+            ))
+
+        self.assertTrue(all(results))
+        self.assertEqual(Appointment.objects.count(), len(slots) * SLOT_CAPACITY)
+
+
+class FakeSMSProvider:
+    """Provider client that returns (or raises) canned results, then successes"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.sent = []
+
+    def send_sms(self, phone, message, sender_id):
+        self.sent.append(phone)
+        result = self.results.pop(0) if self.results else {'success': True}
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class FakeGatewayAdapter(HTTPAdapter):
+    """Connection pool that answers every request without touching the network"""
+
+    def __init__(self, status_code=200):
+        super().__init__()
+        self.status_code = status_code
+        self.lock = threading.Lock()
+        self.requests = []
+
+    def send(self, request, **kwargs):
+        with self.lock:
+            self.requests.append((threading.get_ident(), json.loads(request.body)))
+        response = Response()
+        response.status_code = self.status_code
+        response._content = json.dumps({'status': 200, 'message': 'queued'}).encode()
+        response.request = request
+        return response
+
+
+@override_settings(IPROG_SMS_API_KEY='test-key', SMS_POOL_SIZE=4)
+class SMSClientTests(TestCase):
+    """send_many fans a batch out over the shared connection pool"""
+
+    def test_send_many_keeps_order_and_isolates_bad_numbers(self):
+        service = IPROGSMSService()
+        adapter = service._adapter = FakeGatewayAdapter()
+        phones = [f'0917{number:07d}' for number in range(12)]
+        messages = [(phone, f'Hello {phone}') for phone in phones]
+        messages.insert(5, {'phone': '12345', 'message': 'Bad number'})
+
+        results = service.send_many(messages)
+
+        self.assertEqual(len(results), len(messages))
+        self.assertFalse(results.pop(5)['success'])
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual(
+            sorted(payload['phone_number'] for _, payload in adapter.requests),
+            sorted(f'63{phone[1:]}' for phone in phones)
+        )
+        self.assertLessEqual(len({thread for thread, _ in adapter.requests}), 4)
+
+    def test_unexpected_status_is_a_failure(self):
+        service = IPROGSMSService()
+        service._adapter = FakeGatewayAdapter(status_code=202)
+        result = service.send_sms('09171234567', 'Hello')
+        self.assertEqual((result['success'], result['error']), (False, 'Unexpected response status 202'))
+
+
+@override_settings(SMS_ENABLED=True, SMS_PROVIDER_RATE_LIMITS={})
+class SMSOutboxTests(TestCase):
+    """Outbox messages are claimed once, retried with backoff and then given up"""
+
+    def setUp(self):
+        self.sender = User.objects.create_user('admin', user_type='admin')
+
+    def deliver(self, *results):
+        provider = FakeSMSProvider(*results)
+        # Every delivery logs its outcome; capture those lines to keep the test output clean
+        logs = self.assertLogs('services.sms_queue', 'INFO') if results else nullcontext()
+        with patch('services.sms_queue.get_provider', return_value=provider), logs:
+            statuses = [deliver(entry, ProviderThrottle()) for entry in claim_batch(10)]
+        return statuses, provider
+
+    def test_claims_are_exclusive_until_they_time_out(self):
+        enqueue_sms('09171234567', 'Hello', user=self.sender)
+        self.assertEqual(len(claim_batch(10)), 1)
+        self.assertEqual(claim_batch(10), [])
+
+        SMSOutbox.objects.update(claimed_at=timezone.now() - timedelta(seconds=CLAIM_TIMEOUT + 1))
+        self.assertEqual(len(claim_batch(10)), 1)
+
+    def test_failures_back_off_then_give_up(self):
+        entry = SMSOutbox.objects.get(pk=enqueue_sms('09171234567', 'Hello', user=self.sender)['outbox_id'])
+        entry.max_attempts = 2
+        entry.save()
+
+        before = timezone.now()
+        self.assertEqual(self.deliver({'success': False, 'error': 'Gateway down'})[0], ['queued'])
+        entry.refresh_from_db()
+        self.assertEqual((entry.attempts, entry.last_error, entry.claim_token), (1, 'Gateway down', None))
+        self.assertGreaterEqual(entry.next_attempt_at, before + timedelta(seconds=retry_delay(1)))
+        self.assertEqual(self.deliver()[0], [])  # Not due yet
+
+        SMSOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(self.deliver({'success': False, 'error': 'Gateway down'})[0], ['failed'])
+        self.assertEqual(SMSHistory.objects.get().status, 'failed')
+        self.assertLess(retry_delay(1), retry_delay(2))
+
+    def test_empty_result_is_retried(self):
+        enqueue_sms('09171234567', 'Hello', user=self.sender)
+        self.assertEqual(self.deliver(None)[0], ['queued'])
+        self.assertEqual(SMSOutbox.objects.get().last_error, 'No response from SMS provider')
+
+        SMSOutbox.objects.update(next_attempt_at=timezone.now())
+        statuses, provider = self.deliver({'success': True, 'message_id': 'abc'})
+        self.assertEqual((statuses, provider.sent), (['sent'], ['09171234567']))
+        self.assertEqual(SMSHistory.objects.get().message_id, 'abc')
+
+    def test_appointment_notifications_are_not_recorded_as_sent_by_the_patient(self):
+        patient, service, (attendant,) = create_booking_fixtures()
+        User.objects.filter(pk=patient.pk).update(phone='09171234567')
+        SMSTemplate.objects.create(
+            name='Confirmation', template_type='confirmation', created_by=self.sender,
+            message='Hi {patient_name}, see you on {appointment_date} at {appointment_time}'
+        )
+        appointment = Appointment.objects.create(
+            patient=User.objects.get(pk=patient.pk), service=service, attendant=attendant,
+            appointment_date=date.today() + timedelta(days=1), appointment_time=time(10, 0),
+        )
+
+        self.assertTrue(send_appointment_sms(appointment, 'confirmation')['queued'])
+        self.assertIsNone(SMSOutbox.objects.get().sender)
+        self.assertEqual(self.deliver({'success': True})[0], ['sent'])
+        self.assertFalse(SMSHistory.objects.filter(sender=patient).exists())
+
+
+class ReminderLedgerTests(TestCase):
+    """Reminder runs send each reminder once, in one window, and resume after a crash"""
+
+    def setUp(self):
+        self.patient, self.service, (self.attendant,) = create_booking_fixtures()
+        User.objects.filter(pk=self.patient.pk).update(phone='09171234567')
+        admin = User.objects.create_user('admin', user_type='admin')
+        SMSTemplate.objects.create(
+            name='Reminder', template_type='reminder', created_by=admin,
+            message='Hi {patient_name}, see you on {appointment_date} at {appointment_time}'
+        )
+        self.now = timezone.localtime().replace(second=0, microsecond=0)
+        self.soon, self.later, self.tomorrow = (
+            self.appointment(hours) for hours in (1, 10, 30)
+        )
+
+    def appointment(self, hours):
+        start = self.now + timedelta(hours=hours)
+        return Appointment.objects.create(
+            patient=self.patient, service=self.service, attendant=self.attendant, status='confirmed',
+            appointment_date=start.date(), appointment_time=start.time(),
+        )
+
+    def run_reminders(self, provider):
+        with patch('appointments.management.commands.send_reminders.sms_service', provider):
+            call_command('send_reminders', concurrency=2, stdout=StringIO())
+        return provider
+
+    def ledger(self):
+        return set(ReminderDelivery.objects.values_list('appointment_id', 'reminder_type', 'status', 'attempts'))
+
+    def test_windows_do_not_overlap(self):
+        self.assertEqual(list(eligible_appointments('2h', self.now)), [self.soon])
+        self.assertEqual(list(eligible_appointments('24h', self.now)), [self.later])
+
+    def test_rerun_sends_nothing_twice(self):
+        self.assertEqual(len(self.run_reminders(FakeSMSProvider()).sent), 2)
+        self.assertEqual(len(self.run_reminders(FakeSMSProvider()).sent), 0)
+        self.assertEqual(self.ledger(), {(self.soon.pk, '2h', 'sent', 1), (self.later.pk, '24h', 'sent', 1)})
+        self.assertEqual(SMSHistory.objects.count(), 2)
+
+    def test_failed_reminders_are_retried(self):
+        self.run_reminders(FakeSMSProvider({'success': False, 'error': 'Gateway down'}, {'success': True}))
+        self.assertEqual(ReminderDelivery.objects.filter(status='failed').count(), 1)
+        self.assertEqual(len(self.run_reminders(FakeSMSProvider()).sent), 1)
+        self.assertFalse(ReminderDelivery.objects.exclude(status='sent').exists())
+
+    def test_empty_provider_result_settles_as_failed(self):
+        self.run_reminders(FakeSMSProvider(None, None))
+        self.assertEqual(self.ledger(), {(self.soon.pk, '2h', 'failed', 1), (self.later.pk, '24h', 'failed', 1)})
+        self.assertEqual(
+            list(SMSHistory.objects.values_list('status', flat=True)), ['failed', 'failed']
+        )
+
+    def test_provider_failures_never_leave_rows_sending(self):
+        self.appointment(1.5)
+        self.run_reminders(FakeSMSProvider(
+            RuntimeError('Gateway timeout'), None, {'success': False, 'error': 'Gateway down'}
+        ))
+        self.assertEqual(set(ReminderDelivery.objects.values_list('status', flat=True)), {'failed'})
+        self.assertEqual(ReminderDelivery.objects.filter(last_error__isnull=True).count(), 0)
+        self.assertEqual(ReminderDelivery.objects.count(), 3)
+
+    def test_crashed_run_is_resumed_after_the_claim_times_out(self):
+        # A run that claimed the reminders and died before sending them
+        claim([self.soon], '2h')
+        self.assertEqual(len(self.run_reminders(FakeSMSProvider()).sent), 1)  # Only the 24h one
+
+        ReminderDelivery.objects.update(claimed_at=timezone.now() - REMINDER_CLAIM_TIMEOUT)
+        self.assertEqual(self.run_reminders(FakeSMSProvider()).sent, ['09171234567'])
+        self.assertEqual(self.ledger(), {(self.soon.pk, '2h', 'sent', 2), (self.later.pk, '24h', 'sent', 1)})
+
+    def test_dry_run_renders_every_reminder_with_flat_queries(self):
+        def dry_run():
+            output, provider = StringIO(), FakeSMSProvider()
+            with patch('appointments.management.commands.send_reminders.sms_service', provider):
+                with CaptureQueriesContext(connection) as queries:
+                    call_command('send_reminders', dry_run=True, stdout=output)
+            self.assertEqual(provider.sent, [])
+            return output.getvalue(), len(queries)
+
+        output, count = dry_run()
+        self.assertIn('Would send: 2', output)
+        self.assertIn(f'Hi {self.patient.full_name}', output)
+        for hours in range(11, 16):
+            self.appointment(hours)
+        output, more = dry_run()
+        self.assertIn('Would send: 7', output)
+        self.assertEqual(more, count)
+        self.assertFalse(ReminderDelivery.objects.exists())
+
+
+class AdminPatientListTests(TestCase):
+    """The admin patient list is one grouped query per page, whatever the patient count"""
+
+    def setUp(self):
+        cache.clear()
+        self.patient, self.service, (self.attendant,) = create_booking_fixtures()
+        self.admin = User.objects.create_user('admin', password='test-pass-123', user_type='admin')
+        for status, days_ago in (('completed', 10), ('completed', 3), ('cancelled', 1), ('pending', -2)):
+            Appointment.objects.create(
+                patient=self.patient, attendant=self.attendant, service=self.service, status=status,
+                appointment_date=date.today() - timedelta(days=days_ago), appointment_time=time(10, 0),
+            )
+        self.client.force_login(self.admin)
+
+    def test_counts_come_from_annotations(self):
+        response = self.client.get(reverse('appointments:admin_patients'))
+        patient = response.context['patients'][0]
+        self.assertEqual(
+            (patient.total_appointments, patient.completed_appointments, patient.cancelled_appointments),
+            (4, 2, 1)
+        )
+        self.assertEqual(patient.last_visit, date.today() - timedelta(days=3))
+
+    def test_query_count_does_not_grow_with_patients(self):
+        url = reverse('appointments:admin_patients')
+        self.client.get(url)  # Fills the cached notification counter
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        for number in range(30):
+            other = User.objects.create_user(f'patient-{number}', user_type='patient')
+            Appointment.objects.create(
+                patient=other, attendant=self.attendant, service=self.service, status='completed',
+                appointment_date=date.today() - timedelta(days=1), appointment_time=time(9, 0),
+            )
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(url)
+        self.assertEqual(len(after), len(before))
+        self.assertEqual(len(response.context['patients']), PATIENTS_PER_PAGE)
+
+    def test_search_and_sort(self):
+        User.objects.create_user('other', user_type='patient', first_name='Zed', last_name='Other')
+        response = self.client.get(reverse('appointments:admin_patients'), {'search': 'zed', 'sort': 'name'})
+        self.assertEqual([patient.username for patient in response.context['patients']], ['other'])
+
+        response = self.client.get(reverse('appointments:admin_patients'), {'sort': '-appointments'})
+        self.assertEqual(response.context['patients'][0], self.patient)
+
+
+class OwnerNotificationFanoutTests(TestCase):
+    """Owner notifications are stored once with one delivery row per owner"""
+
+    def setUp(self):
+        cache.clear()
+        self.owners = [User.objects.create_user(f'owner-{number}', user_type='owner') for number in range(3)]
+        User.objects.create_user('inactive-owner', user_type='owner', is_active=False)
+
+    def test_one_message_many_deliveries(self):
+        with CaptureQueriesContext(connection) as queries:
+            notification = notify_owners(type='system', title='Stock low', message='Toner is low')
+        self.assertLessEqual(len(queries), 5)
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(
+            set(notification.deliveries.values_list('recipient', flat=True)),
+            {owner.pk for owner in self.owners}
+        )
+        self.assertEqual([unread_count(owner) for owner in self.owners], [1, 1, 1])
+
+    def test_read_state_is_per_owner(self):
+        first, second, third = self.owners
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = notify_owners(type='system', title='Stock low', message='Toner is low')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(mark_read(first, notification.pk))
+        self.assertEqual((unread_count(first), unread_count(second)), (0, 1))
+        self.assertFalse(recent_notifications(second)[0].is_read)
+        self.assertTrue(recent_notifications(first)[0].is_read)
+
+        Notification.objects.create(patient=third, type='system', title='Direct', message='Just for you')
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            mark_all_read(third)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(unread_count(third), 0)
+        self.assertFalse(NotificationRecipient.objects.filter(recipient=third, read_at__isnull=True).exists())
+
+
+class UnreadCounterTests(TestCase):
+    """The notification badge reads a cached counter that follows every change"""
+
+    def setUp(self):
+        cache.clear()
+        self.patient = User.objects.create_user('patient', password='test-pass-123', user_type='patient')
+        self.owner = User.objects.create_user('owner', user_type='owner')
+        self.admin = User.objects.create_user('admin', user_type='admin')
+
+    def notify_patient(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Notification.objects.create(
+                patient=self.patient, type='system', title='Hello', message='Welcome', **fields
+            )
+
+    def assertCountersMatchTable(self):
+        for user in (self.patient, self.owner, self.admin):
+            owner = STAFF if user.user_type == 'admin' else user.pk
+            self.assertEqual(unread_count(user), count_unread(owner), user.username)
+
+    def test_context_processor_is_a_cache_hit(self):
+        self.notify_patient()
+        request = RequestFactory().get('/')
+        request.user = self.patient
+        self.assertEqual(notification_count(request), {'notification_count': 1})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(notification_count(request), {'notification_count': 1})
+        self.assertEqual(len(queries), 0)
+
+    def test_counters_follow_create_read_and_delete(self):
+        self.assertCountersMatchTable()  # Fills every counter before the changes
+        first = self.notify_patient()
+        self.notify_patient()
+        self.notify_patient(is_read=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            fanned_out = notify_owners(type='system', title='Stock low', message='Toner is low')
+        self.assertEqual((unread_count(self.patient), unread_count(self.owner), unread_count(self.admin)), (2, 1, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_read(self.patient, first.pk)
+            first = Notification.objects.get(pk=first.pk)
+            first.is_read = False
+            first.save()
+            first.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            fanned_out.delete()
+        self.assertEqual((unread_count(self.patient), unread_count(self.owner), unread_count(self.admin)), (1, 0, 0))
+        self.assertCountersMatchTable()
+
+    def test_counter_written_elsewhere_catches_up_after_timeout(self):
+        self.assertEqual(unread_count(self.patient), 0)
+        # Another process's change: the table moves, this process's cache does not
+        Notification.objects.create(patient=self.patient, type='system', title='Hello', message='Welcome')
+        self.assertEqual(unread_count(self.patient), 0)
+        later = time_module.time() + UNREAD_TIMEOUT + 1
+        with patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertEqual(unread_count(self.patient), 1)
+
+    def test_reconcile_fixes_drift(self):
+        self.notify_patient()
+        cache.set(f'notifications:unread:1:{self.patient.pk}', 7)
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.filter(patient=self.patient).update(is_read=False)
+        call_command('reconcile_notification_counts', stdout=StringIO())
+        self.assertCountersMatchTable()
+
+
+class NotificationStreamTests(TestCase):
+    """The stream answers with changes since the client's cursor"""
+
+    def setUp(self):
+        cache.clear()
+        self.patient = User.objects.create_user('patient', password='test-pass-123', user_type='patient')
+        self.client.force_login(self.patient)
+        self.url = reverse('appointments:notification_stream')
+
+    def notify_patient(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Notification.objects.create(patient=self.patient, type='system', title=title, message=title)
+
+    def test_returns_only_notifications_after_the_cursor(self):
+        self.notify_patient('Old')
+        start = self.client.get(self.url).json()
+        self.assertEqual((start['notifications'], start['unread_count']), ([], 1))
+
+        newer = self.notify_patient('New')
+        data = self.client.get(self.url, {'cursor': start['cursor'], 'unread': 1, 'timeout': 0}).json()
+        self.assertEqual([item['notification_id'] for item in data['notifications']], [newer.pk])
+        self.assertEqual((data['cursor'], data['unread_count']), (newer.pk, 2))
+
+        idle = self.client.get(self.url, {'cursor': data['cursor'], 'unread': 2, 'timeout': 0}).json()
+        self.assertEqual((idle['notifications'], idle['cursor']), ([], newer.pk))
+
+    def test_anonymous_is_refused(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_publish_from_another_thread_wakes_the_waiter(self):
+        broker = LocalNotificationBroker()
+
+        async def wait():
+            with broker.subscribe('owner') as subscription:
+                threading.Timer(0.05, broker.publish, ['owner']).start()
+                return await subscription.wait(5)
+
+        started = time_module.monotonic()
+        self.assertTrue(asyncio.run(wait()))
+        self.assertLess(time_module.monotonic() - started, 5)
+        self.assertEqual(dict(broker._subscriptions), {})
+
+
+class NotificationSyncTests(TestCase):
+    """The v2 API sends only what changed since the client's cursor"""
+
+    def setUp(self):
+        cache.clear()
+        self.patient = User.objects.create_user('patient', password='test-pass-123', user_type='patient')
+        self.client.force_login(self.patient)
+        self.url = reverse('appointments:get_notifications_v2')
+        self.first = self.notify_patient('First')
+
+    def notify_patient(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Notification.objects.create(patient=self.patient, type='system', title=title, message=title)
+
+    def sync(self, cursor=None, **extra):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'cursor': cursor} if cursor else {}, **extra)
+        touched = [query['sql'] for query in queries if '"notifications"' in query['sql']]
+        return response, touched
+
+    def test_sends_new_and_changed_notifications(self):
+        response, _ = self.sync()
+        data = response.json()
+        self.assertEqual(([item['id'] for item in data['notifications']], data['unread_count']), ([self.first.pk], 1))
+        self.assertEqual(data['notifications'][0]['created_at'], self.first.created_at.isoformat())
+
+        response, touched = self.sync(data['cursor'])
+        self.assertEqual((response.json()['notifications'], response.json()['cursor']), ([], data['cursor']))
+        self.assertEqual(touched, [])
+
+        second = self.notify_patient('Second')
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_read(self.patient, self.first.pk)
+        response, touched = self.sync(data['cursor'])
+        changed = {item['id']: item['is_read'] for item in response.json()['notifications']}
+        self.assertEqual(changed, {self.first.pk: True, second.pk: False})
+        self.assertEqual((len(touched), response.json()['unread_count']), (1, 1))
+
+    def test_not_modified_until_the_feed_changes(self):
+        response, _ = self.sync()
+        response, touched = self.sync(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((response.status_code, touched), (304, []))
+
+        self.notify_patient('Second')
+        response, _ = self.sync(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_change_made_elsewhere_is_sent_once_the_version_expires(self):
+        response, _ = self.sync()
+        cursor, etag = response.json()['cursor'], response['ETag']
+        # Another process's change: the row is written, this process's feed version is not bumped
+        second = Notification.objects.create(patient=self.patient, type='system', title='Second', message='Second')
+        self.assertEqual(self.sync(cursor)[0].json()['notifications'], [])
+        self.assertEqual(self.sync(HTTP_IF_NONE_MATCH=etag)[0].status_code, 304)
+
+        later = time_module.time() + UNREAD_TIMEOUT + 1
+        with patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertEqual(self.sync(HTTP_IF_NONE_MATCH=etag)[0].status_code, 200)
+            response, _ = self.sync(cursor)
+        self.assertIn(second.pk, [item['id'] for item in response.json()['notifications']])
+
+    def test_attendants_only_get_their_types(self):
+        attendant = User.objects.create_user('attendant', user_type='attendant')
+        for kind in ('confirmation', 'system'):
+            Notification.objects.create(patient=attendant, type=kind, title=kind, message=kind)
+        self.client.force_login(attendant)
+        data = self.client.get(reverse('attendant:get_notifications_v2')).json()
+        self.assertEqual([item['type'] for item in data['notifications']], ['confirmation'])
+
+        data = self.client.get(reverse('attendant:get_notifications_api')).json()
+        self.assertEqual(([item['type'] for item in data['notifications']], data['unread_count']), (['confirmation'], 1))
+
+
+class GenerateLoadDataTests(TestCase):
+    """The load generator is reproducible for a seed and --clear removes only its own rows"""
+
+    options = {'patients': 12, 'attendants': 2, 'years': 1, 'visits': 4, 'chunk_size': 5, 'seed': 5}
+
+    def generate(self, **options):
+        call_command('generate_load_data', stdout=StringIO(), **{**self.options, **options})
+
+    def generated(self):
+        appointment_fields = (
+            'patient__username', 'attendant__last_name', 'appointment_date', 'appointment_time', 'service_id',
+            'product_id', 'status', 'created_at',
+        )
+        return {
+            'patients': list(
+                User.objects.filter(username__startswith='load-patient-').order_by('username').values_list(
+                    'username', 'first_name', 'last_name', 'phone', 'gender', 'birthday', 'created_at'
+                )
+            ),
+            'appointments': list(
+                Appointment.objects.filter(patient__username__startswith='load-')
+                .order_by(*appointment_fields).values_list(*appointment_fields)
+            ),
+            'feedback': list(
+                Feedback.objects.filter(patient__username__startswith='load-')
+                .order_by('appointment__patient__username', 'created_at', 'rating')
+                .values_list('appointment__patient__username', 'created_at', 'rating', 'attendant_rating')
+            ),
+            'slots': list(
+                AppointmentSlot.objects.order_by('attendant__last_name', 'appointment_date', 'appointment_time')
+                .values_list('attendant__last_name', 'appointment_date', 'appointment_time', 'booked')
+            ),
+        }
+
+    def test_same_seed_gives_same_data(self):
+        self.generate()
+        first = self.generated()
+        self.assertTrue(first['appointments'])
+        self.generate(clear=True)
+        self.assertEqual(self.generated(), first)
+        self.generate(clear=True, seed=6)
+        self.assertNotEqual(self.generated(), first)
+
+    def test_clear_replaces_only_generated_rows(self):
+        patient, service, (attendant,) = create_booking_fixtures()
+        own = Appointment.objects.create(
+            patient=patient, attendant=attendant, service=service, status='confirmed',
+            appointment_date=date.today() + timedelta(days=2), appointment_time=time(10, 0),
+        )
+        self.generate()
+        counts = (User.objects.count(), Attendant.objects.count(), Appointment.objects.count())
+        with self.assertRaises(CommandError):
+            self.generate()
+
+        self.generate(clear=True)
+        self.assertEqual((User.objects.count(), Attendant.objects.count(), Appointment.objects.count()), counts)
+        self.assertTrue(Appointment.objects.filter(pk=own.pk).exists())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Reads SQLite query plans')
+class HotQueryIndexTests(TestCase):
+    """The busiest appointment, notification and log queries are answered from an index"""
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f'INDEX {index}', plan, f'{queryset.query}\n{plan}')
+
+    def test_hot_queries_use_their_indexes(self):
+        from services.models import HistoryLog as ServiceHistoryLog
+
+        patient, _, (attendant,) = create_booking_fixtures()
+        today = date.today()
+        hot_queries = [
+            (Appointment.objects.filter(
+                appointment_date=today, appointment_time=time(10, 0), attendant=attendant, status__in=ACTIVE_STATUSES
+            ), 'appt_slot_idx'),
+            (Appointment.objects.filter(appointment_date__in=[today], status__in=ACTIVE_STATUSES).values(
+                'appointment_date', 'attendant_id', 'appointment_time'
+            ).annotate(total=Count('id')), 'appt_slot_idx'),
+            (Appointment.objects.filter(attendant=attendant, appointment_date=today).order_by('appointment_time'),
+             'appt_attendant_date_idx'),
+            (Appointment.objects.filter(patient=patient, status='completed').order_by(
+                '-appointment_date', '-appointment_time'
+            ), 'appt_patient_status_idx'),
+            (Appointment.objects.order_by('-appointment_date', '-appointment_time')[:10], 'appt_slot_idx'),
+            (Appointment.objects.filter(status='pending', product__isnull=True).values('pk'), 'appt_booking_status_idx'),
+            (Appointment.objects.filter(product__isnull=False).order_by('-appointment_date', '-appointment_time')[:10],
+             'appt_preorder_date_idx'),
+            (Notification.objects.filter(patient=patient, is_read=False).values('pk'), 'notif_patient_unread_idx'),
+            (SMSHistory.objects.filter(sender=patient)[:20], 'sms_history_sender_idx'),
+            (HistoryLog.objects.all()[:50], 'history_logs_time_idx'),
+            (HistoryLog.objects.filter(item_type='service')[:50], 'history_logs_item_time_idx'),
+            (ServiceHistoryLog.objects.all()[:50], 'history_log_time_idx'),
+        ]
+        for queryset, index in hot_queries:
+            with self.subTest(index=index):
+                self.assertUsesIndex(queryset, index)
@@ -18,10 +18,13 @@ urlpatterns = [
     path('submit-feedback/<int:appointment_id>/', views.submit_feedback, name='submit_feedback'),
     path('history/', views.patient_history, name='patient_history'),
     path('unavailable-attendant/<int:appointment_id>/', views.handle_unavailable_attendant, name='handle_unavailable_attendant'),
+    path('availability/week/', views.availability_week, name='availability_week'),
     
     # API endpoints for notifications
     path('notifications/get_notifications.php', views.get_notifications_api, name='get_notifications_api'),
     path('notifications/update_notifications.php', views.update_notifications_api, name='update_notifications_api'),
+    path('notifications/v2/', views.get_notifications_v2, name='get_notifications_v2'),
+    path('notifications/stream/', views.notification_stream, name='notification_stream'),
     
     # Admin URLs
     path('admin/dashboard/', admin_views.admin_dashboard, name='admin_dashboard'),
@@ -3,10 +3,17 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
 from django.http import JsonResponse
+from django.db.models import Q
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
 from datetime import datetime, time as time_obj
 from .models import Appointment, Notification
+from .notifications import (
+    STREAM_TIMEOUT, mark_all_read, mark_read, notification_etag, notification_payload, notify_owners,
+    recent_notifications, sync_response, unread_count, wait_for_changes,
+)
+from .availability import SlotAvailabilityIndex, SLOT_TIMES
+from .reservations import book_appointment, SlotUnavailable, OutOfStock
 from accounts.models import User, Attendant, AttendantProfile
 from services.models import Service
 from products.models import Product
@@ -15,6 +22,23 @@ from services.utils import send_appointment_sms, send_attendant_assignment_sms
 import json
 
 
+def _schedule_error(attendant, schedule, day_name, appointment_time_obj):
+    """Return an error message if the slot is outside the attendant's work schedule"""
+    if not schedule:
+        # No profile found, proceed without schedule check (backward compatibility)
+        return None
+    
+    # Check if it's a work day
+    if day_name not in schedule['work_days']:
+        return f'{attendant.first_name} {attendant.last_name} is not available on {day_name}. Please choose another day or attendant.'
+    
+    # Check if time is within work hours
+    if appointment_time_obj < schedule['start_time'] or appointment_time_obj >= schedule['end_time']:
+        return f'Appointment time must be between {schedule["start_time"].strftime("%I:%M %p")} and {schedule["end_time"].strftime("%I:%M %p")} for {attendant.first_name} {attendant.last_name}.'
+    
+    return None
+
+
 @login_required
 def my_appointments(request):
     """User's appointments"""
@@ -96,46 +120,11 @@ def book_service(request, service_id):
             day_name = appointment_datetime.strftime('%A')
             appointment_time_obj = datetime.strptime(appointment_time, "%H:%M").time()
             
-            # Check if attendant has a profile
-            attendant_available = True
-            try:
-                user = User.objects.get(user_type='attendant', first_name=attendant.first_name, last_name=attendant.last_name)
-                profile = getattr(user, 'attendant_profile', None)
-                
-                if profile:
-                    # Check if it's a work day
-                    if day_name not in profile.work_days:
-                        messages.error(request, f'{attendant.first_name} {attendant.last_name} is not available on {day_name}. Please choose another day or attendant.')
-                        context = {
-                            'service': service,
-                            'attendants': Attendant.objects.all(),
-                        }
-                        return render(request, 'appointments/book_service.html', context)
-                    
-                    # Check if time is within work hours
-                    if appointment_time_obj < profile.start_time or appointment_time_obj >= profile.end_time:
-                        messages.error(request, f'Appointment time must be between {profile.start_time.strftime("%I:%M %p")} and {profile.end_time.strftime("%I:%M %p")} for {attendant.first_name} {attendant.last_name}.')
-                        context = {
-                            'service': service,
-                            'attendants': Attendant.objects.all(),
-                        }
-                        return render(request, 'appointments/book_service.html', context)
-                    attendant_available = True
-            except (User.DoesNotExist, User.MultipleObjectsReturned):
-                # If no user found, proceed without schedule check (backward compatibility)
-                attendant_available = True
-            
-            # Check for existing appointments at the same time slot
-            existing_appointments = Appointment.objects.filter(
-                appointment_date=appointment_date,
-                appointment_time=appointment_time,
-                attendant_id=attendant.id,
-                status__in=['pending', 'confirmed']
-            ).count()
-            
-            # Maximum 3 patients per time slot
-            if existing_appointments >= 3:
-                messages.error(request, 'This time slot is fully booked. Please choose another time.')
+            index = SlotAvailabilityIndex.for_date(appointment_date)
+            schedule = index.schedule_for(attendant.id)
+            schedule_error = _schedule_error(attendant, schedule, day_name, appointment_time_obj)
+            if schedule_error:
+                messages.error(request, schedule_error)
                 context = {
                     'service': service,
                     'attendants': Attendant.objects.all(),
@@ -147,24 +136,26 @@ def book_service(request, service_id):
             transaction_id = str(uuid.uuid4())[:8].upper()
             
             # Auto-confirm if attendant is available (has profile with matching schedule)
-            initial_status = 'pending'
-            try:
-                user = User.objects.get(user_type='attendant', first_name=attendant.first_name, last_name=attendant.last_name)
-                profile = getattr(user, 'attendant_profile', None)
-                if profile and day_name in profile.work_days and profile.start_time <= appointment_time_obj < profile.end_time:
-                    initial_status = 'confirmed'  # Auto-confirm when attendant is available
-            except (User.DoesNotExist, User.MultipleObjectsReturned):
-                pass
+            initial_status = 'confirmed' if schedule else 'pending'
             
-            appointment = Appointment.objects.create(
-                patient=request.user,
-                service=service,
-                attendant=attendant,
-                appointment_date=appointment_date,
-                appointment_time=appointment_time,
-                status=initial_status,
-                transaction_id=transaction_id
-            )
+            # Reserve a seat (maximum 3 patients per time slot) and create the appointment atomically
+            try:
+                appointment = book_appointment(
+                    patient=request.user,
+                    service=service,
+                    attendant=attendant,
+                    appointment_date=appointment_date,
+                    appointment_time=appointment_time,
+                    status=initial_status,
+                    transaction_id=transaction_id
+                )
+            except SlotUnavailable:
+                messages.error(request, 'This time slot is fully booked. Please choose another time.')
+                context = {
+                    'service': service,
+                    'attendants': Attendant.objects.all(),
+                }
+                return render(request, 'appointments/book_service.html', context)
             
             # Create notification
             Notification.objects.create(
@@ -176,21 +167,17 @@ def book_service(request, service_id):
             )
             
             # Notify owner of new appointment booking
-            from accounts.models import User as UserModel
-            owner_users = UserModel.objects.filter(user_type='owner', is_active=True)
-            for owner in owner_users:
-                Notification.objects.create(
-                    type='appointment',
-                    appointment_id=appointment.id,
-                    title='New Appointment Booked',
-                    message=f'New appointment booked: {appointment.patient.get_full_name()} - {appointment.get_service_name()} on {appointment.appointment_date} at {appointment.appointment_time}. Status: {appointment.status}.',
-                    patient=None  # Owner notification
-                )
+            notify_owners(
+                type='appointment',
+                appointment_id=appointment.id,
+                title='New Appointment Booked',
+                message=f'New appointment booked: {appointment.patient.get_full_name()} - {appointment.get_service_name()} on {appointment.appointment_date} at {appointment.appointment_time}. Status: {appointment.status}.',
+            )
             
             # Send SMS confirmation to patient
             sms_result = send_appointment_sms(appointment, 'confirmation')
             if sms_result['success']:
-                messages.success(request, f'Appointment {"booked" if initial_status == "pending" else "confirmed automatically"}! SMS confirmation sent. Transaction ID: {transaction_id}')
+                messages.success(request, f'Appointment {"booked" if initial_status == "pending" else "confirmed automatically"}! SMS confirmation queued. Transaction ID: {transaction_id}')
             else:
                 messages.success(request, f'Appointment {"booked" if initial_status == "pending" else "confirmed automatically"}! (SMS notification failed) Transaction ID: {transaction_id}')
             
@@ -231,26 +218,10 @@ def book_service(request, service_id):
     if selected_date and selected_time:
         try:
             appointment_datetime = datetime.strptime(f"{selected_date} {selected_time}", "%Y-%m-%d %H:%M")
-            day_name = appointment_datetime.strftime('%A')
-            appointment_time_obj = datetime.strptime(selected_time, "%H:%M").time()
-            
-            # Filter attendants by availability
-            available_attendant_ids = []
-            for attendant in Attendant.objects.all():
-                try:
-                    user = User.objects.get(user_type='attendant', first_name=attendant.first_name, last_name=attendant.last_name, is_active=True)
-                    profile = getattr(user, 'attendant_profile', None)
-                    if profile:
-                        if day_name in profile.work_days and profile.start_time <= appointment_time_obj < profile.end_time:
-                            available_attendant_ids.append(attendant.id)
-                    else:
-                        # If no profile, include by default (backward compatibility)
-                        available_attendant_ids.append(attendant.id)
-                except (User.DoesNotExist, User.MultipleObjectsReturned):
-                    # If no user found, include by default (backward compatibility)
-                    available_attendant_ids.append(attendant.id)
             
-            available_attendants = Attendant.objects.filter(id__in=available_attendant_ids)
+            # Filter attendants by schedule and remaining capacity
+            index = SlotAvailabilityIndex.for_date(appointment_datetime.date())
+            available_attendants = Attendant.objects.filter(id__in=index.available_attendant_ids(selected_time))
         except (ValueError, TypeError):
             # If date/time parsing fails, show all attendants
             pass
@@ -290,23 +261,26 @@ def book_product(request, product_id):
             import uuid
             transaction_id = str(uuid.uuid4())[:8].upper()
             
-            # Auto-confirm pre-order if stock is available
-            initial_status = 'confirmed' if product.stock > 0 else 'pending'
+            # Auto-confirm pre-order and deduct stock atomically while stock is available
+            initial_status = 'confirmed'
             
-            appointment = Appointment.objects.create(
-                patient=request.user,
-                product=product,
-                attendant=attendant,
-                appointment_date=appointment_date,
-                appointment_time=appointment_time,
-                status=initial_status,
-                transaction_id=transaction_id
-            )
-            
-            # Deduct stock when pre-order is confirmed
-            if initial_status == 'confirmed':
-                product.stock -= 1
-                product.save()
+            try:
+                appointment = book_appointment(
+                    capacity=None,  # Product pickups are not limited per slot
+                    patient=request.user,
+                    product=product,
+                    attendant=attendant,
+                    appointment_date=appointment_date,
+                    appointment_time=appointment_time,
+                    status=initial_status,
+                    transaction_id=transaction_id
+                )
+            except OutOfStock:
+                messages.error(request, f'Sorry, {product.product_name} is currently out of stock. Please check back later or contact the clinic.')
+                context = {
+                    'product': product,
+                }
+                return render(request, 'appointments/book_product.html', context)
             
             # Create notification
             Notification.objects.create(
@@ -318,21 +292,17 @@ def book_product(request, product_id):
             )
             
             # Notify owner of product pre-order
-            from accounts.models import User as UserModel
-            owner_users = UserModel.objects.filter(user_type='owner', is_active=True)
-            for owner in owner_users:
-                Notification.objects.create(
-                    type='appointment',
-                    appointment_id=appointment.id,
-                    title='Product Pre-Order',
-                    message=f'Product pre-order: {request.user.get_full_name()} - {product.product_name} on {appointment_date} at {appointment_time}. Status: {initial_status}.',
-                    patient=None  # Owner notification
-                )
+            notify_owners(
+                type='appointment',
+                appointment_id=appointment.id,
+                title='Product Pre-Order',
+                message=f'Product pre-order: {request.user.get_full_name()} - {product.product_name} on {appointment_date} at {appointment_time}. Status: {initial_status}.',
+            )
             
             # Send SMS confirmation
             sms_result = send_appointment_sms(appointment, 'confirmation')
             if sms_result['success']:
-                messages.success(request, f'Product pre-ordered successfully! SMS confirmation sent. Transaction ID: {transaction_id}')
+                messages.success(request, f'Product pre-ordered successfully! SMS confirmation queued. Transaction ID: {transaction_id}')
             else:
                 messages.success(request, f'Product pre-ordered successfully! (SMS notification failed) Transaction ID: {transaction_id}')
             return redirect('appointments:my_appointments')
@@ -387,44 +357,11 @@ def book_package(request, package_id):
             day_name = appointment_datetime.strftime('%A')
             appointment_time_obj = datetime.strptime(appointment_time, "%H:%M").time()
             
-            # Check if attendant has a profile
-            try:
-                user = User.objects.get(user_type='attendant', first_name=attendant.first_name, last_name=attendant.last_name)
-                profile = getattr(user, 'attendant_profile', None)
-                
-                if profile:
-                    # Check if it's a work day
-                    if day_name not in profile.work_days:
-                        messages.error(request, f'{attendant.first_name} {attendant.last_name} is not available on {day_name}. Please choose another day or attendant.')
-                        context = {
-                            'package': package,
-                            'attendants': Attendant.objects.all(),
-                        }
-                        return render(request, 'appointments/book_package.html', context)
-                    
-                    # Check if time is within work hours
-                    if appointment_time_obj < profile.start_time or appointment_time_obj >= profile.end_time:
-                        messages.error(request, f'Appointment time must be between {profile.start_time.strftime("%I:%M %p")} and {profile.end_time.strftime("%I:%M %p")} for {attendant.first_name} {attendant.last_name}.')
-                        context = {
-                            'package': package,
-                            'attendants': Attendant.objects.all(),
-                        }
-                        return render(request, 'appointments/book_package.html', context)
-            except (User.DoesNotExist, User.MultipleObjectsReturned):
-                # If no user found, proceed without schedule check (backward compatibility)
-                pass
-            
-            # Check for existing appointments at the same time slot
-            existing_appointments = Appointment.objects.filter(
-                appointment_date=appointment_date,
-                appointment_time=appointment_time,
-                attendant_id=attendant.id,
-                status__in=['pending', 'confirmed']
-            ).count()
-            
-            # Maximum 3 patients per time slot
-            if existing_appointments >= 3:
-                messages.error(request, 'This time slot is fully booked. Please choose another time.')
+            index = SlotAvailabilityIndex.for_date(appointment_date)
+            schedule = index.schedule_for(attendant.id)
+            schedule_error = _schedule_error(attendant, schedule, day_name, appointment_time_obj)
+            if schedule_error:
+                messages.error(request, schedule_error)
                 context = {
                     'package': package,
                     'attendants': Attendant.objects.all(),
@@ -436,24 +373,26 @@ def book_package(request, package_id):
             transaction_id = str(uuid.uuid4())[:8].upper()
             
             # Auto-confirm if attendant is available (has profile with matching schedule)
-            initial_status = 'pending'
-            try:
-                user = User.objects.get(user_type='attendant', first_name=attendant.first_name, last_name=attendant.last_name)
-                profile = getattr(user, 'attendant_profile', None)
-                if profile and day_name in profile.work_days and profile.start_time <= appointment_time_obj < profile.end_time:
-                    initial_status = 'confirmed'  # Auto-confirm when attendant is available
-            except (User.DoesNotExist, User.MultipleObjectsReturned):
-                pass
+            initial_status = 'confirmed' if schedule else 'pending'
             
-            appointment = Appointment.objects.create(
-                patient=request.user,
-                package=package,
-                attendant=attendant,
-                appointment_date=appointment_date,
-                appointment_time=appointment_time,
-                status=initial_status,
-                transaction_id=transaction_id
-            )
+            # Reserve a seat (maximum 3 patients per time slot) and create the appointment atomically
+            try:
+                appointment = book_appointment(
+                    patient=request.user,
+                    package=package,
+                    attendant=attendant,
+                    appointment_date=appointment_date,
+                    appointment_time=appointment_time,
+                    status=initial_status,
+                    transaction_id=transaction_id
+                )
+            except SlotUnavailable:
+                messages.error(request, 'This time slot is fully booked. Please choose another time.')
+                context = {
+                    'package': package,
+                    'attendants': Attendant.objects.all(),
+                }
+                return render(request, 'appointments/book_package.html', context)
             
             # Create notification
             Notification.objects.create(
@@ -465,16 +404,12 @@ def book_package(request, package_id):
             )
             
             # Notify owner of package booking
-            from accounts.models import User as UserModel
-            owner_users = UserModel.objects.filter(user_type='owner', is_active=True)
-            for owner in owner_users:
-                Notification.objects.create(
-                    type='appointment',
-                    appointment_id=appointment.id,
-                    title='Package Booked',
-                    message=f'Package booking: {request.user.get_full_name()} - {package.package_name} on {appointment_date} at {appointment_time}. Status: {initial_status}.',
-                    patient=None  # Owner notification
-                )
+            notify_owners(
+                type='appointment',
+                appointment_id=appointment.id,
+                title='Package Booked',
+                message=f'Package booking: {request.user.get_full_name()} - {package.package_name} on {appointment_date} at {appointment_time}. Status: {initial_status}.',
+            )
             
             messages.success(request, f'Package {"booked" if initial_status == "pending" else "confirmed automatically"}! Transaction ID: {transaction_id}')
             return redirect('appointments:my_appointments')
@@ -489,26 +424,10 @@ def book_package(request, package_id):
     if selected_date and selected_time:
         try:
             appointment_datetime = datetime.strptime(f"{selected_date} {selected_time}", "%Y-%m-%d %H:%M")
-            day_name = appointment_datetime.strftime('%A')
-            appointment_time_obj = datetime.strptime(selected_time, "%H:%M").time()
             
-            # Filter attendants by availability
-            available_attendant_ids = []
-            for attendant in Attendant.objects.all():
-                try:
-                    user = User.objects.get(user_type='attendant', first_name=attendant.first_name, last_name=attendant.last_name, is_active=True)
-                    profile = getattr(user, 'attendant_profile', None)
-                    if profile:
-                        if day_name in profile.work_days and profile.start_time <= appointment_time_obj < profile.end_time:
-                            available_attendant_ids.append(attendant.id)
-                    else:
-                        # If no profile, include by default (backward compatibility)
-                        available_attendant_ids.append(attendant.id)
-                except (User.DoesNotExist, User.MultipleObjectsReturned):
-                    # If no user found, include by default (backward compatibility)
-                    available_attendant_ids.append(attendant.id)
-            
-            available_attendants = Attendant.objects.filter(id__in=available_attendant_ids)
+            # Filter attendants by schedule and remaining capacity
+            index = SlotAvailabilityIndex.for_date(appointment_datetime.date())
+            available_attendants = Attendant.objects.filter(id__in=index.available_attendant_ids(selected_time))
         except (ValueError, TypeError):
             # If date/time parsing fails, show all attendants
             pass
@@ -526,10 +445,12 @@ def book_package(request, package_id):
 @login_required
 def notifications(request):
     """User's notifications"""
-    notifications = Notification.objects.filter(patient=request.user).order_by('-created_at')
+    notifications = Notification.objects.filter(
+        Q(patient=request.user) | Q(deliveries__recipient=request.user)
+    ).order_by('-created_at')
     
     # Mark notifications as read
-    notifications.update(is_read=True)
+    mark_all_read(request.user)
     
     context = {
         'notifications': notifications,
@@ -590,16 +511,12 @@ def request_cancellation(request, appointment_id):
         )
         
         # Notify owner of cancellation request
-        from accounts.models import User as UserModel
-        owner_users = UserModel.objects.filter(user_type='owner', is_active=True)
-        for owner in owner_users:
-            Notification.objects.create(
-                type='cancellation',
-                appointment_id=appointment.id,
-                title='Cancellation Request',
-                message=f'Patient {request.user.full_name} has requested to cancel their appointment for {appointment.get_service_name()} on {appointment.appointment_date} at {appointment.appointment_time}.',
-                patient=None  # Owner notification
-            )
+        notify_owners(
+            type='cancellation',
+            appointment_id=appointment.id,
+            title='Cancellation Request',
+            message=f'Patient {request.user.full_name} has requested to cancel their appointment for {appointment.get_service_name()} on {appointment.appointment_date} at {appointment.appointment_time}.',
+        )
         
         messages.success(request, 'Your cancellation request has been submitted. The staff will review it shortly.')
         return redirect('appointments:my_appointments')
@@ -720,16 +637,12 @@ def request_reschedule(request, appointment_id):
         )
         
         # Notify owner of reschedule request
-        from accounts.models import User as UserModel
-        owner_users = UserModel.objects.filter(user_type='owner', is_active=True)
-        for owner in owner_users:
-            Notification.objects.create(
-                type='reschedule',
-                appointment_id=appointment.id,
-                title='Reschedule Request',
-                message=f'Patient {request.user.full_name} has requested to reschedule their appointment for {appointment.get_service_name()} from {appointment.appointment_date} at {appointment.appointment_time} to {new_date} at {new_time}.',
-                patient=None  # Owner notification
-            )
+        notify_owners(
+            type='reschedule',
+            appointment_id=appointment.id,
+            title='Reschedule Request',
+            message=f'Patient {request.user.full_name} has requested to reschedule their appointment for {appointment.get_service_name()} from {appointment.appointment_date} at {appointment.appointment_time} to {new_date} at {new_time}.',
+        )
         
         messages.success(request, 'Your reschedule request has been submitted. The staff will review it shortly.')
         return redirect('appointments:my_appointments')
@@ -794,6 +707,33 @@ def submit_feedback(request, appointment_id):
     return redirect('appointments:my_appointments')
 
 
+@login_required
+@require_http_methods(["GET"])
+def availability_week(request):
+    """API endpoint returning the free/full slot grid for a whole week"""
+    try:
+        start = datetime.strptime(request.GET.get('start', ''), "%Y-%m-%d").date()
+    except ValueError:
+        start = timezone.now().date()
+    
+    attendant_id = request.GET.get('attendant')
+    try:
+        attendant_id = int(attendant_id) if attendant_id else None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid attendant'}, status=400)
+    
+    days = {}
+    for index in SlotAvailabilityIndex.for_range(start, 7):
+        days[index.day.isoformat()] = index.grid(attendant_id)
+    
+    return JsonResponse({
+        'success': True,
+        'start': start.isoformat(),
+        'slots': SLOT_TIMES,
+        'days': days,
+    })
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_notifications_api(request):
@@ -806,11 +746,11 @@ def get_notifications_api(request):
             # For admin, show all notifications
             notifications = Notification.objects.filter(patient__isnull=True).order_by('-created_at')[:10]
         else:
-            # For patients, show their notifications
-            notifications = Notification.objects.filter(patient=request.user).order_by('-created_at')[:10]
+            # For patients and owners, show their own and fanned-out notifications
+            notifications = recent_notifications(request.user)
         
         # Count unread notifications
-        unread_count = notifications.filter(is_read=False).count()
+        unread = unread_count(request.user)
         
         # Format notifications
         notifications_data = []
@@ -826,13 +766,60 @@ def get_notifications_api(request):
         return JsonResponse({
             'success': True,
             'notifications': notifications_data,
-            'unread_count': unread_count
+            'unread_count': unread
         })
     
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
 
+@require_http_methods(["GET"])
+@condition(etag_func=notification_etag)
+def get_notifications_v2(request):
+    """
+    API endpoint to sync notifications (v2 of get_notifications.php)
+
+    Returns the notifications created, read or unread since ?cursor=, the
+    unread count and the cursor for the next call; 304 when the feed has not
+    changed since the client's ETag.
+    """
+    return sync_response(request)
+
+
+@require_http_methods(["GET"])
+async def notification_stream(request):
+    """
+    Long-poll for notification changes (replaces polling get_notifications.php)
+
+    Query parameters: cursor, the newest notification id the client has; unread,
+    the count it shows; timeout, seconds to wait (at most STREAM_TIMEOUT).
+    Answers as soon as there are newer notifications or the unread count
+    differs, else with an empty list at the timeout. Serve it through asgi.py so
+    waiting requests do not hold a worker thread.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'success': False, 'error': 'Not authenticated'}, status=401)
+
+    def number(name, cast):
+        try:
+            return cast(request.GET[name])
+        except (KeyError, ValueError):
+            return None
+
+    timeout = number('timeout', float)
+    timeout = STREAM_TIMEOUT if timeout is None else min(max(timeout, 0), STREAM_TIMEOUT)
+    notifications, cursor, unread = await wait_for_changes(
+        user, number('cursor', int), number('unread', int), timeout
+    )
+    return JsonResponse({
+        'success': True,
+        'cursor': cursor,
+        'unread_count': unread,
+        'notifications': [notification_payload(notification) for notification in reversed(notifications)],
+    })
+
+
 @csrf_exempt
 @require_http_methods(["POST"])
 def update_notifications_api(request):
@@ -853,17 +840,16 @@ def update_notifications_api(request):
         
         if action == 'mark_read':
             if notification_id:
-                notification = get_object_or_404(Notification, id=notification_id)
-                if request.user.user_type == 'admin' or notification.patient == request.user:
+                if request.user.user_type == 'admin':
+                    notification = get_object_or_404(Notification, id=notification_id)
                     notification.is_read = True
                     notification.save()
                     return JsonResponse({'success': True})
+                if mark_read(request.user, notification_id):
+                    return JsonResponse({'success': True})
         
         elif action == 'mark_all_read':
-            if request.user.user_type == 'admin':
-                Notification.objects.filter(patient__isnull=True).update(is_read=True)
-            else:
-                Notification.objects.filter(patient=request.user).update(is_read=True)
+            mark_all_read(request.user)
             return JsonResponse({'success': True})
         
         return JsonResponse({'success': False, 'error': 'Invalid action'})
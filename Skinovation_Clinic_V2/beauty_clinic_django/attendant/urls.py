@@ -21,4 +21,5 @@ urlpatterns = [
     # API endpoints
     path('api/notifications/', views.get_notifications_api, name='get_notifications_api'),
     path('api/notifications/update/', views.update_notifications_api, name='update_notifications_api'),
+    path('api/v2/notifications/', views.get_notifications_v2, name='get_notifications_v2'),
 ]
@@ -5,11 +5,15 @@ from django.utils import timezone
 from django.db.models import Q
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
 from accounts.models import User, Attendant
 from appointments.models import Appointment, Notification
+from appointments.notifications import invalidate_unread_counts, notification_etag, sync_response, unread_count
 import json
 
+# Notification types attendants follow
+NOTIFICATION_TYPES = ['appointment', 'confirmation', 'cancellation']
+
 
 def is_attendant(user):
     """Check if user is attendant"""
@@ -64,10 +68,7 @@ def attendant_dashboard(request):
     upcoming_count = upcoming_appointments.count()
     
     # Get notification count
-    notification_count = Notification.objects.filter(
-        patient=request.user,
-        is_read=False
-    ).count()
+    notification_count = unread_count(request.user)
     
     context = {
         'today_appointments': today_appointments,
@@ -610,10 +611,11 @@ def get_notifications_api(request):
         # Filter notifications for the current attendant user
         notifications = Notification.objects.filter(
             patient=request.user,
-            type__in=['appointment', 'confirmation', 'cancellation']
-        ).order_by('-created_at')[:20]
-        
-        unread_count = notifications.filter(is_read=False).count()
+            type__in=NOTIFICATION_TYPES
+        )
+        # Count only the listed types, unlike the all-types cached badge counter
+        unread = notifications.filter(is_read=False).count()
+        notifications = notifications.order_by('-created_at')[:20]
         
         notifications_data = []
         for notification in notifications:
@@ -629,7 +631,7 @@ def get_notifications_api(request):
         return JsonResponse({
             'success': True,
             'notifications': notifications_data,
-            'unread_count': unread_count
+            'unread_count': unread
         })
     except Exception as e:
         return JsonResponse({
@@ -638,6 +640,15 @@ def get_notifications_api(request):
         })
 
 
+@login_required
+@user_passes_test(is_attendant)
+@require_http_methods(["GET"])
+@condition(etag_func=notification_etag)
+def get_notifications_v2(request):
+    """API endpoint to sync attendant notifications since a cursor; see appointments.views.get_notifications_v2"""
+    return sync_response(request, types=NOTIFICATION_TYPES)
+
+
 @csrf_exempt
 @login_required
 @user_passes_test(is_attendant)
@@ -657,8 +668,10 @@ def update_notifications_api(request):
                     
             elif action == 'mark_all_read':
                 Notification.objects.filter(
-                    type__in=['appointment', 'confirmation', 'cancellation']
-                ).update(is_read=True)
+                    type__in=['appointment', 'confirmation', 'cancellation'], is_read=False
+                ).update(is_read=True, updated_at=timezone.now())
+                # The update spans many users, so recount their unread counters
+                invalidate_unread_counts()
             
             return JsonResponse({'success': True})
         else:
@@ -0,0 +1,331 @@
+from datetime import timedelta
+from io import StringIO
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from .query_budget import QueryRecorder
+import django
+import fnmatch
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+# Version of the results file layout; bump it when fields change meaning
+RESULTS_SCHEMA = 1
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Slower runs smaller than this are treated as noise when comparing results
+NOISE_FLOOR_MS = 1.0
+
+
+class Benchmark:
+    """
+    One timed operation
+
+    `run` is called once per iteration inside a transaction that is rolled back
+    afterwards, so operations that write (booking POSTs, API updates) see the
+    same data every time. `setup` runs before each iteration and is not timed.
+    """
+
+    def __init__(self, name, group, run, setup=None):
+        self.name = name
+        self.group = group
+        self.run = run
+        self.setup = setup
+
+
+def percentile(samples, pct):
+    """Percentile of a list of numbers with linear interpolation"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * pct / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _iteration(benchmark, trace_memory=False):
+    """Run one iteration; returns (seconds, QueryRecorder, peak bytes, result)"""
+    if benchmark.setup:
+        benchmark.setup()
+    recorder = QueryRecorder()
+    peak = 0
+    with transaction.atomic():
+        if trace_memory:
+            tracemalloc.start()
+        try:
+            with connection.execute_wrapper(recorder):
+                started = time.perf_counter()
+                result = benchmark.run()
+                seconds = time.perf_counter() - started
+            if trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+            transaction.set_rollback(True)
+    return seconds, recorder, peak, result
+
+
+def measure(benchmark, runs=20, warmup=2):
+    """
+    Time a benchmark
+
+    Latency and queries come from `runs` timed iterations after `warmup`
+    untimed ones. Peak memory comes from one extra iteration under
+    tracemalloc, which would otherwise slow the timed runs down.
+
+    Returns:
+        dict: Latency percentiles (ms), query counts, database time, peak memory
+            and the response status codes seen, for view benchmarks
+    """
+    for _ in range(warmup):
+        _iteration(benchmark)
+
+    latencies, queries, db_seconds, statuses = [], [], [], []
+    for _ in range(max(runs, 1)):
+        seconds, recorder, _, result = _iteration(benchmark)
+        latencies.append(seconds * 1000)
+        queries.append(recorder.count)
+        db_seconds.append(recorder.seconds)
+        status = getattr(result, 'status_code', None)
+        if status is not None:
+            statuses.append(status)
+    _, _, peak, _ = _iteration(benchmark, trace_memory=True)
+
+    latency = {f'p{pct}': round(percentile(latencies, pct), 3) for pct in PERCENTILES}
+    latency.update(
+        min=round(min(latencies), 3),
+        max=round(max(latencies), 3),
+        mean=round(statistics.fmean(latencies), 3),
+    )
+    return {
+        'group': benchmark.group,
+        'runs': len(latencies),
+        'latency_ms': latency,
+        'queries': max(queries),
+        'queries_min': min(queries),
+        'db_ms': round(statistics.median(db_seconds) * 1000, 3),
+        'peak_memory_kb': round(peak / 1024, 1),
+        'status_codes': sorted(set(statuses)),
+        'errors': sum(1 for status in statuses if status >= 400),
+    }
+
+
+class BenchmarkData:
+    """
+    Users and records the benchmarks act on, picked from the loaded dataset
+
+    Owner and admin accounts are created for the run; call it inside a
+    transaction that is rolled back so they are not kept.
+    """
+
+    def __init__(self):
+        from accounts.models import User
+        from appointments.availability import SLOT_TIMES, SlotAvailabilityIndex
+        from appointments.models import Notification
+        from packages.models import Package
+        from products.models import Product
+        from services.models import Service
+
+        self.owner = User.objects.create_user('benchmark-owner', user_type='owner', first_name='Benchmark', last_name='Owner')
+        self.admin = User.objects.create_user('benchmark-admin', user_type='admin', first_name='Benchmark', last_name='Admin')
+
+        # A patient with notifications, so the API has something to return
+        patient_id = (
+            Notification.objects.filter(patient__user_type='patient').values_list('patient_id', flat=True).first()
+            or User.objects.filter(user_type='patient').values_list('pk', flat=True).first()
+        )
+        self.patient = User.objects.filter(pk=patient_id).first()
+
+        self.service = Service.objects.filter(archived=False).first()
+        self.product = Product.objects.filter(archived=False, stock__gt=0).first()
+        self.package = Package.objects.filter(archived=False).first()
+
+        # First upcoming slot with a free seat, so booking POSTs take the success path
+        self.slot = None
+        today = timezone.localdate()
+        for index in SlotAvailabilityIndex.for_range(today + timedelta(days=1), 14):
+            for slot_time in SLOT_TIMES:
+                available = index.available_attendant_ids(slot_time)
+                if available:
+                    self.slot = {
+                        'appointment_date': index.day.isoformat(),
+                        'appointment_time': slot_time,
+                        'attendant': available[0],
+                    }
+                    break
+            if self.slot:
+                break
+
+    def missing(self):
+        """Names of the records the dataset lacks"""
+        return [name for name in ('patient', 'service', 'product', 'package', 'slot') if getattr(self, name) is None]
+
+
+def _client(user):
+    client = Client(raise_request_exception=False)
+    client.force_login(user)
+    return client
+
+
+def _view(client, url, method='get', **data):
+    return lambda: getattr(client, method)(url, data) if data else getattr(client, method)(url)
+
+
+def build_benchmarks(data):
+    """
+    The benchmark suite for the given dataset
+
+    Returns:
+        list: Benchmark objects, in run order
+    """
+    from analytics.cache import invalidate_sections
+    from analytics.services import AnalyticsService
+
+    benchmarks = []
+    for method in (
+        'get_business_overview', 'get_revenue_analytics', 'get_patient_analytics', 'get_service_analytics',
+        'get_treatment_correlations', 'get_business_insights', 'get_diagnostic_metrics',
+    ):
+        # A new service per run, so sections memoized on the instance are recomputed
+        benchmarks.append(Benchmark(
+            f'service:{method}', 'analytics', lambda method=method: getattr(AnalyticsService(), method)()
+        ))
+
+    owner, admin, patient = _client(data.owner), _client(data.admin), _client(data.patient)
+    for name in ('owner:dashboard', 'owner:analytics'):
+        benchmarks.append(Benchmark(f'view:{name}', 'views', _view(owner, reverse(name)), setup=invalidate_sections))
+        benchmarks.append(Benchmark(f'view:{name}:warm', 'views', _view(owner, reverse(name))))
+    for name in (
+        'analytics:dashboard', 'analytics:patient_analytics', 'analytics:service_analytics',
+        'analytics:treatment_correlations', 'analytics:business_insights',
+    ):
+        benchmarks.append(Benchmark(f'view:{name}', 'views', _view(owner, reverse(name)), setup=invalidate_sections))
+    for name in ('appointments:admin_patients', 'appointments:admin_appointments'):
+        benchmarks.append(Benchmark(f'view:{name}', 'views', _view(admin, reverse(name))))
+
+    slot = data.slot or {}
+    benchmarks += [
+        Benchmark(
+            'post:appointments:book_service', 'booking',
+            _view(patient, reverse('appointments:book_service', args=[data.service.pk]), 'post', **slot),
+        ),
+        Benchmark(
+            'post:appointments:book_product', 'booking',
+            _view(patient, reverse('appointments:book_product', args=[data.product.pk]), 'post', **slot),
+        ),
+        Benchmark(
+            'post:appointments:book_package', 'booking',
+            _view(patient, reverse('appointments:book_package', args=[data.package.pk]), 'post', **slot),
+        ),
+        Benchmark('api:get_notifications', 'notifications', _view(patient, reverse('appointments:get_notifications_api'))),
+        Benchmark('api:get_notifications_v2', 'notifications', _view(patient, reverse('appointments:get_notifications_v2'))),
+        Benchmark(
+            'api:update_notifications', 'notifications',
+            _view(patient, reverse('appointments:update_notifications_api'), 'post', action='mark_all_read'),
+        ),
+        Benchmark(
+            'command:send_reminders --dry-run', 'commands',
+            lambda: call_command('send_reminders', dry_run=True, stdout=StringIO()),
+        ),
+    ]
+    return benchmarks
+
+
+def select_benchmarks(benchmarks, patterns):
+    """Benchmarks whose name or group matches any of the shell-style patterns"""
+    if not patterns:
+        return benchmarks
+    return [
+        benchmark for benchmark in benchmarks
+        if any(fnmatch.fnmatch(benchmark.name, pattern) or benchmark.group == pattern for pattern in patterns)
+    ]
+
+
+def _git(*args):
+    try:
+        return subprocess.run(
+            ['git', *args], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=10, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def describe_environment():
+    """Commit, versions and dataset size, so results files can be compared fairly"""
+    from accounts.models import User
+    from appointments.models import Appointment, Feedback, Notification
+
+    try:
+        import numpy  # noqa: F401
+        has_numpy = True
+    except ImportError:
+        has_numpy = False
+
+    return {
+        'commit': _git('rev-parse', 'HEAD'),
+        'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'numpy': has_numpy,
+        'dataset': {
+            'patients': User.objects.filter(user_type='patient').count(),
+            'appointments': Appointment.objects.count(),
+            'feedback': Feedback.objects.count(),
+            'notifications': Notification.objects.count(),
+        },
+    }
+
+
+def compare_results(baseline, current, threshold=10.0):
+    """
+    Compare two results files benchmark by benchmark
+
+    A benchmark regressed when its median latency grew by more than
+    `threshold` percent (and NOISE_FLOOR_MS), or when it ran more queries.
+
+    Returns:
+        list: Dicts with name, p50 before/after, change %, queries before/after,
+            peak memory before/after and a regressed flag
+    """
+    rows = []
+    for name, after in current['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            continue
+        p50_before, p50_after = before['latency_ms']['p50'], after['latency_ms']['p50']
+        change = (p50_after - p50_before) / p50_before * 100 if p50_before else 0.0
+        slower = change > threshold and p50_after - p50_before > NOISE_FLOOR_MS
+        rows.append({
+            'name': name,
+            'p50_before': p50_before,
+            'p50_after': p50_after,
+            'change': change,
+            'queries_before': before['queries'],
+            'queries_after': after['queries'],
+            'memory_before': before['peak_memory_kb'],
+            'memory_after': after['peak_memory_kb'],
+            'regressed': slower or after['queries'] > before['queries'],
+        })
+    return rows
+
+
+def results_document(results, runs, warmup):
+    """Machine-readable results, as written by run_benchmarks --output"""
+    return {
+        'schema': RESULTS_SCHEMA,
+        'created_at': timezone.now().isoformat(),
+        'runs': runs,
+        'warmup': warmup,
+        'environment': describe_environment(),
+        'results': results,
+    }
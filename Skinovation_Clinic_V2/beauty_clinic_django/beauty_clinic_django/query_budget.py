@@ -0,0 +1,162 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Queries a view may run before it is logged, unless QUERY_BUDGETS says otherwise
+DEFAULT_QUERY_BUDGET = 50
+
+# Seconds of database time a view may spend before it is logged
+DEFAULT_DB_TIME_BUDGET = 0.5
+
+
+class QueryRecorder:
+    """Database execute wrapper that counts queries and times them"""
+
+    def __init__(self, keep_sql=False):
+        self.count = 0
+        self.seconds = 0.0
+        self.keep_sql = keep_sql
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+            if self.keep_sql:
+                self.statements.append(sql)
+
+
+# Recorder of the async request being served; sync_to_async carries it to the view's thread
+_request_recorder = ContextVar('query_budget_recorder', default=None)
+
+
+def _record_for_request(execute, sql, params, many, context):
+    recorder = _request_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_request_recorder(sender, connection, **kwargs):
+    """Let async requests record queries run on any thread's connection"""
+    if _record_for_request not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_for_request)
+
+
+def budget_for(view_name):
+    """
+    Query budget for a view
+
+    Args:
+        view_name (str): Namespaced URL name, e.g. 'owner:patients'
+
+    Returns:
+        int: settings.QUERY_BUDGETS[view_name], else settings.QUERY_BUDGET_DEFAULT
+    """
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    return budgets.get(view_name, getattr(settings, 'QUERY_BUDGET_DEFAULT', DEFAULT_QUERY_BUDGET))
+
+
+class QueryBudgetMiddleware:
+    """
+    Record the queries and database time of every request
+
+    The figures are kept on request.query_stats and logged as a warning when a
+    view goes over its query budget or QUERY_BUDGET_DB_TIME. With DEBUG on they
+    are also sent in a Server-Timing header for the browser's network panel.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        return self.report(request, response, recorder)
+
+    async def __acall__(self, request):
+        # Under ASGI, views run their queries on other threads and connections
+        recorder = QueryRecorder()
+        token = _request_recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_recorder.reset(token)
+        return self.report(request, response, recorder)
+
+    def report(self, request, response, recorder):
+        """Store, log and send the request's query figures"""
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else request.path
+        budget = budget_for(view_name)
+        time_budget = getattr(settings, 'QUERY_BUDGET_DB_TIME', DEFAULT_DB_TIME_BUDGET)
+        request.query_stats = {
+            'view': view_name,
+            'queries': recorder.count,
+            'db_seconds': recorder.seconds,
+            'budget': budget,
+        }
+
+        if recorder.count > budget or recorder.seconds > time_budget:
+            logger.warning(
+                f"{view_name} ran {recorder.count} queries in {recorder.seconds * 1000:.1f} ms "
+                f"(budget {budget} queries, {time_budget * 1000:.0f} ms) for {request.method} {request.path}"
+            )
+        if settings.DEBUG:
+            response['Server-Timing'] = f'db;dur={recorder.seconds * 1000:.1f};desc="{recorder.count} queries"'
+        return response
+
+
+@contextmanager
+def query_budget(budget, label='block'):
+    """
+    Fail when the enclosed code runs more than `budget` queries
+
+    Works in pytest and unittest alike; the failure lists the statements run.
+
+        with query_budget(12, 'owner:patients'):
+            client.get(reverse('owner:patients'))
+
+    Yields:
+        QueryRecorder: The running counts
+    """
+    recorder = QueryRecorder(keep_sql=True)
+    with connection.execute_wrapper(recorder):
+        yield recorder
+    if recorder.count > budget:
+        statements = '\n'.join(f'  {index}. {sql}' for index, sql in enumerate(recorder.statements, start=1))
+        raise AssertionError(
+            f'{label} ran {recorder.count} queries, over its budget of {budget} '
+            f'({recorder.seconds * 1000:.1f} ms of database time):\n{statements}'
+        )
+
+
+def assert_view_within_budget(client, url, budget, method='get', label=None, **request_kwargs):
+    """
+    Request a URL with a test client and fail if the view goes over budget
+
+    Returns:
+        HttpResponse: The response, for further assertions
+    """
+    with query_budget(budget, label or url):
+        return getattr(client, method)(url, **request_kwargs)
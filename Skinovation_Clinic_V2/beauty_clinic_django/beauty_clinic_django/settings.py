@@ -63,6 +63,8 @@ MIDDLEWARE = [
     'allauth.account.middleware.AccountMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Logs views that run more queries than their budget
+    'beauty_clinic_django.query_budget.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'beauty_clinic_django.urls'
@@ -97,6 +99,42 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Use django.core.cache.backends.filebased.FileBasedCache for the analytics cache
+# when running several server processes, so invalidations reach every process.
+# The default cache holds the unread notification counters and feed versions;
+# with several processes, point it at a shared cache (Redis, memcached) so every
+# process sees each change at once. Per-process caches catch up within
+# appointments.notifications.UNREAD_TIMEOUT.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'analytics': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'analytics',
+    },
+}
+
+ANALYTICS_CACHE_ALIAS = 'analytics'  # Cache for owner dashboard analytics sections
+
+
+# Notification stream (appointments:notification_stream)
+# The local broker only reaches requests served by the same process; with several
+# ASGI workers, point this at a broker with the same methods over a shared channel.
+
+NOTIFICATION_BROKER = 'appointments.notification_broker.LocalNotificationBroker'
+
+
+# Query budgets (logged by beauty_clinic_django.query_budget.QueryBudgetMiddleware)
+
+QUERY_BUDGET_DEFAULT = 50  # Queries a view may run before it is logged
+QUERY_BUDGET_DB_TIME = 0.5  # Seconds of database time a view may spend before it is logged
+QUERY_BUDGETS = {}  # Per-view overrides, e.g. {'owner:patients': 20}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -190,6 +228,15 @@ IPROG_SMS_API_KEY = '401665c6fbdfa6d1908c3d7be49a30359e079565'  # Your actual AP
 # SMS Settings
 SMS_ENABLED = True  # Set to False to disable SMS notifications
 SMS_SENDER_ID = 'BEAUTY'  # Your preferred sender ID
+SMS_CONNECT_TIMEOUT = 5  # Seconds to open a connection to the SMS gateway
+SMS_READ_TIMEOUT = 15  # Seconds to wait for the gateway's response
+SMS_POOL_SIZE = 10  # Keep-alive connections shared by all threads
+
+# SMS Outbox (delivered by: python manage.py process_sms_outbox)
+SMS_OUTBOX_WORKERS = 4  # Messages sent in parallel by the worker
+SMS_OUTBOX_MAX_ATTEMPTS = 5  # Attempts before a message is marked failed
+SMS_OUTBOX_RETRY_DELAY = 30  # Seconds before the first retry; doubles on each attempt
+SMS_PROVIDER_RATE_LIMITS = {'iprog': 5}  # Messages per second per provider
 
 # Email Configuration for Password Reset - Using Mailtrap SMTP
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'  # SMTP backend for Mailtrap
@@ -0,0 +1,300 @@
+from datetime import date, time, timedelta
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.urls import URLPattern, get_resolver, reverse
+from accounts.models import Attendant, AttendantLeaveRequest, AttendantProfile, User
+from appointments.models import Appointment, CancellationRequest, ClosedDay, Notification
+from packages.models import Package
+from products.models import Product, ProductImage
+from services.models import Service, ServiceCategory, ServiceImage
+from .benchmarks import Benchmark, compare_results, measure, percentile
+from .query_budget import QueryRecorder, assert_view_within_budget, query_budget
+import tempfile
+
+# Maximum queries for a GET of every named URL, as the user allowed to open it,
+# against the fixtures below. Lower a budget when a view gets cheaper; raise one
+# only together with the change that needs it.
+URL_QUERY_BUDGETS = {
+    'appointments': {
+        'my_appointments': 8,
+        'book_service': 7,
+        'book_product': 6,
+        'book_package': 7,
+        'notifications': 7,
+        'request_cancellation': 8,
+        'request_reschedule': 8,
+        'submit_feedback': 5,
+        'patient_history': 7,
+        'handle_unavailable_attendant': 6,
+        'availability_week': 8,
+        'get_notifications_api': 6,
+        'update_notifications_api': 2,
+        'get_notifications_v2': 4,
+        'notification_stream': 3,
+        'admin_dashboard': 21,  # grows with the number of rows listed
+        'admin_maintenance': 9,
+        'admin_manage_services': 9,
+        'admin_manage_packages': 7,
+        'admin_manage_products': 7,
+        'admin_appointments': 19,  # grows with the number of rows listed
+        'admin_patients': 7,
+        'admin_notifications': 6,
+        'admin_settings': 9,
+        'admin_appointment_detail': 5,
+        'admin_reassign_attendant': 5,
+        'admin_mark_attendant_unavailable': 5,
+        'admin_confirm': 5,
+        'admin_complete': 10,
+        'admin_cancel': 13,
+        'admin_add_attendant': 4,
+        'admin_delete_attendant': 15,
+        'admin_create_attendant_user': 4,
+        'admin_edit_attendant_user': 6,
+        'admin_toggle_attendant_user': 6,
+        'admin_reset_attendant_password': 6,
+        'admin_manage_attendant_profile': 5,
+        'admin_delete_notification': 6,
+        'admin_manage_service_images': 10,
+        'admin_manage_product_images': 10,
+        'admin_delete_service_image': 7,
+        'admin_delete_product_image': 7,
+        'admin_set_primary_service_image': 8,
+        'admin_set_primary_product_image': 8,
+        'admin_view_patient': 9,
+        'admin_edit_patient': 9,
+        'admin_delete_patient': 34,
+        'admin_add_closed_day': 4,
+        'admin_delete_closed_day': 6,
+        'admin_cancellation_requests': 8,
+        'admin_approve_cancellation': 12,
+        'admin_reject_cancellation': 10,
+        'admin_inventory': 11,
+        'admin_update_stock': 5,
+        'admin_view_feedback': 6,
+        'admin_history_log': 6,
+        'admin_sms_test': 7,
+        'admin_send_test_sms': 4,
+    },
+    'owner': {
+        'dashboard': 51,
+        'patients': 8,
+        'appointments': 18,  # grows with the number of rows listed
+        'services': 7,
+        'packages': 4,
+        'products': 6,
+        'analytics': 5,
+        'manage_services': 9,
+        'manage_packages': 7,
+        'manage_products': 7,
+        'manage_patient_profiles': 6,
+        'history_log': 6,
+        'view_inventory': 7,
+        'manage_service_images': 10,
+        'manage_product_images': 10,
+        'delete_service_image': 7,
+        'delete_product_image': 7,
+        'set_primary_service_image': 8,
+        'set_primary_product_image': 8,
+        'sms_test': 7,
+        'send_test_sms': 4,
+        'manage_attendants': 8,
+        'create_attendant_user': 4,
+        'edit_attendant_user': 6,
+        'toggle_attendant_user': 6,
+        'reset_attendant_password': 5,
+        'manage_attendant_profile': 5,
+        'add_attendant': 4,
+        'delete_attendant': 15,
+        'list_leave_requests': 10,
+        'leave_request_detail': 8,
+        'approve_leave_request': 8,
+        'reject_leave_request': 8,
+    },
+    'attendant': {
+        'dashboard': 15,  # grows with the number of rows listed
+        'appointments': 16,  # grows with the number of rows listed
+        'appointment_detail': 12,
+        'confirm_appointment': 7,
+        'complete_appointment': 12,
+        'patient_profile': 10,
+        'notifications': 8,
+        'mark_notification_read': 6,
+        'history': 13,  # grows with the number of rows listed
+        'feedback': 7,
+        'schedule': 7,
+        'manage_profile': 5,
+        'request_leave': 6,
+        'view_leave_requests': 12,
+        'get_notifications_api': 4,
+        'update_notifications_api': 4,
+        'get_notifications_v2': 4,
+    },
+    'analytics': {
+        'dashboard': 14,
+        'patient_analytics': 7,
+        'service_analytics': 5,
+        'treatment_correlations': 5,
+        'business_insights': 34,
+    },
+}
+
+class QueryBudgetHelperTests(TestCase):
+    """query_budget fails blocks that run too many queries"""
+
+    def test_within_budget(self):
+        with query_budget(1) as recorder:
+            User.objects.count()
+        self.assertEqual(recorder.count, 1)
+
+    def test_over_budget_lists_the_queries(self):
+        with self.assertRaisesMessage(AssertionError, 'over its budget of 1'):
+            with query_budget(1):
+                User.objects.count()
+                User.objects.exists()
+
+    def test_recorder_times_queries(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            User.objects.count()
+        self.assertEqual(recorder.count, 1)
+        self.assertGreaterEqual(recorder.seconds, 0)
+
+
+class BenchmarkHelperTests(TestCase):
+    """Benchmark runs are rolled back and their results compare across commits"""
+
+    def test_percentile_interpolates(self):
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2.5)
+        self.assertEqual(percentile([5], 99), 5)
+
+    def test_measure_rolls_back_writes(self):
+        benchmark = Benchmark('create', 'test', lambda: User.objects.create_user('benchmark-write'))
+        result = measure(benchmark, runs=3, warmup=1)
+        self.assertFalse(User.objects.filter(username='benchmark-write').exists())
+        self.assertEqual(result['runs'], 3)
+        self.assertGreaterEqual(result['queries'], 1)
+        self.assertEqual(set(result['latency_ms']), {'p50', 'p90', 'p95', 'p99', 'min', 'max', 'mean'})
+
+    def test_compare_flags_slower_or_chattier_benchmarks(self):
+        def results(p50, queries):
+            return {'results': {'view': {'latency_ms': {'p50': p50}, 'queries': queries, 'peak_memory_kb': 1}}}
+
+        self.assertFalse(compare_results(results(100, 5), results(105, 5))[0]['regressed'])
+        self.assertTrue(compare_results(results(100, 5), results(150, 5))[0]['regressed'])
+        self.assertTrue(compare_results(results(100, 5), results(100, 6))[0]['regressed'])
+
+
+@override_settings(MEDIA_ROOT=tempfile.gettempdir())
+class URLQueryBudgetTests(TestCase):
+    """Every named URL in the main apps stays within its query budget"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {
+            user_type: User.objects.create_user(
+                f'budget-{user_type}', password='test-pass-123', user_type=user_type,
+                first_name=user_type.title(), last_name='Budget',
+            )
+            for user_type in ('patient', 'admin', 'owner', 'attendant')
+        }
+        patient = cls.users['patient']
+        attendant_user = cls.users['attendant']
+        category = ServiceCategory.objects.create(name='Facial')
+        service = Service.objects.create(service_name='Facial', duration=60, category=category, price=1000)
+        product = Product.objects.create(product_name='Toner', price=500, stock=10)
+        package = Package.objects.create(
+            package_name='Glow', price=5000, sessions=3, duration_days=90, grace_period_days=7
+        )
+        attendant = Attendant.objects.create(
+            first_name='Attendant', last_name='Budget', shift_date=date.today(), shift_time=time(9, 0)
+        )
+        profile = AttendantProfile.objects.create(user=attendant_user)
+        appointment = Appointment.objects.create(
+            patient=patient, attendant=attendant, service=service, status='confirmed',
+            appointment_date=date.today() + timedelta(days=3), appointment_time=time(10, 0),
+        )
+        # A few more patients and visits, so views that query per row show up
+        for number in range(3):
+            other = User.objects.create_user(
+                f'budget-patient-{number}', password='test-pass-123', user_type='patient',
+                first_name='Patient', last_name=str(number),
+            )
+            Appointment.objects.create(
+                patient=other, attendant=attendant, service=service, status='completed',
+                appointment_date=date.today() - timedelta(days=number + 1), appointment_time=time(11, 0),
+            )
+        Attendant.objects.create(
+            first_name='Second', last_name='Budget', shift_date=date.today(), shift_time=time(9, 0)
+        )
+        notification = Notification.objects.create(
+            type='appointment', title='Booked', message='Booked', patient=patient, appointment_id=appointment.pk
+        )
+        cancellation = CancellationRequest.objects.create(
+            appointment_id=appointment.pk, appointment_type='regular', patient=patient
+        )
+        closed_day = ClosedDay.objects.create(date=date.today() + timedelta(days=30))
+        leave_request = AttendantLeaveRequest.objects.create(
+            attendant_profile=profile, leave_date=date.today() + timedelta(days=10), reason='Budget test'
+        )
+        service_image = ServiceImage.objects.create(service=service, image='services/images/budget-test.jpg')
+        product_image = ProductImage.objects.create(product=product, image='products/images/budget-test.jpg')
+
+        cls.url_kwargs = {
+            'service_id': service.pk,
+            'product_id': product.pk,
+            'package_id': package.pk,
+            'appointment_id': appointment.pk,
+            'notification_id': notification.pk,
+            'request_id': cancellation.pk,
+            'closed_day_id': closed_day.pk,
+            'attendant_id': attendant.pk,
+            'leave_request_id': leave_request.pk,
+            'patient_id': patient.pk,
+            'user_id': attendant_user.pk,
+        }
+        cls.image_ids = {'service': service_image.pk, 'product': product_image.pk}
+
+    def setUp(self):
+        caches['analytics'].clear()
+
+    def user_for(self, namespace, name):
+        if namespace == 'appointments':
+            return self.users['admin' if name.startswith('admin_') else 'patient']
+        if namespace == 'attendant':
+            return self.users['attendant']
+        return self.users['owner']
+
+    def url_for(self, namespace, pattern):
+        kwargs = {}
+        for argument in pattern.pattern.converters:
+            if argument == 'image_id':
+                kwargs[argument] = self.image_ids['product' if 'product' in pattern.name else 'service']
+            else:
+                kwargs[argument] = self.url_kwargs[argument]
+        return reverse(f'{namespace}:{pattern.name}', kwargs=kwargs)
+
+    def named_patterns(self, namespace):
+        resolver = get_resolver().namespace_dict[namespace][1]
+        return [pattern for pattern in resolver.url_patterns if isinstance(pattern, URLPattern) and pattern.name]
+
+    def test_every_named_url_has_a_budget(self):
+        for namespace, budgets in URL_QUERY_BUDGETS.items():
+            names = {pattern.name for pattern in self.named_patterns(namespace)}
+            self.assertEqual(sorted(names - set(budgets)), [], f'{namespace} URLs without a query budget')
+            self.assertEqual(sorted(set(budgets) - names), [], f'{namespace} budgets for unknown URLs')
+
+    def test_views_stay_within_budget(self):
+        for namespace, budgets in URL_QUERY_BUDGETS.items():
+            for pattern in self.named_patterns(namespace):
+                name = pattern.name
+                with self.subTest(url=f'{namespace}:{name}'):
+                    self.client.force_login(self.user_for(namespace, name))
+                    # Some views change data even on GET; keep every request independent
+                    with transaction.atomic():
+                        response = assert_view_within_budget(
+                            self.client, self.url_for(namespace, pattern), budgets.get(name, 0),
+                            label=f'{namespace}:{name}',
+                        )
+                        transaction.set_rollback(True)
+                    self.assertLess(response.status_code, 500)
@@ -8,17 +8,16 @@ from django.core.paginator import Paginator
 from datetime import datetime, timedelta
 from accounts.models import User
 from appointments.models import Appointment
+from appointments.notifications import notify_owners, unread_count
 from services.models import Service, ServiceImage, ServiceCategory, HistoryLog
 from products.models import Product, ProductImage
 from packages.models import Package
 from analytics.models import PatientAnalytics, ServiceAnalytics, BusinessAnalytics, TreatmentCorrelation, PatientSegment
+from analytics.patient_stats import patient_stats_page
 
 
 def log_history(item_type, item_name, action, performed_by, details='', related_id=None):
     """Helper function to log history and notify owner"""
-    from appointments.models import Notification
-    from accounts.models import User
-    
     # Create history log
     HistoryLog.objects.create(
         type=item_type,
@@ -30,14 +29,11 @@ def log_history(item_type, item_name, action, performed_by, details='', related_
     )
     
     # Notify owner when staff performs actions
-    owner_users = User.objects.filter(user_type='owner', is_active=True)
-    for owner in owner_users:
-        Notification.objects.create(
-            type='system',
-            title=f'{action}: {item_type} - {item_name}',
-            message=f'{performed_by} {action.lower()} {item_type.lower()} "{item_name}". {details}',
-            patient=None  # Owner notification
-        )
+    notify_owners(
+        type='system',
+        title=f'{action}: {item_type} - {item_name}',
+        message=f'{performed_by} {action.lower()} {item_type.lower()} "{item_name}". {details}',
+    )
 
 
 def is_owner(user):
@@ -49,9 +45,11 @@ def is_owner(user):
 @user_passes_test(is_owner)
 def owner_dashboard(request):
     """Owner comprehensive dashboard with advanced analytics"""
-    from analytics.services import AnalyticsService
+    from analytics.cache import CachedAnalyticsService
     
-    analytics_service = AnalyticsService()
+    # Sections are cached separately and invalidated when their data changes;
+    # each one is loaded at most once per request
+    analytics_service = CachedAnalyticsService.for_request(request)
     
     # Get comprehensive analytics data
     business_overview = analytics_service.get_business_overview()
@@ -63,11 +61,7 @@ def owner_dashboard(request):
     diagnostic_metrics = analytics_service.get_diagnostic_metrics()
     
     # Get notification count
-    from appointments.models import Notification
-    notification_count = Notification.objects.filter(
-        patient=request.user,
-        is_read=False
-    ).count()
+    notification_count = unread_count(request.user)
     
     context = {
         'business_overview': business_overview,
@@ -87,38 +81,16 @@ def owner_dashboard(request):
 @user_passes_test(is_owner)
 def owner_patients(request):
     """Owner patients overview"""
-    # Get all patients with analytics
-    patients = User.objects.filter(user_type='patient').prefetch_related('analytics', 'segments')
-    
-    # Calculate analytics for each patient
-    patient_analytics_list = []
-    for patient in patients:
-        appointments = Appointment.objects.filter(patient=patient)
-        analytics_data = {
-            'patient': patient,
-            'total_appointments': appointments.count(),
-            'completed_appointments': appointments.filter(status='completed').count(),
-            'cancelled_appointments': appointments.filter(status='cancelled').count(),
-            'total_spent': sum([app.service.price for app in appointments.filter(status='completed') if app.service]),
-            'last_visit': appointments.filter(status='completed').order_by('-appointment_date').first(),
-            'segment': patient.segments.first().segment if patient.segments.exists() else 'unclassified',
-        }
-        patient_analytics_list.append(analytics_data)
-    
-    # Sort by total spent
-    patient_analytics_list.sort(key=lambda x: x['total_spent'], reverse=True)
+    # One annotated query for the page of patients, sorted by ?sort= (highest spend first)
+    context = patient_stats_page(request)
     
     # Get notification count
-    from appointments.models import Notification
-    notification_count = Notification.objects.filter(
-        patient=request.user,
-        is_read=False
-    ).count()
+    notification_count = unread_count(request.user)
     
-    context = {
-        'patient_analytics': patient_analytics_list,
+    context.update({
+        'patient_analytics': context['page_obj'],
         'notification_count': notification_count,
-    }
+    })
     
     return render(request, 'owner/patients.html', context)
 
@@ -185,9 +157,8 @@ def owner_services(request):
 def owner_packages(request):
     """Owner packages overview"""
     packages = Package.objects.filter(archived=False).annotate(
-        total_bookings=Count('package_bookings'),
-        total_revenue=Sum('package_bookings__price'),
-        avg_rating=Avg('package_bookings__feedback__rating', filter=Q(package_bookings__feedback__isnull=False))
+        total_bookings=Count('bookings'),
+        total_revenue=Sum('bookings__package__price')
     ).order_by('-total_revenue')
     
     # Add pagination
@@ -224,9 +195,11 @@ def owner_products(request):
 @user_passes_test(is_owner)
 def owner_analytics(request):
     """Owner comprehensive analytics dashboard"""
-    from analytics.services import AnalyticsService
+    from analytics.cache import CachedAnalyticsService
     
-    analytics_service = AnalyticsService()
+    # Sections are cached separately and invalidated when their data changes;
+    # each one is loaded at most once per request
+    analytics_service = CachedAnalyticsService.for_request(request)
     
     # Get comprehensive analytics data
     business_overview = analytics_service.get_business_overview()
@@ -812,8 +785,12 @@ def owner_toggle_attendant_user(request, user_id):
 @user_passes_test(is_owner)
 def owner_reset_attendant_password(request, user_id):
     """Reset attendant account password and provide a temporary one (owner version)"""
+    import secrets
+    import string
+    
     user = get_object_or_404(User, id=user_id, user_type='attendant')
-    temp_password = User.objects.make_random_password(length=10)
+    chars = string.ascii_letters + string.digits
+    temp_password = ''.join(secrets.choice(chars) for _ in range(10))
     user.set_password(temp_password)
     user.save()
     
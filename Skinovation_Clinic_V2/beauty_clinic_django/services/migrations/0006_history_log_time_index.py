@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('services', '0005_remove_serviceimage_archived_alter_service_image_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historylog',
+            index=models.Index(fields=['-datetime'], name='history_log_time_idx'),
+        ),
+    ]
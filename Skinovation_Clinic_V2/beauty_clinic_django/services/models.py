@@ -77,4 +77,7 @@ class HistoryLog(models.Model):
 
     class Meta:
         db_table = 'history_log'
-        ordering = ['-datetime']
\ No newline at end of file
+        ordering = ['-datetime']
+        indexes = [
+            models.Index(fields=['-datetime'], name='history_log_time_idx'),
+        ]
\ No newline at end of file
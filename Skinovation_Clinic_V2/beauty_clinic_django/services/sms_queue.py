@@ -0,0 +1,207 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER = 'iprog'
+
+# Retry delays grow as RETRY_BASE_DELAY * 2 ** (attempt - 1), capped at RETRY_MAX_DELAY
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 60 * 60
+
+# Messages claimed by a worker that died are handed out again after this long
+CLAIM_TIMEOUT = 60 * 5
+
+
+def get_provider(name):
+    """
+    Get the SMS client for a provider name
+
+    Args:
+        name (str): Provider name stored on the outbox row
+
+    Returns:
+        object: Client with a send_sms(phone, message, sender_id) method
+    """
+    if name == DEFAULT_PROVIDER:
+        from .sms_service import sms_service
+        return sms_service
+    raise ValueError(f"Unknown SMS provider: {name}")
+
+
+def enqueue_sms(phone, message, user=None, template=None, provider=DEFAULT_PROVIDER):
+    """
+    Store an SMS in the outbox so the request does not wait on the gateway
+
+    Args:
+        phone (str): Recipient's phone number
+        message (str): SMS message content
+        user (User): User recorded as the sender in SMS history
+        template (SMSTemplate): Template the message was rendered from
+        provider (str): Provider that should deliver the message
+
+    Returns:
+        dict: Queueing result
+    """
+    if not getattr(settings, 'SMS_ENABLED', True):
+        logger.info("SMS notifications are disabled")
+        return {
+            'success': False,
+            'message': 'SMS notifications are disabled'
+        }
+
+    from appointments.models import SMSOutbox
+    entry = SMSOutbox.objects.create(
+        provider=provider,
+        phone_number=phone,
+        message=message,
+        sender=user,
+        template_used=template,
+        max_attempts=getattr(settings, 'SMS_OUTBOX_MAX_ATTEMPTS', 5),
+    )
+    logger.info(f"SMS to {phone} queued as outbox #{entry.pk}")
+    return {
+        'success': True,
+        'queued': True,
+        'outbox_id': entry.pk,
+        'message': 'SMS queued for delivery'
+    }
+
+
+def claim_batch(limit):
+    """
+    Claim due outbox messages for this worker
+
+    A single UPDATE marks the rows as sending, so concurrent workers never
+    pick up the same message.
+
+    Args:
+        limit (int): Maximum number of messages to claim
+
+    Returns:
+        list: Claimed SMSOutbox objects
+    """
+    from appointments.models import SMSOutbox
+
+    now = timezone.now()
+    due = (
+        Q(status='queued', next_attempt_at__lte=now)
+        | Q(status='sending', claimed_at__lt=now - timedelta(seconds=CLAIM_TIMEOUT))
+    )
+    ids = list(SMSOutbox.objects.filter(due).order_by('next_attempt_at').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    SMSOutbox.objects.filter(due, pk__in=ids).update(status='sending', claim_token=token, claimed_at=now)
+    return list(SMSOutbox.objects.filter(claim_token=token).select_related('sender', 'template_used'))
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next delivery attempt"""
+    base = getattr(settings, 'SMS_OUTBOX_RETRY_DELAY', RETRY_BASE_DELAY)
+    return min(base * 2 ** max(attempts - 1, 0), RETRY_MAX_DELAY)
+
+
+class ProviderThrottle:
+    """
+    Thread-safe per-provider rate limiter
+
+    Rates come from settings.SMS_PROVIDER_RATE_LIMITS as messages per second.
+    Providers without a configured rate are not throttled.
+    """
+
+    def __init__(self, rates=None):
+        if rates is None:
+            rates = getattr(settings, 'SMS_PROVIDER_RATE_LIMITS', {})
+        self.rates = rates
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, provider):
+        """Block until the provider may receive another message"""
+        rate = self.rates.get(provider)
+        if not rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(provider, now))
+            self.next_slot[provider] = slot + 1.0 / rate
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def deliver(entry, throttle):
+    """
+    Send one claimed outbox message and record the outcome
+
+    Successful and permanently failed messages are written to SMS history when
+    the message has a sender. Other failures are rescheduled with backoff.
+
+    Args:
+        entry (SMSOutbox): Claimed outbox message
+        throttle (ProviderThrottle): Shared rate limiter
+
+    Returns:
+        str: Resulting status ('sent', 'queued' or 'failed')
+    """
+    throttle.wait(entry.provider)
+    sender_id = getattr(settings, 'SMS_SENDER_ID', 'BEAUTY')
+    try:
+        result = get_provider(entry.provider).send_sms(entry.phone_number, entry.message, sender_id)
+        permanent = False
+        if not result:
+            # e.g. a non-200 status the client did not turn into an error
+            result = {'success': False, 'error': 'No response from SMS provider'}
+    except ValueError as e:
+        # Invalid phone numbers and unknown providers never succeed on retry
+        result = {'success': False, 'error': str(e)}
+        permanent = True
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+        permanent = False
+
+    entry.attempts += 1
+    entry.claim_token = None
+    entry.claimed_at = None
+    if result.get('success'):
+        entry.status = 'sent'
+        entry.sent_at = timezone.now()
+        entry.last_error = None
+        logger.info(f"SMS sent successfully to {entry.phone_number}")
+    elif permanent or entry.attempts >= entry.max_attempts:
+        entry.status = 'failed'
+        entry.last_error = result.get('error', 'Unknown error')
+        logger.error(f"Giving up on SMS to {entry.phone_number}: {entry.last_error}")
+    else:
+        entry.status = 'queued'
+        entry.last_error = result.get('error', 'Unknown error')
+        entry.next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(entry.attempts))
+        logger.warning(
+            f"SMS to {entry.phone_number} failed (attempt {entry.attempts}/{entry.max_attempts}), "
+            f"retrying at {entry.next_attempt_at}: {entry.last_error}"
+        )
+
+    if entry.status in ('sent', 'failed') and entry.sender_id:
+        from appointments.models import SMSHistory
+        entry.history = SMSHistory.objects.create(
+            sender_id=entry.sender_id,
+            phone_number=entry.phone_number,
+            message=entry.message,
+            template_used=entry.template_used,
+            status=entry.status,
+            message_id=result.get('message_id'),
+            api_response=result,
+        )
+
+    entry.save(update_fields=[
+        'status', 'attempts', 'next_attempt_at', 'claim_token', 'claimed_at',
+        'last_error', 'history', 'sent_at',
+    ])
+    return entry.status
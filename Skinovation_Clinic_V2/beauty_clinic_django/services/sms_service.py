@@ -1,12 +1,21 @@
 import requests
 import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
 
 class IPROGSMSService:
     """
     IPROG SMS API Service for sending SMS notifications
     Documentation: https://sms.iprogtech.com/
+
+    Requests go through a shared keep-alive connection pool, so repeated sends
+    skip the TCP and TLS handshake. The service is safe to share across threads.
     """
     
     def __init__(self):
@@ -15,6 +24,34 @@ class IPROGSMSService:
         
         if not self.api_key:
             raise ImproperlyConfigured("IPROG_SMS_API_KEY not found in settings")
+        
+        # (connect, read) timeouts: fail fast on an unreachable gateway
+        self.timeout = (
+            getattr(settings, 'SMS_CONNECT_TIMEOUT', 5),
+            getattr(settings, 'SMS_READ_TIMEOUT', 15),
+        )
+        self.pool_size = getattr(settings, 'SMS_POOL_SIZE', 10)
+        
+        # The adapter's urllib3 pool is thread-safe and shared by every thread;
+        # each thread gets its own Session on top of it
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True)
+        self._local = threading.local()
+    
+    @property
+    def session(self):
+        """Session for the current thread, backed by the shared connection pool"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.headers.update({'Content-Type': 'application/json'})
+            session.mount('https://', self._adapter)
+            session.mount('http://', self._adapter)
+            self._local.session = session
+        return session
+    
+    def close(self):
+        """Close pooled connections"""
+        self._adapter.close()
     
     def send_sms(self, phone, message, sender_id="BEAUTY"):
         """
@@ -33,9 +70,6 @@ class IPROGSMSService:
         
         # Prepare API request using the correct IPROG SMS API format
         url = f"{self.base_url}/api/v1/sms_messages"
-        headers = {
-            'Content-Type': 'application/json'
-        }
         
         payload = {
             'api_token': self.api_key,
@@ -44,20 +78,13 @@ class IPROGSMSService:
         }
         
         try:
-            # Debug logging
-            print(f"SMS API Debug - URL: {url}")
-            print(f"SMS API Debug - Headers: {headers}")
-            print(f"SMS API Debug - Payload: {payload}")
-            
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
-            print(f"SMS API Debug - Response Status: {response.status_code}")
-            print(f"SMS API Debug - Response Text: {response.text}")
+            response = self.session.post(url, json=payload, timeout=self.timeout)
+            logger.debug(f"SMS API response to {formatted_number}: {response.status_code} {response.text}")
             
             # Check if response is successful
             if response.status_code == 200:
                 try:
                     response_data = response.json()
-                    print(f"SMS API Debug - Response Data: {response_data}")
                     
                     # Check if the API response indicates success
                     if response_data.get('status') == 200:
@@ -80,22 +107,59 @@ class IPROGSMSService:
                     }
             else:
                 response.raise_for_status()
+                # 201, 202 and redirects pass raise_for_status() but are not the API's answer
+                return {
+                    'success': False,
+                    'error': f'Unexpected response status {response.status_code}',
+                    'message': f'Failed to send SMS: unexpected response status {response.status_code}'
+                }
                 
         except requests.exceptions.RequestException as e:
-            print(f"SMS API Debug - Request Exception: {str(e)}")
+            logger.warning(f"SMS API request to {formatted_number} failed: {str(e)}")
             return {
                 'success': False,
                 'error': str(e),
                 'message': f'Failed to send SMS: {str(e)}'
             }
         except Exception as e:
-            print(f"SMS API Debug - General Exception: {str(e)}")
+            logger.error(f"Unexpected SMS API error for {formatted_number}: {str(e)}")
             return {
                 'success': False,
                 'error': str(e),
                 'message': f'Unexpected error occurred: {str(e)}'
             }
     
+    def send_many(self, messages, sender_id="BEAUTY", max_workers=None):
+        """
+        Send several SMS over the pooled connections
+        
+        Args:
+            messages (list): (phone, message) tuples or dicts with 'phone' and 'message'
+            sender_id (str): Sender ID (default: BEAUTY)
+            max_workers (int): Parallel requests, at most the pool size (default: pool size)
+        
+        Returns:
+            list: API response for each message, in the same order. Invalid phone
+                numbers give a failed result instead of stopping the batch.
+        """
+        def send_one(item):
+            phone, message = (item['phone'], item['message']) if isinstance(item, dict) else item
+            try:
+                return self.send_sms(phone, message, sender_id)
+            except ValueError as e:
+                return {
+                    'success': False,
+                    'error': str(e),
+                    'message': f'Failed to send SMS: {str(e)}'
+                }
+        
+        messages = list(messages)
+        workers = min(max_workers or self.pool_size, self.pool_size, len(messages))
+        if workers <= 1:
+            return [send_one(item) for item in messages]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(send_one, messages))
+    
     def _format_phone(self, phone):
         """
         Format phone number for IPROG SMS API
@@ -169,11 +233,10 @@ class IPROGSMSService:
                 'message': 'API Test'
             }
             
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/api/v1/sms_messages",
-                headers={'Content-Type': 'application/json'},
                 json=test_payload,
-                timeout=10
+                timeout=self.timeout
             )
             
             print(f"API Test - Status: {response.status_code}")
@@ -216,6 +216,38 @@ class SMSTemplateService:
         from .sms_service import sms_service
         return sms_service.send_sms(package_booking.patient.phone, message)
     
+    def build_appointment_message(self, appointment, template_type, previous_attendant=None, reason="", template_name=None, template=None):
+        """
+        Render an appointment template without sending it
+
+        Args:
+            appointment: Appointment object
+            template_type (str): Type of template (confirmation, reminder, cancellation, attendant_reassignment)
+            previous_attendant: Previous attendant object for reassignment messages
+            reason (str): Cancellation reason
+            template_name (str): Optional specific template name
+            template (SMSTemplate): Already loaded template, to skip the lookup when rendering many messages
+
+        Returns:
+            tuple: (SMSTemplate, rendered message), or (None, None) if no template exists
+        """
+        if template is None:
+            template = self.get_template(template_type, template_name)
+        if not template:
+            logger.error(f"No {template_type} template found")
+            return None, None
+
+        context = self._prepare_appointment_context(appointment)
+        if template_type == 'cancellation':
+            context['cancellation_reason'] = reason
+        elif template_type == 'attendant_reassignment':
+            if previous_attendant:
+                context['previous_attendant_name'] = f"{previous_attendant.first_name} {previous_attendant.last_name}".strip()
+            else:
+                context['previous_attendant_name'] = 'our previous staff'
+
+        return template, self.render_template(template, context)
+
     def send_custom_message(self, phone, template_name, context=None):
         """
         Send custom message using a custom template
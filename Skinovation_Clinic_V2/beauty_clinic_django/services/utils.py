@@ -1,5 +1,6 @@
 from django.conf import settings
 from .sms_service import sms_service
+from .sms_queue import enqueue_sms
 import logging
 
 logger = logging.getLogger(__name__)
@@ -76,7 +77,7 @@ def send_appointment_sms(appointment, sms_type='confirmation', **kwargs):
         sms_type (str): Type of SMS ('confirmation', 'reminder', 'cancellation', 'reassignment')
     
     Returns:
-        dict: SMS sending result
+        dict: Queueing result; the message is delivered by the SMS outbox worker
     """
     if not appointment.patient.phone:
         return {
@@ -84,28 +85,35 @@ def send_appointment_sms(appointment, sms_type='confirmation', **kwargs):
             'message': 'Patient phone number not available'
         }
     
+    template_types = {
+        'confirmation': 'confirmation',
+        'reminder': 'reminder',
+        'cancellation': 'cancellation',
+        'reassignment': 'attendant_reassignment',
+        'attendant_reassignment': 'attendant_reassignment',
+    }
+    if sms_type not in template_types:
+        return {
+            'success': False,
+            'message': f'Unknown SMS type: {sms_type}'
+        }
+    
     try:
-        if sms_type == 'confirmation':
-            result = sms_service.send_appointment_confirmation(appointment)
-        elif sms_type == 'reminder':
-            result = sms_service.send_appointment_reminder(appointment)
-        elif sms_type == 'cancellation':
-            result = sms_service.send_cancellation_notification(appointment)
-        elif sms_type in ['reassignment', 'attendant_reassignment']:
-            result = sms_service.send_attendant_reassignment(
-                appointment,
-                previous_attendant=kwargs.get('previous_attendant')
-            )
-        else:
-            return {
-                'success': False,
-                'message': f'Unknown SMS type: {sms_type}'
-            }
+        from .template_service import template_service
+        template, message = template_service.build_appointment_message(
+            appointment,
+            template_types[sms_type],
+            previous_attendant=kwargs.get('previous_attendant'),
+            reason=kwargs.get('reason', ''),
+        )
+        if not template:
+            return {'success': False, 'error': f'No {template_types[sms_type]} template found'}
         
-        return result
+        # Delivery happens in the process_sms_outbox worker
+        return enqueue_sms(appointment.patient.phone, message, template=template)
         
     except Exception as e:
-        logger.error(f"Error sending appointment SMS: {str(e)}")
+        logger.error(f"Error queueing appointment SMS: {str(e)}")
         return {
             'success': False,
             'error': str(e),
@@ -148,7 +156,7 @@ def send_attendant_assignment_sms(appointment):
         appointment: Appointment object
     
     Returns:
-        dict: SMS sending result
+        dict: Queueing result; the message is delivered by the SMS outbox worker
     """
     try:
         # Get attendant user
@@ -186,8 +194,7 @@ def send_attendant_assignment_sms(appointment):
             f"Please check your attendant portal for details."
         )
         
-        result = send_sms_notification(profile.phone, message, user=attendant_user)
-        return result
+        return enqueue_sms(profile.phone, message)
         
     except Exception as e:
         logger.error(f"Error sending attendant assignment SMS: {str(e)}")
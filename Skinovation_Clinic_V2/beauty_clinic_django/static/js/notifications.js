@@ -40,17 +40,18 @@ function formatNotification(notification) {
     const messagePreview = notification.message.length > 100 
         ? notification.message.substring(0, 100) + '...' 
         : notification.message;
+    const createdAt = new Date(notification.created_at).toLocaleString([], {dateStyle: 'medium', timeStyle: 'short'});
     return `
-        <div class="notification-item p-3 border-bottom ${isRead}" data-id="${notification.notification_id}" style="cursor: pointer;" onclick="showNotificationDetails(${notification.notification_id})">
+        <div class="notification-item p-3 border-bottom ${isRead}" data-id="${notification.id}" style="cursor: pointer;" onclick="showNotificationDetails(${notification.id})">
             <div class="d-flex justify-content-between align-items-start mb-2">
                 <div class="flex-grow-1">
                     <strong class="d-block mb-1">${notification.title}</strong>
-                    <small class="text-muted">${notification.created_at_formatted}</small>
+                    <small class="text-muted">${createdAt}</small>
                 </div>
             </div>
             <p class="mb-2 text-muted small">${messagePreview}</p>
             ${!notification.is_read ? `
-                <button class="btn btn-sm btn-link mark-read-btn p-0 mt-1" data-id="${notification.notification_id}" onclick="event.stopPropagation(); markAsRead(${notification.notification_id});">
+                <button class="btn btn-sm btn-link mark-read-btn p-0 mt-1" data-id="${notification.id}" onclick="event.stopPropagation(); markAsRead(${notification.id});">
                     Mark as Read
                 </button>
             ` : ''}
@@ -65,15 +66,47 @@ function showNotificationDetails(notificationId) {
     console.log('Notification details for:', notificationId);
 }
 
+// Notifications shown in the dropdown, newest first, and the v2 sync cursor they are current to
+const shownLimit = 10;
+let shownNotifications = [];
+let syncCursor = null;
+
+// Function to render the shown notifications
+function renderNotifications() {
+    const notificationsList = document.querySelector('.notifications-list, .admin-notifications-list');
+    if (!notificationsList) {
+        return;
+    }
+    if (shownNotifications.length === 0) {
+        notificationsList.innerHTML = '<div class="p-3 text-center text-muted">No notifications</div>';
+        return;
+    }
+    notificationsList.innerHTML = shownNotifications.map(formatNotification).join('');
+
+    // Add click handlers for mark as read buttons
+    notificationsList.querySelectorAll('.mark-read-btn').forEach(btn => {
+        btn.addEventListener('click', function(e) {
+            e.preventDefault();
+            markAsRead(this.dataset.id);
+        });
+    });
+}
+
+// Function to merge changed notifications into the shown ones
+function mergeNotifications(changed) {
+    const byId = new Map(shownNotifications.map(notification => [notification.id, notification]));
+    changed.forEach(notification => byId.set(notification.id, notification));
+    shownNotifications = Array.from(byId.values()).sort((a, b) => b.id - a.id).slice(0, shownLimit);
+}
+
 // Function to fetch and update notifications
 function fetchNotifications() {
-    // Determine the correct API endpoint based on current page
-    let apiUrl = '/notifications/get_notifications.php';  // Global endpoint
+    // Determine the correct API endpoint based on current page; the v2 API
+    // answers 304 while nothing changed, which the browser serves from its cache
+    let apiUrl = '/appointments/notifications/v2/';
     
     if (window.location.pathname.includes('/attendant/')) {
-        apiUrl = basePath + 'api/notifications/';
-    } else if (window.location.pathname.includes('/appointments/')) {
-        apiUrl = basePath + 'appointments/notifications/get_notifications.php';
+        apiUrl = '/attendant/api/v2/notifications/';
     }
     
     // Skip notification fetching if we're on login pages or password reset pages
@@ -82,33 +115,36 @@ function fetchNotifications() {
         window.location.pathname.includes('/register/')) {
         return;
     }
+
+    // The first call loads the newest notifications; later ones pass the cursor
+    // and get only the notifications created, read or unread since
+    if (syncCursor !== null) {
+        apiUrl += `?cursor=${encodeURIComponent(syncCursor)}`;
+    }
     
     fetch(apiUrl)
         .then(response => {
+            if (response.status === 401) {
+                return null;  // Not logged in
+            }
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
             return response.json();
         })
         .then(data => {
-            if (data.success) {
+            if (data && data.success) {
                 updateNotificationCount(data.unread_count);
-                
-                const notificationsList = document.querySelector('.notifications-list, .admin-notifications-list');
-                if (notificationsList) {
-                    if (data.notifications.length === 0) {
-                        notificationsList.innerHTML = '<div class="p-3 text-center text-muted">No notifications</div>';
-                    } else {
-                        notificationsList.innerHTML = data.notifications.map(formatNotification).join('');
-                        
-                        // Add click handlers for mark as read buttons
-                        notificationsList.querySelectorAll('.mark-read-btn').forEach(btn => {
-                            btn.addEventListener('click', function(e) {
-                                e.preventDefault();
-                                markAsRead(this.dataset.id);
-                            });
-                        });
-                    }
+
+                const firstSync = syncCursor === null;
+                if (firstSync) {
+                    shownNotifications = data.notifications.slice(0, shownLimit);
+                } else if (data.notifications.length > 0) {
+                    mergeNotifications(data.notifications);
+                }
+                syncCursor = data.cursor;
+                if (firstSync || data.notifications.length > 0) {
+                    renderNotifications();
                 }
             }
         })
@@ -185,6 +221,47 @@ function markAllAsRead() {
     .catch(error => console.error('Error marking all notifications as read:', error));
 }
 
+// Long-poll the notification stream; it answers only when something changed
+const streamUrl = '/appointments/notifications/stream/';
+let streamCursor = null;
+let streamUnread = null;
+
+function watchNotifications() {
+    const params = new URLSearchParams();
+    if (streamCursor !== null) {
+        params.set('cursor', streamCursor);
+        params.set('unread', streamUnread);
+    }
+
+    fetch(`${streamUrl}?${params}`)
+        .then(response => {
+            if (response.status === 401) {
+                return null;  // Not logged in, nothing to watch
+            }
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            if (!data || !data.success) {
+                return;
+            }
+            const changed = streamCursor !== null &&
+                (data.notifications.length > 0 || data.unread_count !== streamUnread);
+            streamCursor = data.cursor;
+            streamUnread = data.unread_count;
+            if (changed) {
+                fetchNotifications();  // Syncs only what changed since the last cursor
+            }
+            watchNotifications();
+        })
+        .catch(error => {
+            console.error('Notification stream interrupted, retrying:', error);
+            setTimeout(watchNotifications, 30000);
+        });
+}
+
 // Helper function to get CSRF token
 function getCookie(name) {
     let cookieValue = null;
@@ -206,8 +283,12 @@ document.addEventListener('DOMContentLoaded', function() {
     // Initial fetch
     fetchNotifications();
     
-    // Set up periodic updates
-    setInterval(fetchNotifications, 30000); // Check every 30 seconds
+    // Refresh when the stream reports a change instead of polling
+    if (!window.location.pathname.includes('/login/') &&
+        !window.location.pathname.includes('/password-reset/') &&
+        !window.location.pathname.includes('/register/')) {
+        watchNotifications();
+    }
     
     // Add click handler for mark all as read button
     const markAllReadBtn = document.querySelector('.mark-all-read');